@@ -0,0 +1,512 @@
+import	collections
+import	multiprocessing
+import	numpy as np
+import	photutils
+from	scipy import sparse
+import	stat_tools
+
+# Aperture stencils
+# Overlap weights are cached for STENCIL_CACHE_SIZE (radius, sub-pixel offset, method) combinations.
+# Sub-pixel offsets are quantised to 1/STENCIL_PHASES pixel.
+
+STENCIL_CACHE_SIZE			= 512
+STENCIL_PHASES				= 20
+
+stencil_cache				= collections.OrderedDict()
+
+# Float32 compute mode (FLOAT32=True)
+# Pixel data stay in single precision and aperture sums are accumulated in float64 (see float64_sum).
+# Accuracy bound with respect to the float64 path: |sum32 - sum64| <= FLOAT32_TOLERANCE * sum(|weight x pixel|),
+# where the sum runs over the aperture or annulus (profile_sums: over the disc within the outer radius of the annulus)
+
+FLOAT32_TOLERANCE			= 4 * 2.**-24
+
+def cutouts(IMAGE, POSITIONS, HALFSIZE, FILL_VALUE=np.nan, DTYPE=None):
+
+	"""
+	Extracts square cutouts (2 x HALFSIZE + 1 pixels) around one or more positions.
+	The cutouts are centred on the pixel that contains each position. Pixels outside the image are set to FILL_VALUE.
+	DTYPE: data type of the cutouts (default: data type of the image)
+	Output: cutouts (N x size x size), offsets of the positions from the central pixels (x and y)
+	"""
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+	image_shape				= np.shape(IMAGE)
+
+	x_pix					= np.floor(positions[:, 0] + 0.5).astype(int)
+	y_pix					= np.floor(positions[:, 1] + 0.5).astype(int)
+
+	offsets					= np.arange(-HALFSIZE, HALFSIZE + 1)
+
+	rows					= y_pix[:, None] + offsets
+	cols					= x_pix[:, None] + offsets
+
+	mask_rows				= (rows >= 0) & (rows < image_shape[0])
+	mask_cols				= (cols >= 0) & (cols < image_shape[1])
+
+	data					= IMAGE[np.clip(rows, 0, image_shape[0] - 1)[:, :, None], np.clip(cols, 0, image_shape[1] - 1)[:, None, :]]
+	data					= np.where(mask_rows[:, :, None] & mask_cols[:, None, :], data, FILL_VALUE)
+
+	if DTYPE				!= None:
+		data				= data.astype(DTYPE, copy=False)
+
+	return data, positions[:, 0] - x_pix, positions[:, 1] - y_pix
+
+def radius_grid(HALFSIZE, DX, DY, SUBPIXELS=1):
+
+	"""
+	Squared distance of each pixel centre in a cutout from the source position (one grid per position).
+	If SUBPIXELS > 1, each pixel is split into SUBPIXELS x SUBPIXELS subpixels.
+	"""
+
+	offsets					= np.arange(-HALFSIZE, HALFSIZE + 1)
+
+	if SUBPIXELS			> 1:
+		offsets				= (offsets[:, None] + (np.arange(SUBPIXELS) + 0.5) / SUBPIXELS - 0.5).flatten()
+
+	dx						= offsets[None, None, :] - np.atleast_1d(DX)[:, None, None]
+	dy						= offsets[None, :, None] - np.atleast_1d(DY)[:, None, None]
+
+	return dx**2 + dy**2
+
+def float64_sum(A, CUMULATIVE=False):
+
+	"""
+	Sum along the last axis of a 2D array, accumulated in float64 and returned in the data type of the array.
+	The rounding error of a float32 array is that of the final rounding: |error| <= eps |sum| + O(n 2**-53) sum(|a|),
+	with eps = 2**-24 (pairwise or sequential float32 sums: O(log n eps) or O(n eps) sum(|a|)).
+	CUMULATIVE: return the cumulative sums instead of the totals
+	"""
+
+	if CUMULATIVE:
+		return np.cumsum(A, axis=-1, dtype=np.float64).astype(A.dtype)
+
+	return np.sum(A, axis=-1, dtype=np.float64).astype(A.dtype)
+
+def annulus_stats(IMAGE, POSITIONS, INNERANNULUS, OUTERANNULUS, CHUNK=1000, MAXITERS=5, SIGMA=3, FLOAT32=False):
+
+	"""
+	Sigma-clipped statistics of the local background for every position and every annulus in one pass.
+	Pixels belong to an annulus if their centres lie in INNERANNULUS <= r < OUTERANNULUS (photutils method='center').
+	Pixels outside the image are ignored.
+	FLOAT32: compute the statistics in single precision
+	Output: mean, median, std (each N_positions x N_annuli)
+	"""
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+	innerannulus			= np.atleast_1d(INNERANNULUS)
+	outerannulus			= np.atleast_1d(OUTERANNULUS)
+
+	halfsize				= int(np.ceil(np.max(outerannulus))) + 1
+
+	stats_mean				= np.zeros((len(positions), len(innerannulus)))
+	stats_median			= np.zeros((len(positions), len(innerannulus)))
+	stats_std				= np.zeros((len(positions), len(innerannulus)))
+
+	# Maximum number of pixels of every annulus for any sub-pixel position (the offset from the central pixel is < 1 pixel).
+	# The annuli are padded to this length, so the statistics of a position do not depend on the other positions.
+
+	grid2					= radius_grid(halfsize, 0, 0)[0].ravel()
+	length					= [max(np.sum((grid2 >= max(innerannulus[i] - 1, 0)**2) & (grid2 < (outerannulus[i] + 1)**2)), 1) for i in range(len(innerannulus))]
+
+	# Process the positions in chunks to limit the memory footprint
+
+	for start in range(0, len(positions), CHUNK):
+
+		data, dx, dy		= cutouts(IMAGE, positions[start:start+CHUNK], halfsize, DTYPE=np.float32 if FLOAT32 else np.float64)
+		radius2				= radius_grid(halfsize, dx, dy)
+
+		data				= data.reshape(len(data), -1)
+		radius2				= radius2.reshape(len(radius2), -1)
+
+		# Sort the pixels by distance: the pixels of an annulus are then a contiguous run of every row
+
+		order				= np.argsort(radius2, axis=1, kind='stable')
+		radius2				= np.take_along_axis(radius2, order, axis=1)
+		data				= np.take_along_axis(data, order, axis=1)
+
+		for i in range(len(innerannulus)):
+
+			first			= np.sum(radius2 < innerannulus[i]**2, axis=1)
+			last			= np.sum(radius2 < outerannulus[i]**2, axis=1)
+
+			index			= first[:, None] + np.arange(length[i])
+			values			= np.where(index < last[:, None], np.take_along_axis(data, np.minimum(index, data.shape[1] - 1), axis=1), np.nan)
+
+			mean, median, std	= stat_tools.sigma_clipped_stats_axis(values, AXIS=1, MAXITERS=MAXITERS, SIGMA=SIGMA)
+
+			stats_mean[start:start+CHUNK, i]	= mean
+			stats_median[start:start+CHUNK, i]	= median
+			stats_std[start:start+CHUNK, i]		= std
+
+	return stats_mean, stats_median, stats_std
+
+def profile_sums(IMAGE, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, CHUNK=250, SUBPIXELS=1, FLOAT32=False):
+
+	"""
+	Aperture and annulus sums of concentric apertures from one cumulative radial profile per position.
+	The pixels of each cutout are sorted by their distance from the source. The sum within any radius is
+	then read off the cumulative sum of the sorted pixels (photutils method='center' for SUBPIXELS=1,
+	method='subpixel' otherwise). Pixels outside the image count as zero. An aperture or annulus
+	that contains a NaN pixel returns NaN.
+	FLOAT32: single-precision pixel data and float64-accumulated cumulative sums (see FLOAT32_TOLERANCE)
+	Output: source sums, annulus sums (each N_positions x N_radii)
+	"""
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+	radii					= np.atleast_1d(RADII)
+	innerannulus			= np.atleast_1d(INNERANNULUS)
+	outerannulus			= np.atleast_1d(OUTERANNULUS)
+
+	dtype					= np.float32 if FLOAT32 else np.float64
+
+	halfsize				= int(np.ceil(max(np.max(radii), np.max(outerannulus)))) + 1
+
+	# Query the profile at all radii at once: source apertures, inner and outer annulus radii
+
+	radii_query				= np.hstack([radii, innerannulus, outerannulus])**2
+
+	src_sums				= np.zeros((len(positions), len(radii)))
+	bkg_sums				= np.zeros((len(positions), len(radii)))
+
+	for start in range(0, len(positions), CHUNK):
+
+		data, dx, dy		= cutouts(IMAGE, positions[start:start+CHUNK], halfsize, FILL_VALUE=0, DTYPE=dtype)
+		radius2				= radius_grid(halfsize, dx, dy, SUBPIXELS=SUBPIXELS)
+
+		if SUBPIXELS		> 1:
+			data			= np.repeat(np.repeat(data, SUBPIXELS, axis=1), SUBPIXELS, axis=2) / dtype(SUBPIXELS**2)
+
+		data				= data.reshape(len(data), -1)
+		radius2				= radius2.reshape(len(radius2), -1)
+
+		# Sort by distance and build the cumulative profiles (flux and number of NaN pixels)
+
+		order				= np.argsort(radius2, axis=1, kind='stable')
+		radius2				= np.take_along_axis(radius2, order, axis=1)
+		data				= np.take_along_axis(data, order, axis=1)
+
+		mask_nan			= np.isnan(data)
+
+		profile				= np.zeros((len(data), data.shape[1] + 1), dtype=dtype)
+
+		if FLOAT32:
+			profile[:, 1:]	= float64_sum(np.where(mask_nan, 0, data), CUMULATIVE=True)
+		else:
+			profile[:, 1:]	= np.cumsum(np.where(mask_nan, 0, data), axis=1)
+
+		profile_nan			= np.zeros((len(data), data.shape[1] + 1), dtype=int)
+		profile_nan[:, 1:]	= np.cumsum(mask_nan, axis=1)
+
+		# Number of pixels with r < R for every query radius
+
+		index				= np.array([np.searchsorted(x, radii_query, side='left') for x in radius2])
+
+		flux				= np.take_along_axis(profile, index, axis=1)
+		flux_nan			= np.take_along_axis(profile_nan, index, axis=1)
+
+		flux_src			= flux[:, :len(radii)]
+		flux_bkg			= flux[:, 2*len(radii):] - flux[:, len(radii):2*len(radii)]
+
+		nan_src				= flux_nan[:, :len(radii)] > 0
+		nan_bkg				= (flux_nan[:, 2*len(radii):] - flux_nan[:, len(radii):2*len(radii)]) > 0
+
+		src_sums[start:start+CHUNK]	= np.where(nan_src, np.nan, flux_src)
+		bkg_sums[start:start+CHUNK]	= np.where(nan_bkg, np.nan, flux_bkg)
+
+	return src_sums, bkg_sums
+
+def stencil(RADIUS, DX=0, DY=0, INNERRADIUS=0, METHOD='exact', SUBPIXELS=5):
+
+	"""
+	Overlap weights of a circular aperture (or of an annulus if INNERRADIUS > 0) with the pixel grid of a cutout.
+	The aperture is offset by DX, DY from the central pixel. Offsets are quantised to 1/STENCIL_PHASES pixel.
+	Stencils are kept in an LRU cache keyed by (radius, quantised offset, method).
+	Output: weights (2 x halfsize + 1 pixels on a side, halfsize = ceil(RADIUS) + 1)
+	"""
+
+	phase_x					= int(np.round(DX * STENCIL_PHASES))
+	phase_y					= int(np.round(DY * STENCIL_PHASES))
+
+	key						= (np.round(RADIUS, 6), np.round(INNERRADIUS, 6), phase_x, phase_y, METHOD, SUBPIXELS if METHOD == 'subpixel' else 1)
+
+	if key in stencil_cache:
+		stencil_cache.move_to_end(key)
+		return stencil_cache[key]
+
+	halfsize				= int(np.ceil(RADIUS)) + 1
+	centre					= (halfsize + phase_x / float(STENCIL_PHASES), halfsize + phase_y / float(STENCIL_PHASES))
+
+	if INNERRADIUS			> 0:
+		aperture			= photutils.CircularAnnulus(centre, r_in=INNERRADIUS, r_out=RADIUS)
+	else:
+		aperture			= photutils.CircularAperture(centre, r=RADIUS)
+
+	mask					= aperture.to_mask(method=METHOD, subpixels=SUBPIXELS)
+	mask					= mask[0] if isinstance(mask, list) else mask
+
+	weights					= mask.to_image((2*halfsize + 1, 2*halfsize + 1))
+	weights.setflags(write=False)
+
+	stencil_cache[key]		= weights
+
+	while len(stencil_cache) > STENCIL_CACHE_SIZE:
+		stencil_cache.popitem(last=False)
+
+	return weights
+
+def stencil_sums(IMAGE, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, METHOD='exact', SUBPIXELS=5, FLOAT32=False):
+
+	"""
+	Aperture and annulus sums from cached stencils: one lookup per radius and sub-pixel offset and a dot product per source.
+	Pixels outside the image count as zero. An aperture or annulus that contains a NaN pixel returns NaN.
+	FLOAT32: single-precision pixel data and weights and float64-accumulated sums (see FLOAT32_TOLERANCE)
+	OUTERANNULUS: None for the aperture sums only (the annulus sums are then None)
+	Output: source sums, annulus sums (each N_positions x N_radii)
+	"""
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+	radii					= np.atleast_1d(RADII)
+
+	dtype					= np.float32 if FLOAT32 else np.float64
+
+	src_sums				= np.zeros((len(positions), len(radii)))
+	bkg_sums				= np.zeros((len(positions), len(radii))) if OUTERANNULUS is not None else None
+
+	# Group the positions by their quantised sub-pixel offset
+
+	x_pix					= np.floor(positions[:, 0] + 0.5)
+	y_pix					= np.floor(positions[:, 1] + 0.5)
+
+	phases					= np.round(np.array([positions[:, 0] - x_pix, positions[:, 1] - y_pix]).T * STENCIL_PHASES).astype(int)
+	phases_unique, phases_idx	= np.unique(phases, axis=0, return_inverse=True)
+	phases_idx				= np.ravel(phases_idx)
+
+	for i in range(len(radii)):
+
+		apertures			= [(src_sums, radii[i], 0)]
+
+		if OUTERANNULUS is not None:
+			apertures		+= [(bkg_sums, np.atleast_1d(OUTERANNULUS)[i], np.atleast_1d(INNERANNULUS)[i])]
+
+		for sums, radius, innerradius in apertures:
+
+			halfsize		= int(np.ceil(radius)) + 1
+			data, dx, dy	= cutouts(IMAGE, positions, halfsize, FILL_VALUE=0, DTYPE=dtype)
+
+			mask_nan		= np.isnan(data)
+			data			= np.where(mask_nan, 0, data)
+
+			for j in range(len(phases_unique)):
+
+				weights		= stencil(radius, phases_unique[j][0] / float(STENCIL_PHASES), phases_unique[j][1] / float(STENCIL_PHASES),
+										INNERRADIUS=innerradius, METHOD=METHOD, SUBPIXELS=SUBPIXELS)
+
+				mask_phase	= phases_idx == j
+
+				# Row-wise sum: the result of a source does not depend on the other sources in the group
+
+				if FLOAT32:
+					flux	= float64_sum((data[mask_phase] * weights.astype(dtype)).reshape(np.sum(mask_phase), -1))
+				else:
+					flux	= np.sum(data[mask_phase] * weights, axis=(1, 2))
+				flux_nan	= np.tensordot(mask_nan[mask_phase], weights > 0, axes=2)
+
+				sums[mask_phase, i]	= np.where(flux_nan > 0, np.nan, flux)
+
+	return src_sums, bkg_sums
+
+def variance_sums(NOISE_MAP, POSITIONS, RADII, NOISE='err', METHOD='exact', SUBPIXELS=5):
+
+	"""
+	Sums of the per-pixel variance in circular apertures (stencils, see stencil_sums), from an error map (NOISE='err':
+	variance = err**2) or an inverse-variance weight map (NOISE='wht': variance = 1 / wht; pixels with wht <= 0 are NaN).
+	The noise map (e.g. a memory-mapped FITS extension) is only read in cutouts around the positions.
+	Pixels outside the image have zero variance (as in the aperture sums).
+	Output: variance sums (N_positions x N_radii)
+	"""
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+	radii					= np.atleast_1d(RADII)
+
+	halfsize				= int(np.ceil(np.max(radii))) + 1
+	data, dx, dy			= cutouts(NOISE_MAP, positions, halfsize, FILL_VALUE=np.inf if NOISE == 'wht' else 0, DTYPE=np.float64)
+
+	if NOISE				== 'wht':
+		with np.errstate(divide='ignore', invalid='ignore'):
+			variance		= np.where(data > 0, 1. / data, np.nan)
+	else:
+		variance			= data**2
+
+	sums					= np.zeros((len(positions), len(radii)))
+
+	for i in range(len(positions)):
+		sums[i]				= stencil_sums(variance[i], [halfsize + dx[i], halfsize + dy[i]], radii, None, None, METHOD=METHOD, SUBPIXELS=SUBPIXELS)[0][0]
+
+	return sums
+
+def aperture_matrix(SHAPE, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, METHOD='exact', SUBPIXELS=5):
+
+	"""
+	Sparse weight matrix of all source apertures and annuli on a pixel grid of a given SHAPE (ny, nx).
+	Rows: source apertures (radius 0 of all positions, radius 1 of all positions, ...) followed by the annuli in the same order.
+	Columns: flattened image pixels. Weights are taken from the cached stencils (see stencil).
+	Output: scipy.sparse.csr_matrix (2 x N_radii x N_positions, ny x nx)
+	"""
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+	radii					= np.atleast_1d(RADII)
+	innerannulus			= np.atleast_1d(INNERANNULUS)
+	outerannulus			= np.atleast_1d(OUTERANNULUS)
+
+	x_pix					= np.floor(positions[:, 0] + 0.5).astype(int)
+	y_pix					= np.floor(positions[:, 1] + 0.5).astype(int)
+
+	phases					= np.round(np.array([positions[:, 0] - x_pix, positions[:, 1] - y_pix]).T * STENCIL_PHASES).astype(int)
+	phases_unique, phases_idx	= np.unique(phases, axis=0, return_inverse=True)
+	phases_idx				= np.ravel(phases_idx)
+
+	apertures				= [(radius, 0) for radius in radii] + [(outerannulus[i], innerannulus[i]) for i in range(len(radii))]
+
+	matrix_rows				= []
+	matrix_cols				= []
+	matrix_data				= []
+
+	for k in range(len(apertures)):
+
+		radius, innerradius	= apertures[k]
+		halfsize			= int(np.ceil(radius)) + 1
+
+		for j in range(len(phases_unique)):
+
+			weights			= stencil(radius, phases_unique[j][0] / float(STENCIL_PHASES), phases_unique[j][1] / float(STENCIL_PHASES),
+									INNERRADIUS=innerradius, METHOD=METHOD, SUBPIXELS=SUBPIXELS)
+
+			stencil_y, stencil_x	= np.nonzero(weights)
+
+			sources			= np.where(phases_idx == j)[0]
+
+			y				= y_pix[sources, None] + stencil_y - halfsize
+			x				= x_pix[sources, None] + stencil_x - halfsize
+
+			mask_good		= (y >= 0) & (y < SHAPE[0]) & (x >= 0) & (x < SHAPE[1])
+
+			matrix_rows.append(np.broadcast_to(k * len(positions) + sources[:, None], y.shape)[mask_good])
+			matrix_cols.append((y * SHAPE[1] + x)[mask_good])
+			matrix_data.append(np.broadcast_to(weights[stencil_y, stencil_x], y.shape)[mask_good])
+
+	return sparse.csr_matrix((np.hstack(matrix_data), (np.hstack(matrix_rows), np.hstack(matrix_cols))),
+							shape=(len(apertures) * len(positions), SHAPE[0] * SHAPE[1]))
+
+def matrix_sums(MATRIX, IMAGES, NRADII):
+
+	"""
+	Aperture and annulus sums of one image (ny x nx) or of a stack of images (N_images x ny x nx) on the pixel grid of an aperture matrix.
+	One sparse matrix-vector (or sparse x dense) product per call.
+	Output: source sums, annulus sums (each N_positions x N_radii, or N_images x N_positions x N_radii for a stack)
+	"""
+
+	images					= np.asarray(IMAGES)
+	stack					= images.ndim == 3
+
+	pixels					= images.reshape(len(images), -1).T if stack else images.ravel()
+
+	sums					= MATRIX.dot(pixels)
+	sums					= sums.reshape(2, NRADII, -1, *sums.shape[1:])
+
+	# (source/annulus, radius, position[, image]) -> ([image,] position, radius)
+
+	if stack:
+		sums				= sums.transpose(0, 3, 2, 1)
+	else:
+		sums				= sums.transpose(0, 2, 1)
+
+	return sums[0], sums[1]
+
+def matrix_stats(MATRIX, IMAGES, NRADII):
+
+	"""
+	Weighted mean and standard deviation of the annulus pixels of one image (ny x nx) or of a stack of images (N_images x ny x nx)
+	on the pixel grid of an aperture matrix. The weighted sums of the pixels and of the squared pixels (in float64) are computed with
+	one sparse product each, instead of cutouts of every image and annulus as in annulus_stats. Unlike annulus_stats, the
+	statistics are not sigma-clipped (sources in an annulus increase the RMS) and pixels are weighted by their overlap with the annulus.
+	Output: mean, std (each N_positions x N_radii, or N_images x N_positions x N_radii for a stack)
+	"""
+
+	images					= np.asarray(IMAGES)
+	stack					= images.ndim == 3
+
+	pixels					= images.reshape(len(images), -1).T if stack else images.ravel()
+
+	annuli					= MATRIX[MATRIX.shape[0] // 2:]
+	weights					= np.asarray(annuli.sum(axis=1)).ravel()
+
+	if stack:
+		weights				= weights[:, None]
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		mean				= annuli.dot(pixels.astype(np.float64)) / weights
+		variance			= annuli.dot(np.square(pixels, dtype=np.float64)) / weights - mean**2
+
+	std						= np.sqrt(np.maximum(variance, 0))
+
+	# (radius, position[, image]) -> ([image,] position, radius)
+
+	mean					= mean.reshape(NRADII, -1, *mean.shape[1:])
+	std						= std.reshape(NRADII, -1, *std.shape[1:])
+
+	if stack:
+		return mean.transpose(2, 1, 0), std.transpose(2, 1, 0)
+
+	return mean.T, std.T
+
+def tiles(SHAPE, POSITIONS, TILESIZE, HALO):
+
+	"""
+	Buckets positions by image tile (TILESIZE x TILESIZE pixels). Only tiles that contain positions are returned.
+	Each tile is padded by HALO pixels (clipped at the image borders).
+	Output: list of (y slice, x slice, indices of the positions in the tile)
+	"""
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+
+	tile_x					= np.floor(positions[:, 0] / TILESIZE).astype(int)
+	tile_y					= np.floor(positions[:, 1] / TILESIZE).astype(int)
+
+	output					= []
+
+	for tile in np.unique(np.array([tile_y, tile_x]).T, axis=0):
+
+		indices				= np.where((tile_y == tile[0]) & (tile_x == tile[1]))[0]
+
+		ymin				= min(max(tile[0] * TILESIZE - HALO, 0), SHAPE[0])
+		ymax				= max(min((tile[0] + 1) * TILESIZE + HALO, SHAPE[0]), 0)
+		xmin				= min(max(tile[1] * TILESIZE - HALO, 0), SHAPE[1])
+		xmax				= max(min((tile[1] + 1) * TILESIZE + HALO, SHAPE[1]), 0)
+
+		output.append((slice(ymin, ymax), slice(xmin, xmax), indices))
+
+	return output
+
+def shared_array(ARRAY):
+
+	"""
+	Copies a numpy array into shared memory (multiprocessing.RawArray), e.g. to give the workers of a process pool
+	read access to an image without pickling it for every task.
+	Output: (shared buffer, shape, dtype), see shared_view
+	"""
+
+	array					= np.asarray(ARRAY)
+
+	buffer					= multiprocessing.RawArray('b', max(array.nbytes, 1))
+	np.copyto(shared_view(buffer, array.shape, array.dtype), array)
+
+	return buffer, array.shape, array.dtype
+
+def shared_view(BUFFER, SHAPE, DTYPE):
+
+	"""
+	Numpy view of a shared buffer from shared_array (no copy)
+	"""
+
+	return np.frombuffer(BUFFER, dtype=DTYPE, count=int(np.prod(SHAPE))).reshape(SHAPE)
@@ -0,0 +1,186 @@
+import	aperture_tools
+import	fits_tools
+import	multiprocessing
+import	numpy as np
+from	scipy import interpolate, ndimage
+import	stat_tools
+
+def mesh_stats(IMAGE, BACK_SIZE=64, SIGMA=3, MAXITERS=5, DTYPE=None):
+
+	"""
+	Background and RMS of every mesh (BACK_SIZE x BACK_SIZE pixels) of an image, one row of meshes at a time.
+	Each mesh is sigma-clipped (median +- SIGMA x std). The background is estimated as in SExtractor:
+	2.5 x median - 1.5 x mean, or the median if the mesh is crowded (|mean - median| / std > 0.3).
+	Meshes without valid pixels are NaN. DTYPE: precision of the statistics (default: image precision, at least float32).
+	Output: background and RMS of the meshes (each N_mesh_y x N_mesh_x)
+	"""
+
+	image_shape				= np.shape(IMAGE)
+
+	num_y					= int(np.ceil(image_shape[0] / float(BACK_SIZE)))
+	num_x					= int(np.ceil(image_shape[1] / float(BACK_SIZE)))
+
+	bkg_mesh				= np.zeros((num_y, num_x))
+	rms_mesh				= np.zeros((num_y, num_x))
+
+	for i in range(num_y):
+		bkg_mesh[i], rms_mesh[i]	= mesh_row(IMAGE, i, BACK_SIZE=BACK_SIZE, SIGMA=SIGMA, MAXITERS=MAXITERS, DTYPE=DTYPE)
+
+	return bkg_mesh, rms_mesh
+
+def mesh_row(IMAGE, ROW, BACK_SIZE=64, SIGMA=3, MAXITERS=5, DTYPE=None):
+
+	"""
+	Background and RMS of the meshes in one row of meshes (see mesh_stats). Only the BACK_SIZE rows of the mesh row
+	are read from IMAGE (e.g. a memory-mapped image).
+	"""
+
+	image_shape				= np.shape(IMAGE)
+	num_x					= int(np.ceil(image_shape[1] / float(BACK_SIZE)))
+
+	# Pad the row to a multiple of the mesh size (NaN) and arrange it as N_mesh_x x BACK_SIZE**2
+
+	dtype					= np.result_type(IMAGE.dtype, np.float32) if DTYPE == None else DTYPE
+	data					= np.full((BACK_SIZE, num_x * BACK_SIZE), np.nan, dtype=dtype)
+
+	rows					= np.asarray(IMAGE[ROW * BACK_SIZE:(ROW + 1) * BACK_SIZE])
+	data[:len(rows), :image_shape[1]]	= rows
+
+	data					= data.reshape(BACK_SIZE, num_x, BACK_SIZE).transpose(1, 0, 2).reshape(num_x, -1)
+
+	mean, median, std		= stat_tools.sigma_clipped_stats_axis(data, AXIS=1, MAXITERS=MAXITERS, SIGMA=SIGMA)
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		bkg					= np.where(np.abs(mean - median) / std > 0.3, median, 2.5 * median - 1.5 * mean)
+
+	return bkg, std
+
+def mesh_filter(MESH, FILTERSIZE=3):
+
+	"""
+	Fills empty (NaN) meshes with the nearest valid mesh and median-filters the mesh grid (FILTERSIZE x FILTERSIZE meshes)
+	"""
+
+	mesh					= np.array(MESH, dtype=float)
+	mask_nan				= np.isnan(mesh)
+
+	if mask_nan.all():
+		return mesh
+
+	if mask_nan.any():
+		indices				= ndimage.distance_transform_edt(mask_nan, return_distances=False, return_indices=True)
+		mesh				= mesh[tuple(indices)]
+
+	if FILTERSIZE			> 1:
+		mesh				= ndimage.median_filter(mesh, size=FILTERSIZE, mode='nearest')
+
+	return mesh
+
+def mesh_map(MESH, SHAPE, BACK_SIZE=64, DTYPE=np.float32):
+
+	"""
+	Interpolates a mesh grid to a full-resolution map (bicubic spline through the mesh centres, as in SExtractor).
+	The map is evaluated BACK_SIZE rows at a time.
+	"""
+
+	mesh					= np.atleast_2d(MESH)
+	output					= np.empty(SHAPE, dtype=DTYPE)
+
+	if mesh.size			== 1:
+		output[:]			= mesh[0, 0]
+		return output
+
+	# Mesh centres (the last mesh of a row or column may be truncated)
+
+	centres_y				= (np.arange(mesh.shape[0]) * BACK_SIZE + np.minimum(np.arange(1, mesh.shape[0] + 1) * BACK_SIZE, SHAPE[0]) - 1) / 2.
+	centres_x				= (np.arange(mesh.shape[1]) * BACK_SIZE + np.minimum(np.arange(1, mesh.shape[1] + 1) * BACK_SIZE, SHAPE[1]) - 1) / 2.
+
+	# A single row or column of meshes is interpolated along the other axis only
+
+	if mesh.shape[0]		== 1:
+		centres_y			= np.array([-1., 1.]) + centres_y[0]
+		mesh				= np.vstack([mesh, mesh])
+	if mesh.shape[1]		== 1:
+		centres_x			= np.array([-1., 1.]) + centres_x[0]
+		mesh				= np.hstack([mesh, mesh])
+
+	spline					= interpolate.RectBivariateSpline(centres_y, centres_x, mesh, kx=min(3, mesh.shape[0] - 1), ky=min(3, mesh.shape[1] - 1))
+
+	x						= np.arange(SHAPE[1])
+
+	for start in range(0, SHAPE[0], BACK_SIZE):
+		y					= np.arange(start, min(start + BACK_SIZE, SHAPE[0]))
+		output[start:start + len(y)]	= spline(y, x)
+
+	return output
+
+def mesh_background(IMAGE, BACK_SIZE=64, FILTERSIZE=3, SIGMA=3, MAXITERS=5, WORKERS=1, MAPS=True, DTYPE=None):
+
+	"""
+	Mesh-based background and RMS estimator (similar to SExtractor BACK_SIZE/BACK_FILTERSIZE).
+	IMAGE: image array or fits_tools.FitsImage. The image is processed one row of meshes at a time. With a process pool
+	of WORKERS processes, the rows are distributed over the pool: for a FitsImage, every worker opens the file
+	(memory-mapped) and reads only its own rows of meshes; an image array is copied once to shared memory.
+	DTYPE: precision of the mesh statistics (e.g. np.float32; default: image precision)
+	Output: global RMS (median RMS of the meshes), background map and RMS map (None if MAPS=False)
+	"""
+
+	image					= IMAGE.data if isinstance(IMAGE, fits_tools.FitsImage) else IMAGE
+
+	image_shape				= np.shape(image)
+	num_y					= int(np.ceil(image_shape[0] / float(BACK_SIZE)))
+
+	if WORKERS				== None or WORKERS > 1:
+
+		if isinstance(IMAGE, fits_tools.FitsImage):
+			initargs		= (None, IMAGE.filename, IMAGE.extension_key)
+		else:
+			initargs		= (aperture_tools.shared_array(image), None, None)
+
+		pool				= multiprocessing.Pool(WORKERS, initializer=mesh_background_init, initargs=initargs)
+
+		try:
+			output			= pool.map(mesh_background_row, [(i, BACK_SIZE, SIGMA, MAXITERS, DTYPE) for i in range(num_y)])
+		finally:
+			pool.close()
+			pool.join()
+
+		bkg_mesh			= np.array([x[0] for x in output])
+		rms_mesh			= np.array([x[1] for x in output])
+
+	else:
+		bkg_mesh, rms_mesh	= mesh_stats(image, BACK_SIZE=BACK_SIZE, SIGMA=SIGMA, MAXITERS=MAXITERS, DTYPE=DTYPE)
+
+	bkg_mesh				= mesh_filter(bkg_mesh, FILTERSIZE=FILTERSIZE)
+	rms_mesh				= mesh_filter(rms_mesh, FILTERSIZE=FILTERSIZE)
+
+	rms						= np.nanmedian(rms_mesh)
+
+	if not MAPS:
+		return rms, None, None
+
+	return rms, mesh_map(bkg_mesh, image_shape, BACK_SIZE=BACK_SIZE), mesh_map(rms_mesh, image_shape, BACK_SIZE=BACK_SIZE)
+
+def mesh_background_init(SHARED_IMAGE, FITS, EXTENSION):
+
+	"""
+	Initialises a worker of mesh_background: memory-mapped science array of FITS (EXTENSION, see fits_tools.FitsImage)
+	or, without FITS, numpy view of the shared image
+	"""
+
+	global mesh_image
+
+	if FITS					!= None:
+		mesh_image			= fits_tools.FitsImage(FITS, EXTENSION=EXTENSION).data
+	else:
+		mesh_image			= aperture_tools.shared_view(*SHARED_IMAGE)
+
+def mesh_background_row(TASK):
+
+	"""
+	Statistics of one row of meshes in a worker of mesh_background
+	"""
+
+	row, back_size, sigma, maxiters, dtype	= TASK
+
+	return mesh_row(mesh_image, row, BACK_SIZE=back_size, SIGMA=sigma, MAXITERS=maxiters, DTYPE=dtype)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import 	argparse
+import 	numpy as np
+import	phot_routines
+
+parser				= argparse.ArgumentParser(description='Precompute the HST aperture corrections (encircled energy relative to 4\'\') for photometry_hst.py')
+
+parser.add_argument('--obsmode',
+					type = str,
+					nargs = '+',
+					help = 'Observation modes without aperture, e.g. wfc3,uvis2,f814w acs,wfc1,f625w (PHOTMODE keyword in the header)',
+					required = True)
+
+parser.add_argument('--mjd-bins',
+					type = float,
+					nargs = '+',
+					help = 'Bin edges (MJD) for time-dependent throughputs. Default: None (no time dependence)',
+					default = None)
+
+parser.add_argument('--step',
+					type = float,
+					help = 'Step of the diameter grid in arcsec. Default: 0.01',
+					default = 0.01)
+
+parser.add_argument('--outfile',
+					type = str,
+					help = 'Output table (rows are added to an existing table). Default: hst_apcorr.fits in the directory of phot_routines.py',
+					default = phot_routines.APCORR_TABLE)
+
+args				= parser.parse_args()
+
+diameters			= np.round(np.arange(1, int(round(4. / args.step)) + 1) * args.step, 2)
+
+apcorr_table		= phot_routines.hst_apcorr_table(args.obsmode, FILENAME=args.outfile, MJD_BINS=args.mjd_bins, DIAMETERS=diameters)
+
+print('{num} observation modes in {filename}'.format(num=len(apcorr_table), filename=args.outfile))
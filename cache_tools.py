@@ -0,0 +1,112 @@
+import	hashlib
+import	numpy as np
+import	os
+import	tempfile
+
+# Persistent cache
+# Entries are numpy .npz files named after their key. Writes are atomic (temporary file + rename), so several
+# processes can share a cache directory. The least recently used entries are evicted above CACHE_SIZE bytes.
+
+CACHE_SIZE			= 2 * 1024**3
+CACHE_CHUNK			= 64 * 1024**2
+
+def content_hash(ARRAY):
+
+	"""
+	Fast content hash (BLAKE2b) of a numpy array (e.g. a memory-mapped FITS extension), read in chunks of CACHE_CHUNK bytes.
+	Shape and data type are part of the hash.
+	"""
+
+	array			= np.asarray(ARRAY)
+
+	digest			= hashlib.blake2b(digest_size=16)
+	digest.update('{shape}{dtype}'.format(shape=array.shape, dtype=array.dtype.str).encode())
+
+	if array.ndim	== 0:
+		digest.update(array.tobytes())
+		return digest.hexdigest()
+
+	rows			= max(1, CACHE_CHUNK // max(array[0].nbytes, 1))
+
+	for start in range(0, len(array), rows):
+		digest.update(np.ascontiguousarray(array[start:start+rows]).data)
+
+	return digest.hexdigest()
+
+def cache_key(*PARTS):
+
+	"""
+	Cache key from one or more hashes or parameters (anything with a stable repr)
+	"""
+
+	return hashlib.blake2b(repr(PARTS).encode(), digest_size=16).hexdigest()
+
+def cache_load(CACHE_DIR, KEY):
+
+	"""
+	Loads a cache entry. Marks the entry as recently used.
+	Output: dictionary of arrays (None if the entry does not exist)
+	"""
+
+	filename		= os.path.join(CACHE_DIR, KEY + '.npz')
+
+	try:
+		with np.load(filename, allow_pickle=False) as data:
+			entry	= {key: data[key] for key in data.files}
+		os.utime(filename, None)
+	except (IOError, OSError, ValueError):
+		return None
+
+	return entry
+
+def cache_save(CACHE_DIR, KEY, CACHE_SIZE=CACHE_SIZE, **ARRAYS):
+
+	"""
+	Saves a cache entry (atomic write) and evicts the least recently used entries above CACHE_SIZE bytes
+	"""
+
+	if not os.path.exists(CACHE_DIR):
+		os.makedirs(CACHE_DIR, exist_ok=True)
+
+	fd, filename_temp	= tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			np.savez(f, **ARRAYS)
+		os.replace(filename_temp, os.path.join(CACHE_DIR, KEY + '.npz'))
+	except:
+		if os.path.exists(filename_temp):
+			os.remove(filename_temp)
+		raise
+
+	cache_evict(CACHE_DIR, CACHE_SIZE=CACHE_SIZE)
+
+def cache_evict(CACHE_DIR, CACHE_SIZE=CACHE_SIZE):
+
+	"""
+	Removes the least recently used entries until the cache is smaller than CACHE_SIZE bytes
+	"""
+
+	entries			= []
+
+	for filename in os.listdir(CACHE_DIR):
+		if filename.endswith('.npz'):
+			try:
+				stat	= os.stat(os.path.join(CACHE_DIR, filename))
+				entries.append((stat.st_mtime, stat.st_size, filename))
+			except OSError:
+				continue
+
+	total			= sum([x[1] for x in entries])
+
+	for mtime, size, filename in sorted(entries):
+
+		if total	<= CACHE_SIZE:
+			break
+
+		try:
+			os.remove(os.path.join(CACHE_DIR, filename))
+		except OSError:
+			pass
+
+		total		-= size
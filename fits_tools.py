@@ -3,8 +3,22 @@ from 	astropy import wcs
 from 	astropy.io import fits
 from 	astropy import units as u
 from 	misc import bcolors
+import	collections
 import	numpy as np
 import	os
+import	re
+
+# WCS cache
+# WCS objects are cached for WCS_CACHE_SIZE distinct sets of WCS keywords (e.g. the epochs of a light curve)
+
+WCS_CACHE_SIZE	= 64
+WCS_KEYWORDS	= re.compile('^(WCSAXES|NAXIS|CTYPE|CUNIT|CRPIX|CRVAL|CDELT|CROTA|CD[0-9]_|PC[0-9]_|PV[0-9]_|LONPOLE|LATPOLE|RADESYS|EQUINOX|A_|B_|AP_|BP_)')
+
+wcs_cache		= collections.OrderedDict()
+
+# Header keywords with the weight type of drizzled images (final_wht_type of astrodrizzle: EXP, IVM or ERR), see FitsImage.wht_type
+
+WHT_TYPE_KEYWORDS	= ['FINALWHT', 'WHTTYPE', 'FINAL_WHT_TYPE']
 
 def convert_hms_dd(RA, DEC):
 
@@ -38,19 +52,179 @@ def get_header(FILE, KEYWORD):
 def pix2arcsec(FITS):
 
 	'''
-	Get pixel scale
+	Get pixel scale (FITS: filename or FitsImage)
 	'''
 
-	hdu		= fits.open(FITS)
-	if len(hdu) > 1:
-		header	= fits.getheader(FITS, 0)
-		header	+= fits.getheader(FITS, 1)
-	else:
-		header	= fits.getheader(FITS)
+	hdu				= fits_image(FITS)
+	scale			= hdu.pix2arcsec
+
+	if hdu is not FITS:
+		hdu.close()
+
+	return scale
+
+class FitsImage:
+
+	'''
+	Image context: opens a FITS file once (memory-mapped) and resolves the science extension (EXTENSION, e.g. ('SCI', 2)
+	for the second chip of a multi-extension exposure; default: extension 1 if it is an image, else the primary HDU) and
+	the merged header (primary header updated with the header of the science extension, or of extension 1).
+	Data, header, WCS and pixel scale are computed on first access.
+	'''
+
+	def __init__(self, FITS, EXTENSION=None):
+
+		self.filename		= FITS
+		self.hdulist		= fits.open(FITS, memmap=True)
+		self.extension_key	= EXTENSION
+
+		self._header		= None
+		self._wcs			= None
+		self._pix2arcsec	= None
+
+	@property
+	def hdu(self):
+
+		'''
+		Science HDU
+		'''
+
+		if self.extension_key != None:
+			return self.hdulist[self.extension_key]
+
+		if len(self.hdulist) > 1 and self.hdulist[1].is_image:
+			return self.hdulist[1]
+
+		return self.hdulist[0]
+
+	@property
+	def data(self):
+
+		'''
+		Science array (memory-mapped)
+		'''
+
+		return self.hdu.data
+
+	@property
+	def header(self):
+
+		'''
+		Primary header followed by the header of the science extension (e.g. PHOTFLAM and WCS of a chip).
+		Keywords in both keep the primary value, as fits.getheader(FITS, 0) + fits.getheader(FITS, 1)
+		'''
+
+		if self._header is None:
+
+			if self.extension_key != None:
+				extension	= self.hdu
+			elif len(self.hdulist) > 1:
+				extension	= self.hdulist[1]
+			else:
+				extension	= None
+
+			self._header	= self.hdulist[0].header.copy()
+
+			if extension is not None and extension is not self.hdulist[0]:
+				self._header	+= extension.header
+
+		return self._header
+
+	def sci_extensions(self):
+
+		'''
+		SCI extensions (chips) of a multi-extension exposure as (EXTNAME, EXTVER)
+		'''
+
+		return [(hdu.name, hdu.ver) for hdu in self.hdulist if hdu.name == 'SCI' and hdu.is_image]
+
+	@property
+	def wcs(self):
+
+		if self._wcs is None:
+			self._wcs		= header_wcs(self.header)
+
+		return self._wcs
+
+	@property
+	def pix2arcsec(self):
+
+		'''
+		Pixel scale (arcsec)
+		'''
+
+		if self._pix2arcsec is None:
+			self._pix2arcsec	= np.median(wcs.utils.proj_plane_pixel_scales(self.wcs)) * 3600
+
+		return self._pix2arcsec
+
+	def extension(self, EXTNAME):
+
+		'''
+		Data of the extension EXTNAME (e.g. ERR, WHT) that belongs to the science extension (same EXTVER; memory-mapped).
+		None if the file has no such extension.
+		'''
+
+		try:
+			return self.hdulist[EXTNAME, self.hdu.header.get('EXTVER', 1)].data
+		except KeyError:
+			return None
+
+	def wht_type(self):
+
+		'''
+		Weight type of the WHT extension (EXP, IVM or ERR) from the header of the WHT extension or the merged header
+		(WHT_TYPE_KEYWORDS). None if the type is not recorded.
+		'''
+
+		headers				= [self.header]
+
+		try:
+			headers.insert(0, self.hdulist['WHT', self.hdu.header.get('EXTVER', 1)].header)
+		except KeyError:
+			pass
+
+		for header in headers:
+			for key in WHT_TYPE_KEYWORDS:
+				if key in header:
+					return str(header[key]).strip().upper()
+
+		return None
+
+	def close(self):
+
+		self.hdulist.close()
+
+def fits_image(FITS):
+
+	'''
+	Image context of FITS (filename or FitsImage)
+	'''
+
+	if isinstance(FITS, FitsImage):
+		return FITS
+
+	return FitsImage(FITS)
+
+def header_wcs(HEADER):
+
+	'''
+	WCS of a FITS header, cached by the values of its WCS keywords
+	'''
+
+	key				= tuple((card, str(HEADER[card])) for card in HEADER.keys() if WCS_KEYWORDS.match(card))
+
+	if key in wcs_cache:
+		wcs_cache.move_to_end(key)
+		return wcs_cache[key]
+
+	hdu_wcs			= wcs.WCS(HEADER)
+
+	wcs_cache[key]	= hdu_wcs
+	if len(wcs_cache) > WCS_CACHE_SIZE:
+		wcs_cache.popitem(last=False)
 
-	hdu_wcs			= wcs.WCS(header)
-	return np.median(wcs.utils.proj_plane_pixel_scales(hdu_wcs)) * 3600
-	
+	return hdu_wcs
 
 def sky2xy (FITS, RA=False, DEC=False, CAT=None):
 
@@ -3,23 +3,26 @@ from	astropy import coordinates as coord
 from	astropy import stats, table, time
 from	astropy import units as u
 from	astropy.io import ascii, fits
+import	aperture_tools
+import	background_tools
+import	cache_tools
 import	cat_tools
 from	cat_tools import catalog_prop
 import	fits_tools
 import	glob
-from	matplotlib import pylab as plt
-from	matplotlib.colors import LogNorm
-import	matplotlib.gridspec as gridspec
-import	matplotlib.patheffects as PathEffects
 from	misc import bcolors
+import	multiprocessing
 import	numpy as np
 import	os
 import	photutils
-from	plotsettings import *
-import	pysynphot as pyS
+try:
+	import	pysynphot as pyS
+	import	pysynphot.exceptions
+	PYSYNPHOT_OBSMODE_ERRORS	= (ValueError, pyS.exceptions.PysynphotError)
+except ImportError:
+	pyS		= None
+	PYSYNPHOT_OBSMODE_ERRORS	= (ValueError,)
 import	random
-from	scipy import stats as stats_scipy
-from	scipy import optimize
 import	sewpy
 import	stat_tools
 import	sys
@@ -27,38 +30,134 @@ import	warnings
 
 warnings.filterwarnings("ignore", category=np.VisibleDeprecationWarning)
 
-def aperture_photometry(IMAGE, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, RMS, GAIN=1, FA=1, ZEROPOINT=0):
+# Persistent cache of the HST aperture corrections (hst_zeropoint)
+
+APCORR_CACHE_DIR			= os.path.join(os.environ.get('PHOTOMETRY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'photometry')), 'apcorr')
+APCORR_CACHE_SIZE			= 64 * 1024**2
+
+# Observation modes that pysynphot could not parse in this process (not cached on disk, see hst_aperture_correction)
+
+apcorr_failed				= set()
+
+# Precomputed aperture corrections (encircled energy relative to 4''), see hst_apcorr_table and build_apcorr_table.py
+
+APCORR_TABLE				= os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hst_apcorr.fits')
+
+apcorr_tables				= {}
+
+# Instrumental magnitude range of the local sequence in automatic mode (local_sequence_cuts)
+
+LOCAL_SEQUENCE_CUTS			= os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_sequence_cuts.dat')
+
+local_sequence_tables		= {}
+
+# Diagnostic plots. False: numeric-only mode, no figures are made and matplotlib and plotsettings are never imported
+# (see plot_imports)
+
+PLOTS						= True
+
+def plot_imports():
+
+	"""
+	Import matplotlib and the plot settings (plotsettings: LaTeX, colours, font sizes) into the module on first use
+	"""
+
+	if 'plt' in globals():
+		return None
+
+	from	matplotlib import pylab
+	from	matplotlib.colors import LogNorm
+	import	matplotlib.patheffects
+	import	plotsettings
+
+	globals().update({key: value for key, value in vars(plotsettings).items() if not key.startswith('_') and key not in globals()})
+	globals().update({'plt': pylab, 'LogNorm': LogNorm, 'PathEffects': matplotlib.patheffects})
+
+	return None
+
+def aperture_photometry(IMAGE, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, RMS, GAIN=1, FA=1, ZEROPOINT=0, BACKEND='photutils', METHOD='exact', SUBPIXELS=1, SUMS=None, FLOAT32=False, BKG_VARIANCE=None):
 
 	"""
 	Performs aperture photometry one or more objects and for one or more circular apertures per object.
+	BACKEND: 'photutils' (pixel overlap computed by photutils for every call),
+	'stencil' (pixel overlap from the cached stencils in aperture_tools) or 'profile' (all apertures and
+	annuli from one cumulative radial profile per object; pixel centres with SUBPIXELS x SUBPIXELS sampling)
+	METHOD: photutils overlap method ('exact', 'center', 'subpixel') of the photutils and stencil backends
+	SUMS: precomputed (source sums, annulus sums), e.g. from aperture_tools.matrix_sums. Overrides BACKEND.
+	FLOAT32: single-precision pixel data with float64-accumulated aperture sums (profile and stencil backends) and single-precision
+	local background statistics. Aperture sums agree with the default (float64) path to within
+	aperture_tools.FLOAT32_TOLERANCE (~2.4e-7) x sum(|weight x pixel|) (see aperture_tools). The photutils backend always computes in float64.
+	RMS: if an RMS map (e.g. from background(..., BACK_SIZE=..., MAPS=True); same pixel grid as IMAGE), the background noise
+	is taken from the map at the source positions instead of the sigma-clipped RMS of the annuli
+	BKG_VARIANCE: sums of the per-pixel variance in the apertures (N_sources x N_radii, e.g. from aperture_tools.variance_sums).
+	The background noise is then sqrt(BKG_VARIANCE / FA) and RMS is not used.
 	Output: mag in AB and FNU in microJy
 	"""
 
-	src_apers											= [photutils.CircularAperture(POSITIONS, r=radius) for radius in RADII]
-	src_phot_table										= photutils.aperture_photometry(IMAGE, src_apers)
+	if SUMS is None and BACKEND							== 'photutils':
+
+		src_apers										= [photutils.CircularAperture(POSITIONS, r=radius) for radius in RADII]
+		src_phot_table									= photutils.aperture_photometry(IMAGE, src_apers, method=METHOD, subpixels=SUBPIXELS)
+
+		# background
+
+		bkg_apers										= [photutils.CircularAnnulus(POSITIONS, r_in=INNERANNULUS[i], r_out=OUTERANNULUS[i]) for i in range(len(RADII))]
+		bkg_phot_table									= photutils.aperture_photometry(IMAGE, bkg_apers, method=METHOD, subpixels=SUBPIXELS)
+
+		if 'aperture_sum_0' not in src_phot_table.keys():
+			src_phot_table.rename_column('aperture_sum', 'aperture_sum_0')
+			bkg_phot_table.rename_column('aperture_sum', 'aperture_sum_0')
+
+	elif SUMS is not None or BACKEND					in ['profile', 'stencil']:
+
+		if SUMS is not None:
+			src_sums, bkg_sums							= SUMS
+		elif BACKEND									== 'profile':
+			src_sums, bkg_sums							= aperture_tools.profile_sums(IMAGE, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, SUBPIXELS=SUBPIXELS, FLOAT32=FLOAT32)
+		else:
+			src_sums, bkg_sums							= aperture_tools.stencil_sums(IMAGE, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, METHOD=METHOD, SUBPIXELS=SUBPIXELS, FLOAT32=FLOAT32)
+
+		positions										= np.atleast_2d(POSITIONS)
+
+		src_phot_table									= table.Table([np.arange(1, len(positions) + 1), positions[:, 0], positions[:, 1]] + [src_sums[:, i] for i in range(len(RADII))],
+															names=['id', 'xcenter', 'ycenter'] + ['aperture_sum_' + str(i) for i in range(len(RADII))])
+
+	else:
+		msg												= 'Photometry backend {backend} not recognised (possible values: photutils, profile, stencil)'.format(backend=BACKEND)
+		print(bcolors.FAIL + msg + bcolors.ENDC)
+		sys.exit()
+
+	# Aperture sums of all sources and apertures (N_sources x N_radii)
 
-	# background
+	if SUMS is None and BACKEND							== 'photutils':
+		src_sums										= np.array([np.asarray(src_phot_table['aperture_sum_' + str(i)]) for i in range(len(RADII))]).T
+		bkg_sums										= np.array([np.asarray(bkg_phot_table['aperture_sum_' + str(i)]) for i in range(len(RADII))]).T
 
-	bkg_apers											= [photutils.CircularAnnulus(POSITIONS, r_in=INNERANNULUS[i], r_out=OUTERANNULUS[i]) for i in range(len(RADII))]
-	bkg_phot_table										= photutils.aperture_photometry(IMAGE, bkg_apers)
+	# Aperture areas
 
-	if 'aperture_sum_0' not in src_phot_table.keys():
-		src_phot_table.rename_column('aperture_sum', 'aperture_sum_0')
-		bkg_phot_table.rename_column('aperture_sum', 'aperture_sum_0')
+	src_area											= np.pi * np.asarray(RADII)**2
+	bkg_area											= np.pi * (np.asarray(OUTERANNULUS)**2 - np.asarray(INNERANNULUS)**2)
 
 	# Get statistics of local background
+	# Sigma-clipped RMS for every source and every annulus (N_sources x N_radii), the RMS map at the source positions,
+	# or the mean variance in the apertures (from a noise map)
+
+	if BKG_VARIANCE is not None:
+		local_rms										= np.sqrt(np.asarray(BKG_VARIANCE) / src_area)
+	elif np.ndim(RMS)									== 2:
+		rms_map											= aperture_tools.cutouts(RMS, POSITIONS, 0)[0][:, 0, 0]
+		local_rms										= np.repeat(rms_map[:, None], len(RADII), axis=1)
+	else:
+		local_mean, local_median, local_rms				= aperture_tools.annulus_stats(IMAGE, POSITIONS, INNERANNULUS, OUTERANNULUS, FLOAT32=FLOAT32)
 
-	local_rms											= [background_local(IMAGE, x)[-1] for x in bkg_apers]	
 	# Area ratio
 
-	area_ratio											= [src_apers[i].area() / bkg_apers[i].area() for i in range(len(RADII))]
-	bkg_phot_table_rescaled								= [bkg_phot_table['aperture_sum_' + str(i)] * area_ratio[i] for i in range(len(RADII))]
+	area_ratio											= src_area / bkg_area
+	bkg_rescaled										= bkg_sums * area_ratio
 
 	# sources - background
 
-	for i in range(len(RADII)):
-		src_phot_table['bkg_'+str(i)]					= bkg_phot_table_rescaled[i]
-		src_phot_table['bkg_sub_aperture_sum_'+str(i)]	= src_phot_table['aperture_sum_'+str(i)] - bkg_phot_table_rescaled[i]
+	bkg_sub												= src_sums - bkg_rescaled
 
 	# Error estimation
 	# Comprises of source noise and the scatter in the background
@@ -67,93 +166,401 @@ def aperture_photometry(IMAGE, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, RMS
 	# Source/Shot/Poisson noise ( ~sqrt(F/effective gain) )
 	# Background noise ( ~sqrt(rms**2 * area) )
 
-	for i in range(len(RADII)):
-
-		# Append zeropoint to table
+	zeropoint											= np.array([ZEROPOINT[i] for i in range(len(RADII))], dtype=float)
 
-		src_phot_table['ZP_APER_' + str(i)]				= ZEROPOINT[i]
+	shot_noise											= np.sqrt(np.abs(bkg_sub) / GAIN)
 
-		# Noise terms
+	# Global background
+	#bkg_noise											= np.sqrt(RMS**2 * src_area / FA)
 
-		shot_noise										= np.sqrt(np.abs(src_phot_table['bkg_sub_aperture_sum_' + str(i)]) / GAIN)
-		# Global background
-		#bkg_noise										= np.sqrt(RMS**2 * src_apers[i].area() / FA)
+	# Local background
+	bkg_noise											= np.sqrt(local_rms**2 * src_area / FA)
 
-		# Local background
-		bkg_noise										= np.sqrt(local_rms[i]**2 * src_apers[i].area() / FA)
+	total_error											= np.sqrt(shot_noise**2 + bkg_noise**2)
 
-		src_phot_table['SHOT_NOISE_' + str(i)]			= shot_noise
-		src_phot_table['BKG_NOISE_' + str(i)]			= bkg_noise
-		src_phot_table['TOTAL_ERROR_' + str(i)]			= np.sqrt(shot_noise**2 + bkg_noise**2)
+	# Flux densities
+	# Convert to microJy
+	# Converting the ZP for the AB magnitude to a ZP in micro-Jy
 
-		# Flux densities
-		# Convert to microJy
-		# Converting the ZP for the AB magnitude to a ZP in micro-Jy
+	factor												= np.array([pow(10, -0.4 * (x - 23.9)) for x in zeropoint])
 
-		factor											= pow(10, -0.4 * (ZEROPOINT[i] - 23.9))
+	fnu													= bkg_sub * factor
+	fnu_err												= total_error * factor
 
-		src_phot_table['FNU_APER_' + str(i)]			= src_phot_table['bkg_sub_aperture_sum_' + str(i)] * factor
-		src_phot_table['FNUERR_APER_' + str(i)]			= src_phot_table['TOTAL_ERROR_' + str(i)] * factor
+	# Magnitudes (AB)
+	# Non-detections are replaced by 3-sigma upper limits
 
-		# Magnitudes (AB)
+	mag, mag_errp, mag_errm								= flux2mag(fnu, fnu_err, ZEROPOINT=23.9)
 
-		src_phot_table['MAG_APER_' + str(i)]			= [
-														-2.5*np.log10(src_phot_table['FNU_APER_' + str(i)][j])
-														if src_phot_table['FNU_APER_' + str(i)][j] > 0 else -2.5*np.log10(3 * src_phot_table['FNUERR_APER_' + str(i)][j])
-														for j in range(len(src_phot_table['FNU_APER_' + str(i)]))
-														]
+	# Output table (built in one go; adding the columns one by one dominates the run time for many apertures)
 
-		src_phot_table['MAGERRP_APER_' + str(i)]		= [
-														-2.5*np.log10(src_phot_table['FNU_APER_' + str(i)][j] - src_phot_table['FNUERR_APER_' + str(i)][j]) + 2.5*np.log10(src_phot_table['FNU_APER_' + str(i)][j])
-														if src_phot_table['FNU_APER_' + str(i)][j] > 0 else np.nan
-														for j in range(len(src_phot_table['FNU_APER_' + str(i)]))
-														]
+	columns												= []
+	names												= []
 
-		src_phot_table['MAGERRM_APER_' + str(i)]		= [
-														-2.5*np.log10(src_phot_table['FNU_APER_' + str(i)][j]) + 2.5*np.log10(src_phot_table['FNU_APER_' + str(i)][j] + src_phot_table['FNUERR_APER_' + str(i)][j])
-														if src_phot_table['FNU_APER_' + str(i)][j] > 0 else np.nan
-														for j in range(len(src_phot_table['FNU_APER_' + str(i)]))
-														]
+	for i in range(len(RADII)):
+		columns											+= [bkg_rescaled[:, i], bkg_sub[:, i]]
+		names											+= ['bkg_' + str(i), 'bkg_sub_aperture_sum_' + str(i)]
 
-		# Transform the magnitudes back to the AB system
+	for i in range(len(RADII)):
+		columns											+= [np.full(len(src_sums), zeropoint[i]), shot_noise[:, i], bkg_noise[:, i], total_error[:, i],
+															fnu[:, i], fnu_err[:, i], mag[:, i], mag_errp[:, i], mag_errm[:, i]]
+		names											+= [x + str(i) for x in ['ZP_APER_', 'SHOT_NOISE_', 'BKG_NOISE_', 'TOTAL_ERROR_',
+															'FNU_APER_', 'FNUERR_APER_', 'MAG_APER_', 'MAGERRP_APER_', 'MAGERRM_APER_']]
 
-		src_phot_table['MAG_APER_' + str(i)]			+= 23.9
+	# Output formats (set when the new columns are created: setting the format of an existing column is slow)
 
 	for key in [x for x in src_phot_table.keys() if x or 'MAG_APER_' in x or 'aperture' in x]:
 		src_phot_table[key].info.format 				= '%.3f'
 
-	for key in [x for x in src_phot_table.keys() if 'FNU' in x or 'NOISE' in x or 'TOTAL' in x]:
-		src_phot_table[key].info.format 				= '%.3e'
+	formats												= ['%.3e' if 'FNU' in x or 'NOISE' in x or 'TOTAL' in x else '%.3f' for x in names]
+
+	src_phot_table										= src_phot_table.__class__(list(src_phot_table.itercols()) + [table.Column(columns[i], name=names[i], format=formats[i]) for i in range(len(columns))], copy=False)
 	
 	return src_phot_table
 
-def	background (IMAGE, DILATE_SIZE=11, NPIXEL=5, SIGMA=5, SNR=5):
+def stack_photometry(IMAGES, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, RMS, GAIN=1, FA=1, ZEROPOINT=0, METHOD='exact', SUBPIXELS=5, MATRIX=None, MATRIX_RMS=False):
+
+	"""
+	Forced photometry of the same positions on a stack of images that share a pixel grid (e.g. after align_images.py).
+	The aperture geometry is computed once as a sparse weight matrix (aperture_tools.aperture_matrix).
+	All images are then photometered with a single sparse x dense product.
+	The local background RMS is the sigma-clipped annulus RMS of every image, as in aperture_photometry.
+	RMS: if an RMS map (ny x nx), the background noise is taken from the map.
+	GAIN: one value or one value per image. ZEROPOINT: one value per aperture or one row per image.
+	MATRIX: aperture matrix from a previous call (same positions, apertures and pixel grid)
+	MATRIX_RMS: take the background RMS from the matrix instead (aperture_tools.matrix_stats). Faster, but weighted and
+	not sigma-clipped, so sources in the annuli increase the background noise.
+	Output: list of photometry tables (one per image, same format as aperture_photometry)
+	"""
+
+	if np.ndim(IMAGES[0])	!= 2:
+		msg					= 'stack_photometry needs a stack of images (N_images x ny x nx). For a single image use aperture_photometry'
+		print(bcolors.FAIL + msg + bcolors.ENDC)
+		sys.exit()
+
+	num_images				= len(IMAGES)
+	num_radii				= len(RADII)
+
+	if MATRIX is None:
+		MATRIX				= aperture_tools.aperture_matrix(np.shape(IMAGES[0]), POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, METHOD=METHOD, SUBPIXELS=SUBPIXELS)
+
+	src_sums, bkg_sums		= aperture_tools.matrix_sums(MATRIX, IMAGES, num_radii)
+
+	# Background variance in the apertures from the weighted annulus RMS of the matrix (N_images x N_positions x N_radii)
+
+	if np.ndim(RMS) == 2 or not MATRIX_RMS:
+		bkg_variance		= [None] * num_images
+	else:
+		bkg_variance		= aperture_tools.matrix_stats(MATRIX, IMAGES, num_radii)[1]**2 * np.pi * np.asarray(RADII)**2
+
+	gain					= np.broadcast_to(GAIN, num_images)
+	zeropoint				= np.broadcast_to(ZEROPOINT, (num_images, num_radii))
+
+	return [aperture_photometry(IMAGES[i], POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, RMS, GAIN=gain[i], FA=FA, ZEROPOINT=zeropoint[i],
+								SUMS=(src_sums[i], bkg_sums[i]), BKG_VARIANCE=bkg_variance[i]) for i in range(num_images)]
+
+def tiled_photometry(FITS, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, RMS, GAIN=1, FA=1, ZEROPOINT=0, BACKEND='photutils', METHOD='exact', SUBPIXELS=1, EXTENSION=None, TILESIZE=2048, FLOAT32=False, BKG_VARIANCE=None):
+
+	"""
+	Aperture photometry on large mosaics, one tile at a time.
+	The FITS file (or an image array, e.g. a memory-mapped HDU) is read memory-mapped. Positions are bucketed by tile
+	and only tiles that contain positions are read into memory, with a halo that covers the largest annulus.
+	Peak memory scales with TILESIZE instead of the image size.
+	BKG_VARIANCE: see aperture_photometry (one row per position)
+	Output: same as aperture_photometry (rows in input order)
+	"""
+
+	if isinstance(FITS, str):
+		hdulist				= fits.open(FITS, memmap=True)
+
+		if EXTENSION		!= None:
+			image			= hdulist[EXTENSION].data
+		elif len(hdulist) > 1 and hdulist[1].is_image:
+			image			= hdulist[1].data
+		else:
+			image			= hdulist[0].data
+	else:
+		image				= FITS
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+	halo					= int(np.ceil(max(np.max(RADII), np.max(OUTERANNULUS)))) + 2
+
+	phot_tables				= []
+	phot_indices			= []
+
+	for slice_y, slice_x, indices in aperture_tools.tiles(np.shape(image), positions, TILESIZE, halo):
+
+		tile				= np.array(image[slice_y, slice_x])
+		tile_positions		= positions[indices] - np.array([slice_x.start, slice_y.start])
+
+		# An RMS map is cut to the tile (the positions are relative to the tile)
+
+		tile_rms			= np.asarray(RMS[slice_y, slice_x]) if np.ndim(RMS) == 2 else RMS
+
+		phot_table			= aperture_photometry(tile, tile_positions, RADII, INNERANNULUS, OUTERANNULUS, tile_rms, GAIN=GAIN, FA=FA, ZEROPOINT=ZEROPOINT,
+												BACKEND=BACKEND, METHOD=METHOD, SUBPIXELS=SUBPIXELS, FLOAT32=FLOAT32,
+												BKG_VARIANCE=None if BKG_VARIANCE is None else np.atleast_2d(BKG_VARIANCE)[indices])
+
+		phot_table['xcenter']	= positions[indices, 0]
+		phot_table['ycenter']	= positions[indices, 1]
+
+		phot_tables.append(phot_table)
+		phot_indices.append(indices)
+
+	# Merge the tiles and restore the input order
+
+	phot_table				= table.vstack(phot_tables)
+	phot_table				= phot_table[np.argsort(np.hstack(phot_indices))]
+	phot_table['id']		= np.arange(1, len(phot_table) + 1)
+
+	return phot_table
+
+def parallel_photometry(IMAGE, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, RMS, GAIN=1, FA=1, ZEROPOINT=0, BACKEND='photutils', METHOD='exact', SUBPIXELS=1, WORKERS=None, TILESIZE=512, FLOAT32=False):
+
+	"""
+	Aperture photometry with a pool of WORKERS processes (default: all cores).
+	The image (and RMS, if it is a map) is copied once into shared memory. The positions are ordered by image tile
+	(TILESIZE x TILESIZE pixels) and split into spatially coherent chunks, which are photometered by aperture_photometry
+	on the full shared image. Every source is therefore measured exactly as in the serial path (bit-identical results).
+	Output: same as aperture_photometry (rows in input order)
+	"""
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+
+	if WORKERS				== None:
+		WORKERS				= os.cpu_count()
+
+	if WORKERS				<= 1 or len(positions) < 2:
+		return aperture_photometry(IMAGE, positions, RADII, INNERANNULUS, OUTERANNULUS, RMS, GAIN=GAIN, FA=FA, ZEROPOINT=ZEROPOINT,
+									BACKEND=BACKEND, METHOD=METHOD, SUBPIXELS=SUBPIXELS, FLOAT32=FLOAT32)
+
+	# Spatially coherent chunks (several per worker to balance the load)
+
+	indices					= np.hstack([x[2] for x in aperture_tools.tiles(np.shape(IMAGE), positions, TILESIZE, 0)])
+	chunks					= [x for x in np.array_split(indices, min(4 * WORKERS, len(indices))) if len(x) > 0]
+
+	# Image and RMS map in shared memory
+
+	shared_image			= aperture_tools.shared_array(IMAGE)
+	shared_rms				= aperture_tools.shared_array(RMS) if np.ndim(RMS) >= 2 else None
+
+	kwargs					= {'GAIN': GAIN, 'FA': FA, 'ZEROPOINT': ZEROPOINT, 'BACKEND': BACKEND, 'METHOD': METHOD, 'SUBPIXELS': SUBPIXELS, 'FLOAT32': FLOAT32}
+	tasks					= [(positions[chunk], RADII, INNERANNULUS, OUTERANNULUS, RMS if shared_rms is None else None, kwargs) for chunk in chunks]
+
+	pool					= multiprocessing.Pool(min(WORKERS, len(chunks)), initializer=parallel_photometry_init, initargs=(shared_image, shared_rms))
+
+	try:
+		phot_tables			= pool.map(parallel_photometry_chunk, tasks)
+	finally:
+		pool.close()
+		pool.join()
+
+	# Merge the chunks and restore the input order
+
+	phot_table				= table.vstack(phot_tables)
+	phot_table				= phot_table[np.argsort(np.hstack(chunks))]
+	phot_table['id']		= np.arange(1, len(phot_table) + 1)
+
+	return phot_table
+
+def parallel_photometry_init(SHARED_IMAGE, SHARED_RMS):
+
+	"""
+	Initialises a worker of parallel_photometry: numpy views of the shared image and RMS map
+	"""
+
+	global parallel_image, parallel_rms
+
+	parallel_image			= aperture_tools.shared_view(*SHARED_IMAGE)
+	parallel_rms			= aperture_tools.shared_view(*SHARED_RMS) if SHARED_RMS is not None else None
+
+def parallel_photometry_chunk(TASK):
+
+	"""
+	Photometry of one chunk of positions in a worker of parallel_photometry
+	"""
+
+	positions, radii, innerannulus, outerannulus, rms, kwargs	= TASK
+
+	return aperture_photometry(parallel_image, positions, radii, innerannulus, outerannulus, parallel_rms if rms is None else rms, **kwargs)
+
+def lightcurve_photometry(IMAGES, RA, DEC, RADII, INNERANNULUS, OUTERANNULUS, GAIN=1, FA=1, ZEROPOINT=0, BACKEND='photutils', EXTENSION=None,
+							EPOCH_KEYWORD='MJD-OBS', OUTFILE=None, WORKERS=1, FLOAT32=False):
+
+	"""
+	Forced photometry of a fixed set of sky positions on a list of calibrated images (light curves).
+	Every image is read once (memory-mapped). The sky positions are converted to pixel positions with the (cached) WCS
+	of the image header and photometered with aperture_photometry (or parallel_photometry if WORKERS != 1).
+	RADII, INNERANNULUS, OUTERANNULUS: in pixels
+	GAIN: one value or one value per image. ZEROPOINT: one value, one value per image, one value per aperture or one row (one value
+	per aperture) per image. If there are as many images as apertures, a 1D ZEROPOINT is ambiguous: give it as one column per image
+	(N_images x 1) or one row for all images (1 x N_radii).
+	Sources outside an image are skipped for that image.
+	OUTFILE: if set, the rows of every image are appended to this CSV file as soon as they are measured (the function returns None)
+	Output: long-format table with one row per image, source and aperture
+	"""
+
+	ra						= np.atleast_1d(RA)
+	dec						= np.atleast_1d(DEC)
+	radii					= np.atleast_1d(RADII)
+
+	num_images				= len(IMAGES)
+	num_radii				= len(radii)
+
+	gain					= np.broadcast_to(GAIN, num_images)
+	zeropoint				= np.asarray(ZEROPOINT, dtype=float)
+
+	if zeropoint.ndim		== 1 and len(zeropoint) == num_images and num_images == num_radii and num_images > 1:
+		msg					= 'ZEROPOINT with {num} values is ambiguous for {num} images and {num} apertures. Use shape ({num}, 1) for one value per image or (1, {num}) for one value per aperture.'.format(num=num_images)
+		print(bcolors.FAIL + msg + bcolors.ENDC)
+		sys.exit()
+
+	zeropoint				= np.broadcast_to(zeropoint[:, None] if zeropoint.ndim == 1 and len(zeropoint) == num_images else zeropoint, (num_images, num_radii))
+
+	source_id				= np.arange(1, len(ra) + 1)
+
+	output					= []
+
+	if OUTFILE				!= None and os.path.exists(OUTFILE):
+		os.remove(OUTFILE)
+
+	for i in range(num_images):
+
+		# Read FITS file (memory-mapped)
+
+		hdulist				= fits.open(IMAGES[i], memmap=True)
+
+		if EXTENSION		!= None:
+			hdu				= hdulist[EXTENSION]
+		elif len(hdulist) > 1 and hdulist[1].is_image:
+			hdu				= hdulist[1]
+		else:
+			hdu				= hdulist[0]
+
+		hdu_header			= hdulist[0].header.copy()
+		if hdu is not hdulist[0]:
+			hdu_header		+= hdu.header
+
+		hdu_data			= hdu.data
+		epoch				= hdu_header[EPOCH_KEYWORD] if EPOCH_KEYWORD in hdu_header.keys() else np.nan
+
+		# Pixel positions (0-based, photutils convention)
+
+		x, y				= fits_tools.header_wcs(hdu_header).all_world2pix(ra, dec, 0)
+		mask				= np.where((x >= -0.5) & (x < hdu_data.shape[1] - 0.5) & (y >= -0.5) & (y < hdu_data.shape[0] - 0.5))[0]
+
+		if len(mask)		== 0:
+			hdulist.close()
+			continue
+
+		phot_table			= parallel_photometry(hdu_data, np.array([x[mask], y[mask]]).T, radii, INNERANNULUS, OUTERANNULUS, 1,
+												GAIN=gain[i], FA=FA, ZEROPOINT=zeropoint[i], BACKEND=BACKEND, WORKERS=WORKERS, FLOAT32=FLOAT32)
+
+		hdulist.close()
+
+		# Long format: one row per source and aperture
+
+		num_sources			= len(mask)
+
+		epoch_table			= table.Table()
+		epoch_table['IMAGE']		= np.repeat(os.path.basename(IMAGES[i]), num_sources * num_radii)
+		epoch_table['EPOCH']		= np.repeat(epoch, num_sources * num_radii)
+		epoch_table['SOURCE_ID']	= np.repeat(source_id[mask], num_radii)
+		epoch_table['RA']			= np.repeat(ra[mask], num_radii)
+		epoch_table['DEC']			= np.repeat(dec[mask], num_radii)
+		epoch_table['X']			= np.repeat(x[mask], num_radii)
+		epoch_table['Y']			= np.repeat(y[mask], num_radii)
+		epoch_table['APERTURE_ID']	= np.tile(np.arange(num_radii), num_sources)
+		epoch_table['RADIUS']		= np.tile(radii, num_sources)
+
+		for key in ['FNU', 'FNUERR', 'MAG', 'MAGERRP', 'MAGERRM', 'ZP']:
+			epoch_table[key]		= np.array([phot_table[key + '_APER_' + str(j)] for j in range(num_radii)]).T.ravel()
+
+		if OUTFILE			!= None:
+			with open(OUTFILE, 'a') as f:
+				if os.path.getsize(OUTFILE) == 0:
+					ascii.write(epoch_table, f, format='csv')
+				else:
+					ascii.write(epoch_table, f, format='no_header', delimiter=',')
+		else:
+			output.append(epoch_table)
+
+	if OUTFILE				!= None:
+		return None
+
+	return table.vstack(output) if len(output) > 0 else table.Table()
+
+def flux2mag(FLUX, FLUXERR, ZEROPOINT=0, UL_SIGMA=3):
 
 	"""
-	Extracts the global RMS of an image
+	Converts fluxes and flux errors into magnitudes and asymmetric magnitude errors.
+	Works on whole columns. Masked, NaN and non-positive fluxes are replaced by UL_SIGMA upper limits
+	[ mag = -2.5 log (UL_SIGMA dF); mag_err = NaN ]
+	Output: mag, mag_errp, mag_errm
 	"""
 
-	mask				= photutils.make_source_mask(IMAGE, snr=SNR, npixels=NPIXEL, dilate_size=DILATE_SIZE)
-	mean, median, std	= stats.sigma_clipped_stats(IMAGE, sigma=SIGMA, mask=mask)
+	flux				= np.ma.filled(np.ma.asarray(FLUX, dtype=float), np.nan)
+	flux_err			= np.ma.filled(np.ma.asarray(FLUXERR, dtype=float), np.nan)
+
+	mask_det			= flux > 0
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+
+		mag				= np.where(mask_det, -2.5*np.log10(flux), -2.5*np.log10(UL_SIGMA * flux_err)) + ZEROPOINT
+
+		mag_errp		= np.where(mask_det, -2.5*np.log10(flux - flux_err) + 2.5*np.log10(flux), np.nan)
+		mag_errm		= np.where(mask_det, -2.5*np.log10(flux) + 2.5*np.log10(flux + flux_err), np.nan)
 
-	return std
+	return mag, mag_errp, mag_errm
 
-def background_local(IMAGE, APERTURE):
+def	background (IMAGE, DILATE_SIZE=11, NPIXEL=5, SIGMA=5, SNR=5, FLOAT32=False, BACK_SIZE=None, BACK_FILTERSIZE=3, WORKERS=1, MAPS=False,
+				CACHE_DIR=None, CACHE_SIZE=cache_tools.CACHE_SIZE):
 
 	"""
-	Extracts the global RMS of an image
+	Extracts the global RMS of an image (IMAGE: image array or fits_tools.FitsImage)
+	FLOAT32: compute in single precision (no float64 copy of the image)
+	BACK_SIZE: if set, mesh-based estimator with BACK_SIZE x BACK_SIZE pixel meshes and a BACK_FILTERSIZE median filter
+	(background_tools.mesh_background; SIGMA-clipped meshes instead of a source mask of the whole image, WORKERS processes;
+	for a FitsImage, the workers read their rows of meshes from the memory-mapped file).
+	MAPS: also return the interpolated background and RMS maps (mesh-based estimator only), e.g. as RMS of aperture_photometry
+	CACHE_DIR: if set, the results are cached on disk (cache_tools), keyed by a content hash of the image and the
+	estimator parameters. The least recently used entries are evicted above CACHE_SIZE bytes.
+	Output: RMS (MAPS=True: RMS, background map, RMS map)
 	"""
 
-	bkg_mask	= APERTURE.to_mask(method='center')[0]
-	bkg_data	= bkg_mask.multiply(IMAGE)
-	mask_idx 	= bkg_mask.data > 0
-	aper_data 	= bkg_data[mask_idx]
+	data				= IMAGE.data if isinstance(IMAGE, fits_tools.FitsImage) else IMAGE
 
-	# Extract the statistics
+	# Cached results
 
-	mean, median, std = stats.sigma_clipped_stats(aper_data)
+	if CACHE_DIR		!= None:
 
-	return mean, median, std
+		if BACK_SIZE	!= None:
+			params		= ('mesh', BACK_SIZE, BACK_FILTERSIZE, SIGMA, FLOAT32)
+		else:
+			params		= ('mask', DILATE_SIZE, NPIXEL, SIGMA, SNR, FLOAT32)
+
+		key				= cache_tools.cache_key('background', cache_tools.content_hash(data), params)
+		entry			= cache_tools.cache_load(CACHE_DIR, key)
+
+		if entry		!= None and (not MAPS or 'bkg_map' in entry):
+			return (float(entry['rms']), entry['bkg_map'], entry['rms_map']) if MAPS else float(entry['rms'])
+
+	if BACK_SIZE		!= None:
+		rms, bkg_map, rms_map	= background_tools.mesh_background(IMAGE, BACK_SIZE=BACK_SIZE, FILTERSIZE=BACK_FILTERSIZE, SIGMA=SIGMA, WORKERS=WORKERS, MAPS=MAPS,
+																	DTYPE=np.float32 if FLOAT32 else None)
+	else:
+		image			= np.asarray(data, dtype=np.float32) if FLOAT32 else data
+		mask			= photutils.make_source_mask(image, snr=SNR, npixels=NPIXEL, dilate_size=DILATE_SIZE)
+		mean, median, rms	= stats.sigma_clipped_stats(image, sigma=SIGMA, mask=mask)
+		bkg_map, rms_map	= None, None
+
+	if CACHE_DIR		!= None:
+		if bkg_map is not None:
+			cache_tools.cache_save(CACHE_DIR, key, CACHE_SIZE=CACHE_SIZE, rms=rms, bkg_map=bkg_map, rms_map=rms_map)
+		else:
+			cache_tools.cache_save(CACHE_DIR, key, CACHE_SIZE=CACHE_SIZE, rms=rms)
+
+	return (rms, bkg_map, rms_map) if MAPS else rms
 
 def	get_gain(FITS, KEYWORD, LOGGER):
 
@@ -189,27 +596,71 @@ def	get_gain(FITS, KEYWORD, LOGGER):
 			LOGGER.error(msg)
 			sys.exit()
 
-def hst_aperture_photometry(FITS, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, PIX2ARCSEC, RMS, FA=1):
+def hst_noise_model(HEADER, PIX2ARCSEC):
 
 	"""
-	Wrapper to perfrom aperture photometry on HST images
+	Effective gain and correlated noise correction factor of an HST image (drizzled, or a chip of a flt/flc exposure)
+	Output: effective gain, correction factor
 	"""
 
-	# Read FITS file
+	# Effective gain
+	# Astrodrizzled images are in units electrons/s, flt/flc chips in electrons (ACS, WFC3/UVIS) or counts
+	# https://photutils.readthedocs.io/en/stable/api/photutils.utils.calc_total_error.html#photutils.utils.calc_total_error
+
+	if 'CCDGAIN' in HEADER.keys():
+		key_gain			= 'CCDGAIN'
+	elif 'ADCGAIN' in HEADER.keys():
+		key_gain			= 'ADCGAIN'
+	elif 'ATODGAIN' in HEADER.keys():
+		key_gain			= 'ATODGAIN'
+	else:
+		msg					= 'GAIN keyword not found.'
+		print(bcolors.BOLD + bcolors.FAIL + msg + bcolors.ENDC)
+		sys.exit()
 
-	hdulist					= fits.open(FITS)
+	bunit					= str(HEADER.get('BUNIT', '')).strip().upper()
 
-	hdu_header				= hdulist[0].header
-	if len(hdulist) 		> 1:
-		try: 
-			hdulist[1].shape
-			hdu_header		+= hdulist[1].header
-			hdu_data		= hdulist[1].data
-		except:
-			hdu_header		+= hdulist[1].header
-			hdu_data		= hdulist[0].data
+	if bunit				== 'ELECTRONS':
+		effective_gain		= 1.
+	elif bunit				== 'COUNTS':
+		effective_gain		= HEADER[key_gain]
 	else:
-		hdu_data			= hdulist[0].data
+		effective_gain		= HEADER['EXPTIME'] * HEADER[key_gain]
+
+	# Correlated noise correction factor
+	# http://www.ifa.hawaii.edu/~rgal/science/sextractor_notes.html
+	# Images that are not drizzled (no D001PIXF keyword) have no correlated noise
+
+	if 'D001PIXF' not in HEADER.keys():
+		return effective_gain, 1.
+
+	pixfrac					= HEADER['D001PIXF']
+	try:
+		native_scale		= hst_scale(HEADER['INSTRUME'], HEADER['APERTURE'])
+	except:
+		native_scale		= hst_scale(HEADER['INSTRUME'], None)
+
+	scale					= PIX2ARCSEC/native_scale
+
+	fa						= pow( (scale/pixfrac) * (1.  - (scale / 3 / pixfrac)), 2) if scale < pixfrac else pow(1 - pixfrac / 3 / scale, 2)
+
+	return effective_gain, fa
+
+def hst_aperture_photometry(FITS, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, PIX2ARCSEC, RMS, FA=1, BACKEND='photutils', TILESIZE=None, FLOAT32=False, NOISE=None):
+
+	"""
+	Wrapper to perfrom aperture photometry on HST images
+	FITS: filename or fits_tools.FitsImage (image context, see fits_tools)
+	TILESIZE: if set, the memory-mapped image is processed tile by tile (see tiled_photometry)
+	FLOAT32: single-precision compute mode (see aperture_photometry)
+	NOISE: 'err' or 'wht' to compute the background noise from the per-pixel noise in the apertures
+	(see hst_noise_extension; RMS is then not used), None for the background noise from RMS
+	"""
+
+	# Image context (FITS: filename or fits_tools.FitsImage; memory-mapped)
+
+	hdu						= fits_tools.fits_image(FITS)
+	hdu_header, hdu_data	= hdu.header, hdu.data
 
 	# sources
 
@@ -221,38 +672,252 @@ def hst_aperture_photometry(FITS, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS,
 
 	zeropoint				= hst_zeropoint (hdu_header, 2*RADII)
 
-	# Effective gain
-	# Astrodrizzled images are in units electrons/s
-	# https://photutils.readthedocs.io/en/stable/api/photutils.utils.calc_total_error.html#photutils.utils.calc_total_error
+	# Effective gain and correlated noise correction factor
 
-	if 'CCDGAIN' in hdu_header.keys():
-		key_gain			= 'CCDGAIN'
-	elif 'ADCGAIN' in hdu_header.keys():
-		key_gain			= 'ADCGAIN'
-	elif 'ATODGAIN' in hdu_header.keys():
-		key_gain			= 'ATODGAIN'
-	else:
-		msg					= 'GAIN keyword not found.'
-		logger.error(msg)
-		print(bcolors.BOLD + bcolors.FAIL + msg + bcolors.ENDC)
+	effective_gain, fa		= hst_noise_model(hdu_header, PIX2ARCSEC)
+
+	# Background noise from the ERR/WHT extension
+
+	bkg_variance			= hst_variance_sums(hdu, POSITIONS, radii_px, NOISE) if NOISE != None else None
+
+	if TILESIZE				!= None:
+		return tiled_photometry(hdu_data, POSITIONS, radii_px, innerannulus_px, outerannulus_px, RMS, GAIN=effective_gain, ZEROPOINT=zeropoint, FA=fa, BACKEND=BACKEND, TILESIZE=TILESIZE, FLOAT32=FLOAT32,
+								BKG_VARIANCE=bkg_variance)
+
+	return aperture_photometry(hdu_data, POSITIONS, radii_px, innerannulus_px, outerannulus_px, RMS, GAIN=effective_gain, ZEROPOINT=zeropoint, FA=fa, BACKEND=BACKEND, FLOAT32=FLOAT32,
+								BKG_VARIANCE=bkg_variance)
+
+def hst_noise_extension(FITS, NOISE='auto'):
+
+	"""
+	Per-pixel noise extension of an HST image: ERR (flt/flc products) or WHT (drz/drc products).
+	WHT is used as inverse-variance map, i.e. only if the header records final_wht_type='IVM' (see fits_tools.FitsImage.wht_type).
+	The standard EXP weights (exposure time) are not a noise map.
+	NOISE: 'err', 'wht' or 'auto' (ERR if present, otherwise an IVM-type WHT)
+	Output: type of the extension ('err' or 'wht') and its data (memory-mapped), or None, None if the image has no such extension
+	(or, with 'auto', no IVM-type WHT extension)
+	"""
+
+	hdu						= fits_tools.fits_image(FITS)
+
+	for noise in (['err', 'wht'] if NOISE == 'auto' else [NOISE]):
+
+		noise_map			= hdu.extension(noise.upper())
+
+		if noise_map is None:
+			continue
+
+		if noise			== 'wht' and hdu.wht_type() != 'IVM':
+
+			msg				= 'The WHT extension of {fits} is not an inverse-variance map (weight type: {wht_type}; IVM required, see the {keys} keywords)'.format(
+								fits=hdu.filename, wht_type=hdu.wht_type() if hdu.wht_type() != None else 'unknown', keys='/'.join(fits_tools.WHT_TYPE_KEYWORDS))
+
+			if NOISE		== 'auto':
+				print(bcolors.WARNING + msg + bcolors.ENDC)
+				continue
+
+			print(bcolors.FAIL + msg + bcolors.ENDC)
+			sys.exit()
+
+		return noise, noise_map
+
+	return None, None
+
+def hst_variance_sums(FITS, POSITIONS, RADII, NOISE='auto'):
+
+	"""
+	Sums of the per-pixel variance in circular apertures (RADII in px) from the ERR or WHT extension of an HST image
+	(see hst_noise_extension and aperture_tools.variance_sums)
+	Output: N_sources x N_radii
+	"""
+
+	noise, noise_map		= hst_noise_extension(FITS, NOISE)
+
+	if noise				== None:
+		msg					= 'No {noise} extension found in {fits}'.format(noise=NOISE.upper(), fits=fits_tools.fits_image(FITS).filename)
+		print(bcolors.FAIL + msg + bcolors.ENDC)
 		sys.exit()
 
-	effective_gain			= hdu_header['EXPTIME'] * hdu_header[key_gain]
+	return aperture_tools.variance_sums(noise_map, POSITIONS, RADII, NOISE=noise)
 
-	# Correlated noise correction factor
-	# http://www.ifa.hawaii.edu/~rgal/science/sextractor_notes.html
+def hst_chip_targets(FITS, RA, DEC):
+
+	"""
+	Locates targets (RA, DEC in degrees) on the SCI extensions (chips) of a multi-extension HST exposure with the WCS of every chip
+	FITS: filename or fits_tools.FitsImage
+	Output: filename, list of (chip, pixel positions (N x 2, 0-based), indices of the targets) of the chips that contain targets
+	(chip None: image without SCI extensions)
+	"""
+
+	hdu						= fits_tools.fits_image(FITS)
 
-	pixfrac					= hdu_header['D001PIXF']
 	try:
-		native_scale		= hst_scale(hdu_header['INSTRUME'], hdu_header['APERTURE'])
-	except:
-		native_scale		= hst_scale(hdu_header['INSTRUME'], None)
+		filename			= hdu.filename
+		chips				= hdu.sci_extensions()
+	finally:
+		if hdu is not FITS:
+			hdu.close()
 
-	scale					= PIX2ARCSEC/native_scale
+	if len(chips)			== 0:
+		chips				= [None]
 
-	fa						= pow( (scale/pixfrac) * (1.  - (scale / 3 / pixfrac)), 2) if scale < pixfrac else pow(1 - pixfrac / 3 / scale, 2)
+	ra						= np.atleast_1d(RA).astype(float)
+	dec						= np.atleast_1d(DEC).astype(float)
 
-	return aperture_photometry(hdu_data, POSITIONS, radii_px, innerannulus_px, outerannulus_px, RMS, GAIN=effective_gain, ZEROPOINT=zeropoint, FA=fa)
+	targets					= []
+
+	for chip in chips:
+
+		hdu_chip			= fits_tools.FitsImage(filename, EXTENSION=chip)
+
+		try:
+			shape			= hdu_chip.hdu.shape
+			x, y			= hdu_chip.wcs.all_world2pix(ra, dec, 0)
+		finally:
+			hdu_chip.close()
+
+		indices				= np.where((x >= -0.5) & (x < shape[1] - 0.5) & (y >= -0.5) & (y < shape[0] - 0.5))[0]
+
+		if len(indices)		> 0:
+			targets.append((chip, np.array([x[indices], y[indices]]).T, indices))
+
+	return filename, targets
+
+def hst_chip_photometry(FITS, RA, DEC, RADII, INNERANNULUS, OUTERANNULUS, RMS=None, BACKEND='photutils', NOISE='auto', FLOAT32=False, WORKERS=None):
+
+	"""
+	Aperture photometry of multi-extension HST exposures (e.g. ACS/WFC and WFC3/UVIS flc files), one SCI extension (chip) at a time.
+	The targets (RA, DEC in degrees) are located on every chip with the WCS of the chip (hst_chip_targets) and only the chips that
+	contain targets are photometered, in parallel (WORKERS processes; None: one per chip). Every chip uses its own header
+	(PHOTFLAM, PHOTMODE, gain) for the zeropoints and the noise model.
+	RADII, INNERANNULUS, OUTERANNULUS: in arcsec
+	RMS: background RMS of all chips. None: per-pixel noise from the ERR/WHT extension of the chip (NOISE, see hst_noise_extension)
+	or, if the chip has no such extension, the RMS from background()
+	Output: photometry table (one row per target and chip that contains it, in input order; with the columns RA, DEC, EXTNAME, EXTVER)
+	"""
+
+	ra						= np.atleast_1d(RA).astype(float)
+	dec						= np.atleast_1d(DEC).astype(float)
+
+	filename, targets		= hst_chip_targets(FITS, ra, dec)
+
+	tasks					= [(filename, chip, positions, indices, RADII, INNERANNULUS, OUTERANNULUS, RMS, BACKEND, NOISE, FLOAT32)
+								for chip, positions, indices in targets]
+
+	if len(tasks)			== 0:
+		msg					= 'No target is on any chip of {fits}'.format(fits=filename)
+		print(bcolors.FAIL + msg + bcolors.ENDC)
+		sys.exit()
+
+	num_missing				= len(ra) - len(np.unique(np.hstack([task[3] for task in tasks])))
+
+	if num_missing			> 0:
+		print(bcolors.WARNING + '{num} target(s) not on any chip of {fits}'.format(num=num_missing, fits=filename) + bcolors.ENDC)
+
+	if len(tasks) > 1 and (WORKERS == None or WORKERS > 1):
+
+		pool				= multiprocessing.Pool(len(tasks) if WORKERS == None else min(WORKERS, len(tasks)))
+
+		try:
+			output			= pool.map(hst_chip_photometry_chip, tasks)
+		finally:
+			pool.close()
+			pool.join()
+
+	else:
+		output				= [hst_chip_photometry_chip(task) for task in tasks]
+
+	# Merge the chips and restore the input order
+
+	phot_table				= table.vstack([x[0] for x in output])
+	indices					= np.hstack([x[1] for x in output])
+
+	phot_table['RA']		= ra[indices]
+	phot_table['DEC']		= dec[indices]
+
+	phot_table				= phot_table[np.argsort(indices, kind='stable')]
+
+	return phot_table
+
+def hst_chip_photometry_chip(TASK):
+
+	"""
+	Photometry of the targets on one chip (see hst_chip_photometry; runs in a worker process)
+	Output: photometry table, indices of the targets
+	"""
+
+	filename, chip, positions, indices, radii, innerannulus, outerannulus, rms, backend, noise, float32	= TASK
+
+	hdu						= fits_tools.FitsImage(filename, EXTENSION=chip)
+
+	try:
+		noise				= hst_noise_extension(hdu, noise)[0] if rms is None and noise != None else None
+
+		if rms is None and noise == None:
+			rms				= background(hdu.data, FLOAT32=float32)
+
+		phot_table			= hst_aperture_photometry(hdu, positions, np.asarray(radii), np.asarray(innerannulus), np.asarray(outerannulus), hdu.pix2arcsec, rms,
+												BACKEND=backend, FLOAT32=float32, NOISE=noise)
+	finally:
+		hdu.close()
+
+	phot_table['EXTNAME']	= 'PRIMARY' if chip == None else chip[0]
+	phot_table['EXTVER']	= 1 if chip == None else chip[1]
+
+	return phot_table, indices
+
+def hst_cog_photometry(FITS, POSITIONS, RADII, INNERANNULUS, OUTERANNULUS, PIX2ARCSEC, RMS, BACKEND='photutils', SUBPIXELS=5, TILESIZE=None, FLOAT32=False, NOISE=None):
+
+	"""
+	Curve-of-growth photometry of HST images: same output as hst_aperture_photometry, but the image is only read in a
+	cutout around the target(s) that contains the largest annulus (TILESIZE: tiles of the image instead, see tiled_photometry,
+	e.g. for targets far apart). With BACKEND='profile', the fluxes of all apertures and annuli are read off one cumulative
+	radial profile (pixel centres with SUBPIXELS x SUBPIXELS sampling, ~1% from the exact overlap at small radii), so the
+	number of apertures is only limited by the zeropoints (see hst_zeropoint).
+	NOISE: see hst_aperture_photometry
+	"""
+
+	hdu						= fits_tools.fits_image(FITS)
+	hdu_header, hdu_data	= hdu.header, hdu.data
+
+	radii_px				= RADII / PIX2ARCSEC
+	innerannulus_px			= INNERANNULUS / PIX2ARCSEC
+	outerannulus_px			= OUTERANNULUS / PIX2ARCSEC
+
+	zeropoint				= hst_zeropoint (hdu_header, 2*RADII)
+	effective_gain, fa		= hst_noise_model(hdu_header, PIX2ARCSEC)
+
+	positions				= np.atleast_2d(np.asarray(POSITIONS, dtype=float))
+
+	bkg_variance			= hst_variance_sums(hdu, positions, radii_px, NOISE) if NOISE != None else None
+
+	if TILESIZE				!= None:
+		return tiled_photometry(hdu_data, positions, radii_px, innerannulus_px, outerannulus_px, RMS, GAIN=effective_gain, ZEROPOINT=zeropoint, FA=fa,
+								BACKEND=BACKEND, SUBPIXELS=SUBPIXELS, TILESIZE=TILESIZE, FLOAT32=FLOAT32, BKG_VARIANCE=bkg_variance)
+
+	# Cutout (once)
+
+	halo					= int(np.ceil(max(np.max(radii_px), np.max(outerannulus_px)))) + 2
+
+	xmin					= min(max(int(np.floor(np.min(positions[:, 0]))) - halo, 0), hdu_data.shape[1])
+	xmax					= max(min(int(np.ceil(np.max(positions[:, 0]))) + halo + 1, hdu_data.shape[1]), 0)
+	ymin					= min(max(int(np.floor(np.min(positions[:, 1]))) - halo, 0), hdu_data.shape[0])
+	ymax					= max(min(int(np.ceil(np.max(positions[:, 1]))) + halo + 1, hdu_data.shape[0]), 0)
+
+	cutout					= np.array(hdu_data[ymin:ymax, xmin:xmax])
+
+	# An RMS map is cut out like the image (the positions are relative to the cutout)
+
+	rms						= np.asarray(RMS[ymin:ymax, xmin:xmax]) if np.ndim(RMS) == 2 else RMS
+
+	photometry				= aperture_photometry(cutout, positions - np.array([xmin, ymin]), radii_px, innerannulus_px, outerannulus_px, rms,
+												GAIN=effective_gain, ZEROPOINT=zeropoint, FA=fa, BACKEND=BACKEND, SUBPIXELS=SUBPIXELS, FLOAT32=FLOAT32,
+												BKG_VARIANCE=bkg_variance)
+
+	photometry['xcenter']	= positions[:, 0]
+	photometry['ycenter']	= positions[:, 1]
+
+	return photometry
 
 def hst_make_cutout(FITS, COORD_OBS, COORD_EXP, RADII, RADII_INNERANNULUS, RADII_OUTERANNULUS, PIX2ARCSEC, OUTDIR):
 
@@ -260,20 +925,17 @@ def hst_make_cutout(FITS, COORD_OBS, COORD_EXP, RADII, RADII_INNERANNULUS, RADII
 	Makes cuts outs of the aperture
 	"""
 
-	# Processing fits file
+	if not PLOTS:
+		return None
 
-	hdulist			= fits.open(FITS)
+	plot_imports()
 
-	header			= hdulist[0].header
+	# Processing fits file (FITS: filename or fits_tools.FitsImage, e.g. a chip of a multi-extension exposure)
 
-	if len(hdulist) > 1:
-		try: 
-			hdulist[1].shape
-			image	= hdulist[1].data
-		except:
-			image	= hdulist[0].data
-	else:
-		image		= hdulist[0].data
+	hdu				= fits_tools.fits_image(FITS)
+	image			= hdu.data
+
+	suffix			= '' if hdu.extension_key == None else '_' + ''.join(str(x) for x in np.atleast_1d(hdu.extension_key)).lower()
 
 	image_shape		= np.shape(image)
 
@@ -291,12 +953,12 @@ def hst_make_cutout(FITS, COORD_OBS, COORD_EXP, RADII, RADII_INNERANNULUS, RADII
 
 	image			= image[ymin:ymax, xmin:xmax]
 
-	image_temp		= image.flatten()
+	image_temp		= image.ravel()
 	image_temp		= image_temp[~np.isnan(image_temp)]
 
 	vmin			= np.array([np.percentile(image_temp, x) for x in range(50,90)])
 	vmin			= vmin[vmin > 0][5]
-	vmax			= np.percentile(image.flatten(), 99)
+	vmax			= np.percentile(image.ravel(), 99)
 
 	plt.figure(1, figsize=(np.sqrt(2) * 9,9))
 	plt.subplots_adjust(hspace=0.2, wspace=0.3)
@@ -335,17 +997,42 @@ def hst_make_cutout(FITS, COORD_OBS, COORD_EXP, RADII, RADII_INNERANNULUS, RADII
 	ax.text(right-0.05, bottom+0.125,  "\\textbf{Host centroid}", ha='right', va='bottom',		transform=ax.transAxes, color=color_green, fontsize=legend_size-4, path_effects=[PathEffects.withStroke(linewidth=6, foreground="w")])
 	ax.text(right-0.05, bottom+0.05, "\\textbf{Transient position}",   ha='right', va='bottom',	transform=ax.transAxes, color=vigit_color_1,  fontsize=legend_size-4, path_effects=[PathEffects.withStroke(linewidth=6, foreground="w")])
 
-	plt.savefig(OUTDIR + FITS.replace('.fits', '.pdf'), dpi=600)
+	plt.savefig(OUTDIR + os.path.basename(hdu.filename).replace('.fits', suffix + '.pdf'), dpi=600)
 
 	return None
 
-def hst_cog(FITS, POSITIONS, INNERANNULUS, OUTERANNULUS, PIX2ARCSEC, RMS, OUTDIR):
+def hst_cog_mc_block(TASK):
+
+	"""
+	Sigma-clipped medians of one block of Monte Carlo realisations of the curve of growth (see hst_cog)
+	"""
+
+	mags, mags_errm, mags_errp, size, rng	= TASK
+
+	return stat_tools.sigma_clipped_stats_axis(stat_tools.split_normal(mags, mags_errm, mags_errp, size, RNG=rng), AXIS=0)[1]
+
+def hst_cog(FITS, POSITIONS, INNERANNULUS, OUTERANNULUS, PIX2ARCSEC, RMS, OUTDIR, BACKEND='photutils', TILESIZE=None, FLOAT32=False, NPOINTS=20, SUBPIXELS=5, NOISE=None, SEED=None, WORKERS=1):
+
+	"""
+	Curve-of-growth analysis for NPOINTS diameters between 0.2 and 5''
+	The photometry of all diameters is done in one pass (see hst_cog_photometry; BACKEND='profile': one cumulative radial profile)
+	FITS: filename or fits_tools.FitsImage
+	NOISE: see hst_aperture_photometry
+	SEED, WORKERS: random number seed and number of processes of the Monte Carlo (see stat_tools.statNclip)
+	"""
+
+	hdu					= fits_tools.fits_image(FITS)
+
+	# Output files in OUTDIR (with the chip of a multi-extension exposure, see hst_make_cutout)
+
+	suffix				= '' if hdu.extension_key == None else '_' + ''.join(str(x) for x in np.atleast_1d(hdu.extension_key)).lower()
+	prefix				= OUTDIR + os.path.basename(hdu.filename).replace('.fits', suffix)
 
-	apertures			= np.linspace(0.2, 5, 20)
+	apertures			= np.linspace(0.2, 5, NPOINTS)
 	innerannulus		= INNERANNULUS * apertures
 	outerannulus		= OUTERANNULUS * apertures
 
-	photometry			= hst_aperture_photometry(FITS, POSITIONS, apertures / 2., innerannulus / 2., outerannulus / 2., PIX2ARCSEC, RMS)
+	photometry			= hst_cog_photometry(hdu, POSITIONS, apertures / 2., innerannulus / 2., outerannulus / 2., PIX2ARCSEC, RMS, BACKEND=BACKEND, SUBPIXELS=SUBPIXELS, TILESIZE=TILESIZE, FLOAT32=FLOAT32, NOISE=NOISE)
 
 	mags				= np.array([photometry['MAG_APER_' + str(i)] for i in range(len(apertures))])
 	mags_errp			= np.array([photometry['MAGERRP_APER_' + str(i)] for i in range(len(apertures))])
@@ -361,31 +1048,27 @@ def hst_cog(FITS, POSITIONS, INNERANNULUS, OUTERANNULUS, PIX2ARCSEC, RMS, OUTDIR
 	mags_errm_det		= mags_errm[mask_det]
 
 	cog_data			= table.Table([apertures, [np.round(x[0], 3) for x in mags], [np.round(x[0], 3) for x in mags_errp], [np.round(x[0], 3) for x in mags_errm]], names=('DIAMETER', 'MAG', 'MAGERRP', 'MAGERRM'))
-	ascii.write(cog_data, OUTDIR + FITS.replace('.fits', '_cog_data.ascii'), overwrite=True, format='no_header')
+	ascii.write(cog_data, prefix + '_cog_data.ascii', overwrite=True, format='no_header')
 	
 	# MonteCarlo
-
-	values				= []
+	# Split-normal draws of the detected apertures (N_det x niter) and the sigma-clipped median of every iteration,
+	# in blocks of iterations with independent random number streams (see stat_tools.mc_blocks)
 
 	niter				= 10000
 
-	for i in range(len(mags_det)):
-
-		u 				= np.random.uniform(size = niter)
-		v 				= np.where(u < 0.5, stats_scipy.norm.ppf(u, mags_det[i], mags_errm_det[i]),
-							stats_scipy.norm.ppf(u, mags_det[i], mags_errp_det[i]))
-
-		values.append(v)
-
-	values				= np.array(values)
-
-	cog_stats			= [stats.sigma_clipped_stats(values[:,i])[1] for i in range(values.shape[1])]
+	tasks				= [(mags_det[:, 0], mags_errm_det[:, 0], mags_errp_det[:, 0], size, rng) for size, rng in stat_tools.mc_blocks(niter, len(mags_det), SEED)]
+	cog_stats			= np.hstack(stat_tools.mc_map(hst_cog_mc_block, tasks, WORKERS))
 
 	cog_stats_table		= table.Table(np.array([np.mean(cog_stats), np.median(cog_stats), np.std(cog_stats), niter]), names=('MEAN', 'MEDIAN', 'STD', 'NITER'))
-	ascii.write(cog_stats_table, OUTDIR + FITS.replace('.fits', '_cog_stat.ascii'), overwrite=True)
+	ascii.write(cog_stats_table, prefix + '_cog_stat.ascii', overwrite=True)
 
 	# Plot
 
+	if not PLOTS:
+		return None
+
+	plot_imports()
+
 	plt.figure(2)
 	ax					= plt.subplot(111)
 
@@ -406,7 +1089,7 @@ def hst_cog(FITS, POSITIONS, INNERANNULUS, OUTERANNULUS, PIX2ARCSEC, RMS, OUTDIR
 	ax.set_xlim(0, apertures[-1])
 	ax.set_ylim(max([photometry['MAG_APER_' + str(i)] for i in range(len(apertures))]), min([photometry['MAG_APER_' + str(i)] for i in range(len(apertures))]) - 0.5)
 
-	plt.savefig(OUTDIR + FITS.replace('.fits', '_cog.pdf'))
+	plt.savefig(prefix + '_cog.pdf')
 	
 	return None
 
@@ -445,10 +1128,163 @@ def hst_scale(INSTRUMENT, MODE):
 			print(bcolors.FAIL + 'MODE {mode} not recognised for {instrument}'.format(mode=MODE, instrument=INSTRUMENT) + bcolors.ENDC)
 			sys.exit()
 
-def hst_zeropoint (HEADER, DIAMETER):
+def hst_aperture_correction(OBSMODES, DIAMETER, TEMPERATURE=10000, CACHE_DIR=APCORR_CACHE_DIR):
+
+	"""
+	Aperture correction (count rate within DIAMETER / count rate within 4'') of a black body with PySynphot.
+	OBSMODES: observation modes with an '{aperture:.2f}' placeholder, tried in order
+	The result is cached on disk (cache_tools), keyed by the observation mode (i.e. the diameter rounded to pysynphot's
+	precision of 0.01''), the reference observation mode and the spectrum, and shared by all runs and processes.
+	Observation modes that pysynphot cannot parse (ValueError or pysynphot error) are skipped for the rest of the process;
+	they are not cached on disk and other errors (e.g. missing CDBS files) are raised. Without pysynphot, the first cached
+	observation mode is used.
+	"""
+
+	obsmodes				= [(x.format(aperture=DIAMETER), x.format(aperture=4.0)) for x in OBSMODES]
+	keys					= [cache_tools.cache_key('apcorr', obsmode, obsmode_ref, 'BlackBody({})'.format(TEMPERATURE)) for obsmode, obsmode_ref in obsmodes]
+
+	entries					= [cache_tools.cache_load(CACHE_DIR, key) if CACHE_DIR != None else None for key in keys]
+
+	for i in range(len(obsmodes)):
+
+		obsmode, obsmode_ref	= obsmodes[i]
+
+		if entries[i]		!= None and np.isfinite(entries[i]['ap_correction']):
+			return float(entries[i]['ap_correction'])
+
+		if pyS				is None or keys[i] in apcorr_failed:
+			continue
+
+		# Fall back to the next observation mode if pysynphot cannot parse this one
+
+		try:
+			spec_bb			= pyS.BlackBody(TEMPERATURE)
+			ap_correction	= pyS.Observation(spec_bb, pyS.ObsBandpass(obsmode)).countrate() / pyS.Observation(spec_bb, pyS.ObsBandpass(obsmode_ref)).countrate()
+		except PYSYNPHOT_OBSMODE_ERRORS as e:
+			print(bcolors.WARNING + 'pysynphot cannot parse the observation mode {obsmode}: {error}'.format(obsmode=obsmode, error=e) + bcolors.ENDC)
+			apcorr_failed.add(keys[i])
+			continue
+
+		if CACHE_DIR		!= None:
+			cache_tools.cache_save(CACHE_DIR, keys[i], CACHE_SIZE=APCORR_CACHE_SIZE, ap_correction=ap_correction)
+
+		return ap_correction
+
+	if pyS					is None:
+		msg					= 'Aperture correction of {obsmode} is not tabulated and pysynphot is not installed. Build the table with build_apcorr_table.py.'.format(obsmode=' or '.join([x[0] for x in obsmodes]))
+	else:
+		msg					= 'Aperture correction of {obsmode}: pysynphot cannot parse any of the observation modes.'.format(obsmode=' or '.join([x[0] for x in obsmodes]))
+
+	print(bcolors.FAIL + msg + bcolors.ENDC)
+	sys.exit()
+
+def hst_obsmode_key(OBSMODE):
+
+	"""
+	Normalised observation mode (lower case, without aperture and MJD) and MJD (None if not part of the mode)
+	"""
+
+	components				= [x.strip().lower() for x in OBSMODE.replace(' ', ',').split(',') if x.strip() != '']
+
+	mjd						= [float(x.split('#')[1]) for x in components if x.startswith('mjd#')]
+	obsmode					= ','.join([x for x in components if not x.startswith('mjd#') and not x.startswith('aper#')])
+
+	return obsmode, mjd[0] if len(mjd) > 0 else None
+
+def hst_apcorr_table(OBSMODES, FILENAME=APCORR_TABLE, MJD_BINS=None, DIAMETERS=None, CACHE_DIR=APCORR_CACHE_DIR):
+
+	"""
+	Build step of the precomputed aperture corrections: dense encircled-energy curves (aperture correction relative
+	to 4'') for a list of observation modes (e.g. 'wfc3,uvis2,f814w'), computed with PySynphot and saved as a FITS table.
+	MJD_BINS: bin edges in MJD for time-dependent modes. Each bin is computed at its centre and used for observations within the bin
+	(MJD_MIN = MJD_MAX = 0: no time dependence).
+	DIAMETERS: diameter grid in arcsec (default: 0.01-4'' in steps of 0.01'', i.e. pysynphot's precision)
+	"""
+
+	if DIAMETERS			is None:
+		DIAMETERS			= np.round(np.arange(1, 401) * 0.01, 2)
+
+	if MJD_BINS				is None:
+		mjd_bins			= [(0., 0.)]
+	else:
+		mjd_bins			= list(zip(MJD_BINS[:-1], MJD_BINS[1:]))
+
+	rows					= []
+
+	for obsmode in OBSMODES:
+
+		obsmode				= hst_obsmode_key(obsmode)[0]
+
+		for mjd_min, mjd_max in mjd_bins:
+
+			if mjd_max		== 0:
+				template	= obsmode + ',aper#{aperture:.2f}'
+			else:
+				template	= obsmode + ',mjd#{mjd:.1f},aper#{{aperture:.2f}}'.format(mjd=(mjd_min + mjd_max) / 2.)
+
+			ap_correction	= [hst_aperture_correction([template], x, CACHE_DIR=CACHE_DIR) if x < 4. else 1. for x in DIAMETERS]
+
+			rows.append([obsmode, mjd_min, mjd_max, np.array(DIAMETERS, dtype=float), np.array(ap_correction)])
+
+	apcorr_table			= table.Table(rows=rows, names=('OBSMODE', 'MJD_MIN', 'MJD_MAX', 'DIAMETER', 'APCORR'))
+
+	# Add to an existing table (new rows replace rows of the same observation mode and MJD bin)
+
+	if os.path.exists(FILENAME):
+		apcorr_table_old	= table.Table.read(FILENAME)
+		obsmodes_old		= np.asarray(apcorr_table_old['OBSMODE']).astype(str)
+		keys				= set([(x['OBSMODE'], x['MJD_MIN']) for x in apcorr_table])
+		mask				= [(obsmodes_old[i], apcorr_table_old['MJD_MIN'][i]) not in keys for i in range(len(apcorr_table_old))]
+		apcorr_table		= table.vstack([apcorr_table_old[mask], apcorr_table])
+
+	apcorr_table.write(FILENAME, overwrite=True)
+	apcorr_tables.pop(FILENAME, None)
+
+	return apcorr_table
+
+def hst_apcorr_interpolate(OBSMODES, DIAMETER, TABLE=APCORR_TABLE):
+
+	"""
+	Aperture corrections for a vector of diameters, interpolated from the precomputed table (see hst_apcorr_table).
+	OBSMODES: observation modes (see hst_aperture_correction), tried in order
+	Output: aperture corrections (None if none of the observation modes is tabulated)
+	"""
+
+	if TABLE				is None or not os.path.exists(TABLE):
+		return None
+
+	if TABLE				not in apcorr_tables:
+		apcorr_tables[TABLE]	= table.Table.read(TABLE)
+
+	apcorr_table			= apcorr_tables[TABLE]
+
+	for obsmode in OBSMODES:
+
+		obsmode, mjd		= hst_obsmode_key(obsmode.format(aperture=4.0))
+
+		mask				= np.asarray(apcorr_table['OBSMODE']).astype(str) == obsmode
+		mjd_min				= np.asarray(apcorr_table['MJD_MIN'])
+		mjd_max				= np.asarray(apcorr_table['MJD_MAX'])
+
+		# MJD bin that contains the observation, otherwise the time-independent curve
+
+		if mjd				!= None and (mask & (mjd_min <= mjd) & (mjd_max > mjd)).any():
+			mask			&= (mjd_min <= mjd) & (mjd_max > mjd)
+		else:
+			mask			&= mjd_max == 0
+
+		if mask.any():
+			row				= apcorr_table[np.where(mask)[0][0]]
+			return np.where(np.asarray(DIAMETER) < 4., np.interp(DIAMETER, row['DIAMETER'], row['APCORR']), 1.)
+
+	return None
+
+def hst_zeropoint (HEADER, DIAMETER, CACHE_DIR=APCORR_CACHE_DIR, TABLE=APCORR_TABLE):
 
 	"""
 	Extracts the zeropoint from the fits header and computes the aperture correction with PySynphot.
+	CACHE_DIR: directory of the persistent cache of the aperture corrections (see hst_aperture_correction; None: no cache)
+	TABLE: table of precomputed aperture corrections (see hst_apcorr_table; None: always use PySynphot)
 	"""
 
 	zeropoints				= -2.5 * np.log10( HEADER['PHOTFLAM'] ) - 5 * np.log10(HEADER['PHOTPLAM']) - 2.408
@@ -462,8 +1298,6 @@ def hst_zeropoint (HEADER, DIAMETER):
 	#     = -2.5 * log10(F) + ZP - 2.5 * log10(correction_inf) 
 	# correction_inf == flux ratio between an aperture with a given finite diameter and an aperture with an infinite diameter
 
-	spec_bb					= pyS.BlackBody(10000)
-
 	try:
 		filter				= HEADER['FILTER1'] if 'CLEAR' in HEADER['FILTER2'] else HEADER['FILTER2']
 	except:
@@ -476,42 +1310,37 @@ def hst_zeropoint (HEADER, DIAMETER):
 
 	if HEADER['INSTRUME'].upper() not in ['WFPC2', 'NICMOS']:
 
-		try:
-			bandprops			= [pyS.ObsBandpass('{photmode},aper#{aperture:.2f}'.format(
-													aperture=x,
-													photmode=HEADER['PHOTMODE'].replace(' ', ','),
-													))
-													for x in DIAMETER]
+		# Observation modes (PHOTMODE, or instrument/detector/filter/MJD if PHOTMODE is not available)
 
-			bandprops_ref		= pyS.ObsBandpass('{photmode},aper#{aperture:.2f}'.format(
-													aperture=4.0,
-													photmode=HEADER['PHOTMODE'].replace(' ', ',')
-													))
-		except:
-			bandprops			= [pyS.ObsBandpass('{instrument},{detector},{filter},mjd#{mjd},aper#{aperture:.2f}'.format(
-													aperture=x,
-													detector=HEADER['APERTURE'],
-													filter=filter,
-													instrument=HEADER['INSTRUME'],
-													mjd=int(time.Time(HEADER['DATE-OBS'], format='isot', scale='utc').jd)
-													))
-													for x in DIAMETER]
+		obsmodes			= []
+
+		if 'PHOTMODE' in HEADER.keys():
+			obsmodes.append('{photmode},aper#{{aperture:.2f}}'.format(photmode=HEADER['PHOTMODE'].replace(' ', ',')))
 
-			bandprops_ref		= pyS.ObsBandpass('{instrument},{detector},{filter},mjd#{mjd},aper#{aperture:.2f}'.format(
-													aperture=4.0,
+		try:
+			obsmodes.append('{instrument},{detector},{filter},mjd#{mjd},aper#{{aperture:.2f}}'.format(
 													detector=HEADER['APERTURE'],
 													filter=filter,
 													instrument=HEADER['INSTRUME'],
-													mjd=int(time.Time(HEADER['DATE-OBS'], format='isot', scale='utc').jd)
+													mjd=int(time.Time(HEADER['DATE-OBS'], format='isot', scale='utc').mjd)
 													))
+		except:
+			if len(obsmodes) == 0:
+				raise
 
-		ap_correction			= np.ones(len(DIAMETER))*1.0
+		# Interpolate the precomputed table. PySynphot is only needed for observation modes that are not tabulated
 
-		for i in range(len(DIAMETER)):
-			if DIAMETER[i] < 4.:
-				ap_correction[i]= pyS.Observation(spec_bb, bandprops[i]).countrate() / pyS.Observation(spec_bb, bandprops_ref).countrate()
-			else:
-				ap_correction[i]= 1
+		ap_correction			= hst_apcorr_interpolate(obsmodes, DIAMETER, TABLE=TABLE)
+
+		if ap_correction is None:
+
+			ap_correction		= np.ones(len(DIAMETER))*1.0
+
+			for i in range(len(DIAMETER)):
+				if DIAMETER[i] < 4.:
+					ap_correction[i]= hst_aperture_correction(obsmodes, DIAMETER[i], CACHE_DIR=CACHE_DIR)
+				else:
+					ap_correction[i]= 1
 
 	elif HEADER['INSTRUME'].upper() in ['WFPC2', 'NICMOS']:
 
@@ -535,10 +1364,16 @@ def hst_zeropoint (HEADER, DIAMETER):
 
 	return zeropoints - ap_correction_mag
 
-def local_sequence(CAT, AUTO=False, FILENAME=None, FITS='', LOGGER=None, LOWER=10, PATH='', UPPER=90):
+def local_sequence(CAT, AUTO=False, FILENAME=None, FITS='', LOGGER=None, LOWER=10, PATH='', UPPER=90, MAG_BRIGHT=None, MAG_FAINT=None, CUTS=LOCAL_SEQUENCE_CUTS, INTERACTIVE=None):
 
 	"""
 	Select stars for local sequence
+	The stars are selected in instrumental magnitude:
+	AUTO: range of the telescope and filter of FITS in the data file CUTS (see local_sequence_cuts)
+	MAG_BRIGHT, MAG_FAINT: given range
+	otherwise: LOWER and UPPER percentiles (all stars for 0 and 100), which can be changed on the terminal (INTERACTIVE)
+	INTERACTIVE: ask for magnitude cuts on the terminal (default: if the input is a terminal and not in a worker process)
+	The offset between the instrumental and apparent magnitudes is the weighted mean (see local_sequence_offset).
 	"""
 
 	if FILENAME				== None:
@@ -546,352 +1381,214 @@ def local_sequence(CAT, AUTO=False, FILENAME=None, FITS='', LOGGER=None, LOWER=1
 		print(bcolors.FAIL + 'Filename of the local sequence not specified' + bcolors.ENDC)
 		sys.exit()
 
-	# Image cuts
-
-	instrument_settings		= table.Table(names=('TELESCOPE', 'FILTER', 'MAG_BRIGHT', 'MAG_FAINT'), dtype=('S100', 'S100', 'f', 'f'))
-	instrument_settings.add_row(['PanSTARRS', 'g', -18, -13])
-	instrument_settings.add_row(['PanSTARRS', 'r', -18, -13])
-	instrument_settings.add_row(['PanSTARRS', 'i', -18, -13])
-	instrument_settings.add_row(['PanSTARRS', 'z', -18, -12])
-	instrument_settings.add_row(['PanSTARRS', 'y', -18, -12])
-	instrument_settings.add_row(['2MASS', 'J', -10, -6])
-	instrument_settings.add_row(['2MASS', 'H', -10, -6])
-	instrument_settings.add_row(['2MASS', 'K', -10, -6.5])
-	instrument_settings.add_row(['UKIDSS', 'J', -16, -11])
-	instrument_settings.add_row(['UKIDSS', 'H', -16, -11])
-	instrument_settings.add_row(['UKIDSS', 'K', -16, -11])
-	instrument_settings.add_row(['UKIDSS', 'Y', -16, -8])
-	instrument_settings.add_row(['SDSS', 'u', -7, -3])
-	instrument_settings.add_row(['SDSS', 'g', -10, -3])
-	instrument_settings.add_row(['SDSS', 'r', -10, -3])
-	instrument_settings.add_row(['SDSS', 'i', -10, -4])
-	instrument_settings.add_row(['SDSS', 'z', -10, -4])
-
-	if AUTO:
-
-		instrument_telescope= FITS.split('_')[1]
-		instrument_filter	= [x for x in FITS.replace('.fits', '').split('_') if len(x) == 1][0]
-
-		auto_mag_bright		= instrument_settings['MAG_BRIGHT'][(instrument_telescope == instrument_settings['TELESCOPE']) & (instrument_filter == instrument_settings['FILTER'])][0]
-		auto_mag_faint		= instrument_settings['MAG_FAINT'] [(instrument_telescope == instrument_settings['TELESCOPE']) & (instrument_filter == instrument_settings['FILTER'])][0]
-
-		print(bcolors.OKGREEN + 'Lower: ' + str(np.round(auto_mag_bright, 2)) + bcolors.ENDC)
-		print(bcolors.OKGREEN + 'Upper: ' + str(np.round(auto_mag_faint,  2)) + bcolors.ENDC)
-
-		mask_good			= np.where((auto_mag_bright <= CAT['MAG_INS']) & (CAT['MAG_INS'] <= auto_mag_faint))[0]
-
-		LOGGER.info('Magnitude range: {magbright:.2f} - {magfaint:.2f}'.format(magbright=auto_mag_bright, magfaint=auto_mag_faint))
+	if INTERACTIVE			== None:
+		INTERACTIVE			= sys.stdin is not None and sys.stdin.isatty() and not multiprocessing.current_process().daemon
 
-		print(bcolors.OKGREEN + 'Number of stars: ' + str(len(mask_good)) + '\n' + bcolors.ENDC)
+	mag_ins					= np.asarray(CAT['MAG_INS'], dtype=float)
 
-		data_x				= CAT['MAG_INS'][mask_good]
-		data_y				= CAT['MAG_CAT'][mask_good]
-		data_y_err			= CAT['MAGERR_CAT'][mask_good]
-
-		if all(CAT['MAGERR_CAT']) != 0:
-			pinit			= 0
-			fitfunc			= lambda p, x: p + x
-			errfunc			= lambda p, x, y, err: (y - fitfunc(p, x)) / err
-			out				= optimize.leastsq(errfunc, pinit,args=(data_x, data_y, data_y_err), full_output=True)
-
-		else:
-			pinit			= 0
-			fitfunc			= lambda p, x: p + x
-			errfunc			= lambda p, x, y: (y - fitfunc(p, x))
-			out				= optimize.leastsq(errfunc, pinit,args=(data_x, data_y), full_output=True)
-
-		pfinal				= out[0]
-		cont_direct			= pfinal[0]
-
-		# Diagnostic plot: instrumental vs. apparent magnitude
-
-		print(bcolors.OKGREEN + '\nGenerate diagnostic plot to remove stars' + bcolors.ENDC)
+	# Image cuts
 
-		plt.figure(2, figsize=(9*np.sqrt(2.),9))
+	if AUTO:
 
-		loc_ax				= plt.subplot(111)
-		loc_ax.plot(np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), cont_direct + np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), lw=20, color=vigit_color_12, alpha=0.25, zorder=0)
-		loc_ax.plot(np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), cont_direct + np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), lw=2, color=vigit_color_12, zorder=1)
+		mag_bright, mag_faint	= local_sequence_cuts(FITS, CUTS)
 
-		loc_ax.errorbar(CAT['MAG_INS'], CAT['MAG_CAT'], CAT['MAGERR_CAT'], CAT['MAGERR_INS'], lw=0, ms=10, marker='o', color='0.75', elinewidth=2, capsize=0, zorder=2)
-		loc_ax.errorbar(CAT['MAG_INS'][mask_good], CAT['MAG_CAT'][mask_good], CAT['MAGERR_CAT'][mask_good], CAT['MAGERR_INS'][mask_good], lw=0, ms=10, marker='o', color='k', elinewidth=2, capsize=0, zorder=3)
+		print(bcolors.OKGREEN + 'Lower: ' + str(np.round(mag_bright, 2)) + bcolors.ENDC)
+		print(bcolors.OKGREEN + 'Upper: ' + str(np.round(mag_faint,  2)) + bcolors.ENDC)
 
-		loc_ax.axvline(auto_mag_bright, color='k', ls='--', zorder=4)
-		loc_ax.axvline(auto_mag_faint, color='k', ls='--', zorder=4)
+	elif MAG_BRIGHT != None and MAG_FAINT != None:
 
-		loc_ax.set_xlabel("Instrumental magnitude (mag)")
-		loc_ax.set_ylabel("Apparent magnitude (mag)")
+		mag_bright, mag_faint	= MAG_BRIGHT, MAG_FAINT
 
-		if len(CAT['MAG_CAT']) > 1:
-			loc_ax.set_xlim(min(CAT['MAG_INS'])-0.2, min(max(CAT['MAG_INS']), 0)+0.2)
-			loc_ax.set_ylim(min(CAT['MAG_CAT'])-0.2, max(CAT['MAG_CAT'])+0.2)
-		else:
-			loc_ax.set_xlim(CAT['MAG_INS']-0.2, CAT['MAG_INS']+0.2)
-			loc_ax.set_ylim(CAT['MAG_CAT']-0.2, CAT['MAG_CAT']+0.2)
+	elif (LOWER == 0. and UPPER == 100) or len(mag_ins) <= 10:
 
-		loc_ax.grid(True)
-		plt.savefig(PATH+FITS.replace('.fits', '_std.pdf'), dpi=600)
-		plt.close()
+		mag_bright, mag_faint	= None, None
 
-		ascii.write(np.array([CAT['XWIN_IMAGE'][mask_good], CAT['YWIN_IMAGE'][mask_good],
-			CAT['ALPHAWIN_J2000'][mask_good], CAT['DELTAWIN_J2000'][mask_good],
-			CAT['MAG_CAT'][mask_good], CAT['MAGERR_CAT'][mask_good]]).T,
-			FILENAME,
-			names=['XWIN_IMAGE', 'YWIN_IMAGE', 'ALPHAWIN_J2000', 'DELTAWIN_J2000', 'MAG', 'MAG_ERR'], overwrite=True)
+	else:
 
-	elif (LOWER == 0. and UPPER == 100):
+		mag_bright, mag_faint	= np.percentile(mag_ins, [LOWER, UPPER])
 
-		data_x				= CAT['MAG_INS']
-		data_y				= CAT['MAG_CAT']
-		data_y_err			= CAT['MAGERR_CAT']
+	mask_good				= local_sequence_mask(mag_ins, mag_bright, mag_faint)
 
-		if all(CAT['MAGERR_CAT']) != 0:
-			pinit			= 0
-			fitfunc			= lambda p, x: p + x
-			errfunc			= lambda p, x, y, err: (y - fitfunc(p, x)) / err
-			out				= optimize.leastsq(errfunc, pinit,args=(data_x, data_y, data_y_err), full_output=True)
+	if AUTO:
+		print(bcolors.OKGREEN + 'Number of stars: ' + str(np.sum(mask_good)) + '\n' + bcolors.ENDC)
 
-		else:
-			pinit			= 0
-			fitfunc			= lambda p, x: p + x
-			errfunc			= lambda p, x, y: (y - fitfunc(p, x))
-			out				= optimize.leastsq(errfunc, pinit,args=(data_x, data_y), full_output=True)
+	# Diagnostic plot: instrumental vs. apparent magnitude
 
-		pfinal				= out[0]
-		cont_direct			= pfinal[0]
+	print(bcolors.OKGREEN + '\nGenerate diagnostic plot to remove stars' + bcolors.ENDC)
 
-		# Diagnostic plot: instrumental vs. apparent magnitude
+	interactive				= INTERACTIVE and not AUTO and (MAG_BRIGHT == None or MAG_FAINT == None) and not (LOWER == 0. and UPPER == 100)
 
-		print(bcolors.OKGREEN + '\nGenerate diagnostic plot to remove stars' + bcolors.ENDC)
+	local_sequence_plot(CAT, mask_good, local_sequence_offset(CAT, mask_good), mag_bright, mag_faint, FITS=FITS, PATH=PATH, SHOW=interactive)
 
-		plt.figure(2, figsize=(9*np.sqrt(2.),9))
+	local_sequence_write(CAT, mask_good, FILENAME)
 
-		loc_ax				= plt.subplot(111)
-		loc_ax.plot(np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), cont_direct + np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), lw=20, color=vigit_color_12, alpha=0.25, zorder=0)
-		loc_ax.plot(np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), cont_direct + np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), lw=2, color=vigit_color_12, zorder=1)
+	# Apply magnitude cuts
 
-		loc_ax.errorbar(CAT['MAG_INS'], CAT['MAG_CAT'], CAT['MAGERR_CAT'], CAT['MAGERR_INS'], lw=0, ms=10, marker='o', color='k', elinewidth=2, capsize=0, zorder=3)
+	if interactive:
 
-		loc_ax.set_xlabel("Instrumental magnitude (mag)")
-		loc_ax.set_ylabel("Apparent magnitude (mag)")
+		print('Current magnitude cuts:')
 
-		if len(CAT['MAG_CAT']) > 1:
-			loc_ax.set_xlim(min(CAT['MAG_INS'])-0.2, min(max(CAT['MAG_INS']), 0)+0.2)
-			loc_ax.set_ylim(min(CAT['MAG_CAT'])-0.2, max(CAT['MAG_CAT'])+0.2)
+		if mag_bright		!= None:
+			print('Lower: ' + str(np.round(mag_bright, 2)))
+			print('Upper: ' + str(np.round(mag_faint, 2)))
 		else:
-			loc_ax.set_xlim(CAT['MAG_INS']-0.2, CAT['MAG_INS']+0.2)
-			loc_ax.set_ylim(CAT['MAG_CAT']-0.2, CAT['MAG_CAT']+0.2)
-
-		loc_ax.grid(True)
-		plt.savefig(PATH+FITS.replace('.fits', '_std.pdf'), dpi=600)
-		plt.close()
-
-		ascii.write(np.array([CAT['XWIN_IMAGE'], CAT['YWIN_IMAGE'],
-			CAT['ALPHAWIN_J2000'], CAT['DELTAWIN_J2000'],
-			CAT['MAG_CAT'], CAT['MAGERR_CAT']]).T,
-			FILENAME,
-			names=['XWIN_IMAGE', 'YWIN_IMAGE', 'ALPHAWIN_J2000', 'DELTAWIN_J2000', 'MAG', 'MAG_ERR'], overwrite=True)
-
-	else:
-		# Manual
+			print('Lower: not defined')
+			print('Upper: not defined')
 
-		if len(CAT['MAG_INS']) > 10:
-			mask_good		= np.where((np.percentile(CAT['MAG_INS'], LOWER) <= CAT['MAG_INS']) & (CAT['MAG_INS'] <= np.percentile(CAT['MAG_INS'], UPPER)))[0]
-		else:
-			mask_good		= np.where((np.percentile(CAT['MAG_INS'], 0)  <= CAT['MAG_INS']) & (CAT['MAG_INS'] <= np.percentile(CAT['MAG_INS'], 100)))[0]
+		flag_loop			= input(bcolors.BOLD + bcolors.OKBLUE + '\nWould you like to apply a magnitude cut? [y|[n]] ' + bcolors.ENDC)
 
-		data_x				= CAT['MAG_INS'][mask_good]
-		data_y				= CAT['MAG_CAT'][mask_good]
-		data_y_err			= CAT['MAGERR_CAT'][mask_good]
+		while flag_loop		== 'y':
 
-		if all(CAT['MAGERR_CAT']) != 0:
-			pinit			= 0
-			fitfunc			= lambda p, x: p + x
-			errfunc			= lambda p, x, y, err: (y - fitfunc(p, x)) / err
-			out				= optimize.leastsq(errfunc, pinit,args=(data_x, data_y, data_y_err), full_output=True)
+			mag_bright		= float(input(bcolors.WARNING  + 'Limit for the bright stars: ' + bcolors.ENDC))
+			mag_faint		= float(input(bcolors.WARNING  + 'Limit for the faint stars: '  + bcolors.ENDC))
 
-		else:
-			pinit			= 0
-			fitfunc			= lambda p, x: p + x
-			errfunc			= lambda p, x, y: (y - fitfunc(p, x))
-			out				= optimize.leastsq(errfunc, pinit,args=(data_x, data_y), full_output=True)
+			mask_good		= local_sequence_mask(mag_ins, mag_bright, mag_faint)
 
-		pfinal				= out[0]
-		cont_direct			= pfinal[0]
+			print(bcolors.OKGREEN + '\nNumber of stars: ' + str(np.sum(mask_good)) + '\n' + bcolors.ENDC)
 
-		# Diagnostic plot: instrumental vs. apparent magnitude
+			local_sequence_plot(CAT, mask_good, local_sequence_offset(CAT, mask_good), mag_bright, mag_faint, FITS=FITS, PATH=PATH, SHOW=True, ZOOM=True)
 
-		print(bcolors.HEADER + '\nGenerate diagnostic plot to remove stars' + bcolors.ENDC)
+			local_sequence_write(CAT, mask_good, FILENAME)
 
-		plt.figure(2, figsize=(9*np.sqrt(2.),9))
+			flag_loop		= input(bcolors.BOLD + bcolors.WARNING + 'Would you like to change the cuts? [y|[n]] ' + bcolors.ENDC)
 
-		loc_ax				= plt.subplot(111)
-		loc_ax.plot(np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), cont_direct + np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), lw=20, color=vigit_color_12, alpha=0.25, zorder=0)
-		loc_ax.plot(np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), cont_direct + np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), lw=2, color=vigit_color_12, zorder=1)
+	if mag_bright			!= None:
+		LOGGER.info('Magnitude range: {magbright:.2f} - {magfaint:.2f}'.format(magbright=mag_bright, magfaint=mag_faint))
+	elif len(mag_ins)		> 0:
+		LOGGER.info('Magnitude range: {magbright:.2f} - {magfaint:.2f}'.format(magbright=min(mag_ins), magfaint=max(mag_ins)))
 
-		loc_ax.errorbar(CAT['MAG_INS'], CAT['MAG_CAT'], CAT['MAGERR_CAT'], CAT['MAGERR_INS'], lw=0, ms=10, marker='o', color='0.75', elinewidth=2, capsize=0, zorder=2)
-		loc_ax.errorbar(CAT['MAG_INS'][mask_good], CAT['MAG_CAT'][mask_good], CAT['MAGERR_CAT'][mask_good], CAT['MAGERR_INS'][mask_good], lw=0, ms=10, marker='o', color='k', elinewidth=2, capsize=0, zorder=3)
+	# In automatic mode, the cuts only define the stars of the local sequence file (the full catalogue is returned, even if
+	# no star is within the cuts)
 
-		if len(CAT['MAG_INS']) > 10:
-			loc_ax.axvline(np.percentile(CAT['MAG_INS'], LOWER), color='k', ls='--', zorder=4)
-			loc_ax.axvline(np.percentile(CAT['MAG_INS'], UPPER), color='k', ls='--', zorder=4)
+	if AUTO:
+		return {'NUMSTARS': len(CAT), 'CAT': CAT}
 
-		loc_ax.set_xlabel("Instrumental magnitude (mag)")
-		loc_ax.set_ylabel("Apparent magnitude (mag)")
+	if np.sum(mask_good)	== 0:
+		print(bcolors.FAIL + 'There is no star in the cleaned catalog. Check your input parameters.' + bcolors.ENDC)
+		sys.exit()
 
-		if len(CAT['MAG_CAT']) > 1:
-			loc_ax.set_xlim(min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2)
-			loc_ax.set_ylim(min(CAT['MAG_CAT'])-0.2, max(CAT['MAG_CAT'])+0.2)
-		else:
-			loc_ax.set_xlim(CAT['MAG_INS']-0.2, CAT['MAG_INS']+0.2)
-			loc_ax.set_ylim(CAT['MAG_CAT']-0.2, CAT['MAG_CAT']+0.2)
+	return {'NUMSTARS': int(np.sum(mask_good)), 'CAT': CAT[mask_good]}
 
-		loc_ax.grid(True)
-		plt.savefig(PATH+FITS.replace('.fits', '_std.pdf'), dpi=600)
+def local_sequence_cuts(FITS, FILENAME=LOCAL_SEQUENCE_CUTS):
 
-		plt.show()
-		plt.close()
+	"""
+	Instrumental magnitude range of the local sequence in automatic mode from the data file FILENAME
+	(columns TELESCOPE, FILTER, MAG_BRIGHT, MAG_FAINT). The telescope and filter are taken from the filename
+	of the image (<name>_<TELESCOPE>_<FILTER>.fits).
+	Output: MAG_BRIGHT, MAG_FAINT
+	"""
 
-		# Apply magnitude cuts
+	if FILENAME not in local_sequence_tables:
+		local_sequence_tables[FILENAME]	= ascii.read(FILENAME, format='basic', converters={key: [ascii.convert_numpy(str)] for key in ['TELESCOPE', 'FILTER']})
 
-		print('Current magnitude cuts:')
+	cuts					= local_sequence_tables[FILENAME]
 
-		if len(CAT['MAG_INS']) > 10:
-			print('Lower: ' + str(np.round(np.percentile(CAT['MAG_INS'], LOWER), 2)))
-			print('Upper: ' + str(np.round(np.percentile(CAT['MAG_INS'], UPPER), 2)))
-		else:
-			print('Lower: not defined')
-			print('Upper: not defined')
+	instrument_telescope	= os.path.basename(FITS).split('_')[1] if len(os.path.basename(FITS).split('_')) > 1 else ''
+	instrument_filter		= ([x for x in os.path.basename(FITS).replace('.fits', '').split('_') if len(x) == 1] + [''])[0]
 
-		if sys.version_info[0] == 2:
-			var1			= raw_input(bcolors.BOLD + bcolors.OKBLUE + '\nWould you like to apply a magnitude cut? [y|[n]] ' + bcolors.ENDC)
-		elif sys.version_info[0] == 3:
-			var1			= input(bcolors.BOLD + bcolors.OKBLUE + '\nWould you like to apply a magnitude cut? [y|[n]] ' + bcolors.ENDC)
-		else:
-			print(bcolors.FAIL + bcolors.BOLD + 'Programme requires either Python 2 or 3.' + bcolors.ENDC)
-			sys.exit()
+	mask					= np.where((cuts['TELESCOPE'] == instrument_telescope) & (cuts['FILTER'] == instrument_filter))[0]
 
-		flag_loop			= var1
+	if len(mask)			== 0:
+		msg					= 'No magnitude cuts for telescope \'{telescope}\' and filter \'{filter}\' in {filename}'.format(telescope=instrument_telescope, filter=instrument_filter, filename=FILENAME)
+		print(bcolors.FAIL + msg + bcolors.ENDC)
+		sys.exit()
 
-		CAT_CLEANED			= []
+	return float(cuts['MAG_BRIGHT'][mask[0]]), float(cuts['MAG_FAINT'][mask[0]])
 
-		if flag_loop != 'y':
-			matched_catalog_cleaned	= CAT[mask_good]
-			ascii.write(np.array([matched_catalog_cleaned['XWIN_IMAGE'], matched_catalog_cleaned['YWIN_IMAGE'],
-				matched_catalog_cleaned['ALPHAWIN_J2000'], matched_catalog_cleaned['DELTAWIN_J2000'],
-				matched_catalog_cleaned['MAG_CAT'], matched_catalog_cleaned['MAGERR_CAT']]).T,
-				FILENAME,
-				names=['XWIN_IMAGE', 'YWIN_IMAGE', 'ALPHAWIN_J2000', 'DELTAWIN_J2000', 'MAG', 'MAG_ERR'], overwrite=True)
+def local_sequence_mask(MAG_INS, MAG_BRIGHT=None, MAG_FAINT=None):
 
-		while(flag_loop is 'y'):
+	"""
+	Boolean mask of the stars between MAG_BRIGHT and MAG_FAINT (all stars if the range is not defined)
+	"""
 
-			if sys.version_info[0] == 2:
-				mag_cut_bright	= float(raw_input(bcolors.WARNING  + 'Limit for the bright stars: ' + bcolors.ENDC))
-				mag_cut_faint	= float(raw_input(bcolors.WARNING  + 'Limit for the faint stars: '  + bcolors.ENDC))
-			elif sys.version_info[0] == 3:
-				mag_cut_bright	= float(input(bcolors.WARNING  + 'Limit for the bright stars: ' + bcolors.ENDC))
-				mag_cut_faint	= float(input(bcolors.WARNING  + 'Limit for the faint stars: '  + bcolors.ENDC))
-			else:
-				print(bcolors.FAIL + bcolors.BOLD + 'Programme requires either Python 2 or 3.' + bcolors.ENDC)
-				sys.exit()
+	if MAG_BRIGHT			== None or MAG_FAINT == None:
+		return np.ones(len(MAG_INS), dtype=bool)
 
-			# Cleaning of the catalog
+	return (MAG_BRIGHT <= MAG_INS) & (MAG_INS <= MAG_FAINT)
 
-			CAT_CLEANED		= table.vstack([x for x in CAT if mag_cut_bright <= x['MAG_INS'] <= mag_cut_faint])
+def local_sequence_offset(CAT, MASK):
 
-			print(bcolors.OKGREEN + '\nNumber of stars: ' + str(len(CAT_CLEANED)) + '\n' + bcolors.ENDC)
+	"""
+	Offset between the apparent and instrumental magnitudes of the stars in MASK (least-squares fit of
+	MAG_CAT = offset + MAG_INS): mean of MAG_CAT - MAG_INS, weighted with 1 / MAGERR_CAT**2 if all errors are non-zero
+	"""
 
+	diff					= np.asarray(CAT['MAG_CAT'], dtype=float)[MASK] - np.asarray(CAT['MAG_INS'], dtype=float)[MASK]
+	err						= np.asarray(CAT['MAGERR_CAT'], dtype=float)[MASK]
 
-			data_x			= CAT_CLEANED['MAG_INS']
-			data_y			= CAT_CLEANED['MAG_CAT']
-			data_y_err		= CAT_CLEANED['MAGERR_CAT']
+	if len(diff)			== 0:
+		return np.nan
 
+	if np.all(err			!= 0):
+		return np.sum(diff / err**2) / np.sum(1. / err**2)
+	else:
+		return np.mean(diff)
 
-			if all(CAT_CLEANED['MAGERR_CAT']) != 0:
+def local_sequence_plot(CAT, MASK, OFFSET, MAG_BRIGHT, MAG_FAINT, FITS='', PATH='', SHOW=False, ZOOM=False):
 
-				pinit		= 0
-				fitfunc 	= lambda p, x: p + x
-				errfunc 	= lambda p, x, y, err: (y - fitfunc(p, x)) / err
-				out			= optimize.leastsq(errfunc, pinit,args=(data_x, data_y, data_y_err), full_output=True)
+	"""
+	Diagnostic plot of the local sequence: instrumental vs. apparent magnitude, with the stars in MASK in black
+	ZOOM: axis range of the stars in MASK
+	"""
 
-			else:
+	if not PLOTS:
+		return None
 
-				pinit		= 0
-				fitfunc 	= lambda p, x: p + x
-				errfunc 	= lambda p, x, y: (y - fitfunc(p, x))
-				out			= optimize.leastsq(errfunc, pinit,args=(data_x, data_y), full_output=True)
+	plot_imports()
 
-			pfinal			= out[0]
-			cont_direct		= pfinal[0]
+	plt.figure(3 if ZOOM else 2, figsize=(9*np.sqrt(2.),9))
 
-			plt.figure(3, figsize=(9*np.sqrt(2.),9))
+	mag_range				= np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2])
 
-			loc_ax			= plt.subplot(111)
-			loc_ax.plot(np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), cont_direct + np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), lw=20, color=vigit_color_12, alpha=0.5, zorder=0)
-			loc_ax.plot(np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), cont_direct + np.array([min(CAT['MAG_INS'])-0.2, max(CAT['MAG_INS'])+0.2]), lw=2, color=vigit_color_12, zorder=1)
+	loc_ax					= plt.subplot(111)
+	loc_ax.plot(mag_range, OFFSET + mag_range, lw=20, color=vigit_color_12, alpha=0.25, zorder=0)
+	loc_ax.plot(mag_range, OFFSET + mag_range, lw=2, color=vigit_color_12, zorder=1)
 
-			loc_ax.errorbar(CAT['MAG_INS'], CAT['MAG_CAT'], CAT['MAGERR_CAT'], CAT['MAGERR_INS'], lw=0, ms=10, marker='o', color='0.75', elinewidth=2, capsize=0, zorder=2)
-			loc_ax.errorbar(CAT_CLEANED['MAG_INS'], CAT_CLEANED['MAG_CAT'], CAT_CLEANED['MAGERR_CAT'], CAT_CLEANED['MAGERR_INS'], lw=0, ms=10, marker='o', color='k', elinewidth=2, capsize=0, zorder=3)
+	loc_ax.errorbar(CAT['MAG_INS'], CAT['MAG_CAT'], CAT['MAGERR_CAT'], CAT['MAGERR_INS'], lw=0, ms=10, marker='o', color='0.75', elinewidth=2, capsize=0, zorder=2)
+	loc_ax.errorbar(CAT['MAG_INS'][MASK], CAT['MAG_CAT'][MASK], CAT['MAGERR_CAT'][MASK], CAT['MAGERR_INS'][MASK], lw=0, ms=10, marker='o', color='k', elinewidth=2, capsize=0, zorder=3)
 
-			loc_ax.axvline(mag_cut_bright, color='k', ls='--', zorder=4)
-			loc_ax.axvline(mag_cut_faint,  color='k', ls='--', zorder=4)
+	if MAG_BRIGHT			!= None:
+		loc_ax.axvline(MAG_BRIGHT, color='k', ls='--', zorder=4)
+		loc_ax.axvline(MAG_FAINT,  color='k', ls='--', zorder=4)
 
-			loc_ax.set_xlabel("Instrumental magnitude (mag)")
-			loc_ax.set_ylabel("Apparent magnitude (mag)")
+	loc_ax.set_xlabel("Instrumental magnitude (mag)")
+	loc_ax.set_ylabel("Apparent magnitude (mag)")
 
-			if len(CAT['MAG_CAT']) > 1:
-				loc_ax.set_xlim(min(CAT_CLEANED['MAG_INS'])-0.2, max(CAT_CLEANED['MAG_INS'])+0.2)
-				loc_ax.set_ylim(min(CAT_CLEANED['MAG_CAT'])-0.2, max(CAT_CLEANED['MAG_CAT'])+0.2)
-			else:
-				loc_ax.set_xlim(CAT_CLEANED['MAG_INS']-0.2, CAT_CLEANED['MAG_INS']+0.2)
-				loc_ax.set_ylim(CAT_CLEANED['MAG_CAT']-0.2, CAT_CLEANED['MAG_CAT']+0.2)
+	limits					= CAT[MASK] if (ZOOM and np.sum(MASK) > 0) else CAT
 
-			loc_ax.set_xlabel("Instrumental magnitude (mag)")
-			loc_ax.set_ylabel("Apparent magnitude (mag)")
-			loc_ax.grid(True)
+	loc_ax.set_xlim(min(limits['MAG_INS'])-0.2, max(limits['MAG_INS'])+0.2)
+	loc_ax.set_ylim(min(limits['MAG_CAT'])-0.2, max(limits['MAG_CAT'])+0.2)
 
-			plt.savefig(PATH+FITS.replace('.fits', '_std.pdf'), dpi=600)
+	loc_ax.grid(True)
+	plt.savefig(PATH+FITS.replace('.fits', '_std.pdf'), dpi=600)
 
-			plt.show()
-			plt.close()
+	if SHOW:
+		plt.show()
 
-			ascii.write(np.array([CAT_CLEANED['XWIN_IMAGE'], CAT_CLEANED['YWIN_IMAGE'],
-				CAT_CLEANED['ALPHAWIN_J2000'], CAT_CLEANED['DELTAWIN_J2000'],
-				CAT_CLEANED['MAG_CAT'], CAT_CLEANED['MAGERR_CAT']]).T,
-				FILENAME,
-				names=['XWIN_IMAGE', 'YWIN_IMAGE', 'ALPHAWIN_J2000', 'DELTAWIN_J2000', 'MAG', 'MAG_ERR'], overwrite=True)
+	plt.close()
 
+def local_sequence_write(CAT, MASK, FILENAME):
 
-			if sys.version_info[0] == 2:
-				flag_loop	= raw_input(bcolors.BOLD + bcolors.WARNING + 'Would you like to change the cuts? [y|[n]] ' + bcolors.ENDC)
-			elif sys.version_info[0] == 3:
-				flag_loop 	= input(bcolors.BOLD + bcolors.WARNING + 'Would you like to change the cuts? [y|[n]] ' + bcolors.ENDC)
-			else:
-				print(bcolors.FAIL + bcolors.BOLD + 'Programme requires either Python 2 or 3.' + bcolors.ENDC)
-				sys.exit()
+	"""
+	Write the stars in MASK to the local sequence file FILENAME
+	"""
 
-		if 'auto_mag_bright' in locals():
-			LOGGER.info('Magnitude range: {magbright:.2f} - {magfaint:.2f}'.format(magbright=auto_mag_bright, magfaint=auto_mag_faint))
-		else:
-			if 'mag_cut_bright' in locals():
-				LOGGER.info('Magnitude range: {magbright:.2f} - {magfaint:.2f}'.format(magbright=mag_cut_bright, magfaint=mag_cut_faint))
-			else:
-				LOGGER.info('Magnitude range: {magbright:.2f} - {magfaint:.2f}'.format(magbright=min(CAT['MAG_INS']), magfaint=max(CAT['MAG_INS'])))
+	ascii.write(np.array([CAT['XWIN_IMAGE'][MASK], CAT['YWIN_IMAGE'][MASK],
+		CAT['ALPHAWIN_J2000'][MASK], CAT['DELTAWIN_J2000'][MASK],
+		CAT['MAG_CAT'][MASK], CAT['MAGERR_CAT'][MASK]]).T,
+		FILENAME,
+		names=['XWIN_IMAGE', 'YWIN_IMAGE', 'ALPHAWIN_J2000', 'DELTAWIN_J2000', 'MAG', 'MAG_ERR'], overwrite=True)
 
-		if len(CAT) 		== 0:
-			print(bcolors.FAIL + 'There is no star in the cleaned catalog. Check your input parameters.' + bcolors.ENDC)
-			sys.exit()
+def make_poststamp(FITS, COORD_EXP, COORD_OBS, PATH=''):
 
-	if 'CAT_CLEANED' in locals():
-		if len(CAT_CLEANED) == 0:
-			return {'NUMSTARS': len(matched_catalog_cleaned), 'CAT': matched_catalog_cleaned}
-		else:
-			return {'NUMSTARS': len(CAT_CLEANED), 'CAT': CAT_CLEANED}
-	else:
-		return {'NUMSTARS': len(CAT), 'CAT': CAT}
+	"""
+	Post stamps of the expected and observed position (check image and science image)
+	"""
 
-def make_poststamp(FITS, COORD_EXP, COORD_OBS, PATH=''):
+	if not PLOTS:
+		return None
 
+	plot_imports()
 
 	# Open images with apertures
 
@@ -1384,7 +2081,11 @@ def sextractor_photometry(
 					PARAMS 			=  "DEFAULT",
 					PATH			= None,
 					PHOT_APERTURES	= None, 
-					REF_FILE		= ""):
+					REF_FILE		= "",
+					CHECKIMAGE		= None):
+
+	filename		= os.path.basename(FITS)
+	CHECKIMAGE		= "check_"+FITS if CHECKIMAGE == None else CHECKIMAGE
 
 	sew				= sewpy.SEW(loglevel=LOGLEVEL,
 								config={"ANALYSIS_THRESH": 	ANALYSIS_THRESH,
@@ -1392,7 +2093,7 @@ def sextractor_photometry(
 										"ASSOC_RADIUS": 	ASSOC_RADIUS,
 										"BACK_SIZE":		BACK_SIZE,
 										"BACK_FILTERSIZE":	BACK_FILTERSIZE,
-										'CHECKIMAGE_NAME': 	"check_"+FITS,
+										'CHECKIMAGE_NAME': 	CHECKIMAGE,
 										'CHECKIMAGE_TYPE': 	"APERTURES",
 										"DEBLEND_NTHRESH": 	DEBLEND_NTHRESH,
 										"DEBLEND_MINCONT": 	DEBLEND_MINCONT,
@@ -1446,11 +2147,11 @@ def sextractor_photometry(
 
 	print('\nPath of the temporary files: %s\n' %output_path)
 
-	for file in glob.glob(output_path+'/'+FITS[0]+'*cat*'):
-		os.system(" mv %s %s" %(file, PATH + FITS.split(".fits")[0]+"_"+FLAG+".phot"))
+	for file in glob.glob(output_path+'/'+filename[0]+'*cat*'):
+		os.system(" mv %s %s" %(file, PATH + filename.split(".fits")[0]+"_"+FLAG+".phot"))
 
-	for file in glob.glob(output_path+'/'+FITS[0]+'*log*'):
-		os.system(" mv %s %s" %(file, PATH + FITS.split(".fits")[0]+"_"+FLAG+".log"))
+	for file in glob.glob(output_path+'/'+filename[0]+'*log*'):
+		os.system(" mv %s %s" %(file, PATH + filename.split(".fits")[0]+"_"+FLAG+".log"))
 
 	os.system("rm -r %s" %output_path)
 
@@ -1482,9 +2183,19 @@ def sextractor_postprocess(DATA, PRINTHELP=True):
 
 	return DATA
 
-def zeropoint(TABLE_REF, TABLE_NEW, FITS='', LOGGER=None, NITER=30000, PATH='', TOLERANCE=1):
+def zeropoint(TABLE_REF, TABLE_NEW, FITS='', LOGGER=None, NITER=30000, PATH='', TOLERANCE=1, NITER_TOLERANCE=None, NITER_BLOCK=100, SEED=None, WORKERS=1):
+
+	"""
+	Zeropoints of all magnitude keys from the stars in common with the reference catalogue (one bootstrap of all keys, see stat_tools.statNclip_joint)
+	NITER_TOLERANCE: adaptive bootstrap: blocks of NITER_BLOCK resamplings until the percentiles of the ZP distributions of all keys
+	change by less than NITER_TOLERANCE (mag) after 3 successive blocks, i.e. at least 4 x NITER_BLOCK and at most NITER resamplings
+	SEED, WORKERS: random number seed and number of processes of the bootstrap (see stat_tools.statNclip)
+	"""
 
-	print(bcolors.OKGREEN + 'Bootstrap ZP from ' + str(NITER) + ' resamplings\n' + bcolors.ENDC)
+	if NITER_TOLERANCE		!= None:
+		print(bcolors.OKGREEN + 'Bootstrap ZP from up to ' + str(NITER) + ' resamplings (until the percentiles change by less than ' + str(NITER_TOLERANCE) + ' mag)\n' + bcolors.ENDC)
+	else:
+		print(bcolors.OKGREEN + 'Bootstrap ZP from ' + str(NITER) + ' resamplings\n' + bcolors.ENDC)
 
 	for key in TABLE_REF.keys():
 		if key not in ['RA', 'DEC', 'MAG_CAT', 'MAGERR_CAT']:
@@ -1522,21 +2233,10 @@ def zeropoint(TABLE_REF, TABLE_NEW, FITS='', LOGGER=None, NITER=30000, PATH='',
 	result					= table.Table(names=('METHOD', 'ZP', 'ZP_ERRP', 'ZP_ERRM', 'NUMBER'), dtype=('S100', 'f', 'f', 'f', 'g'))
 	result['NUMBER'].format = '7g'
 
-	# Setup up ZP diagnostic plot
-
-	fig						= plt.figure(5, figsize=(np.sqrt(2) * 9,9))
-	fig.subplots_adjust(hspace=0.2, wspace=0.3)
-
-	ax						= fig.add_subplot(111)
-	ax.spines['top'].set_color('none')
-	ax.spines['bottom'].set_color('none')
-	ax.spines['left'].set_color('none')
-	ax.spines['right'].set_color('none')
-	ax.tick_params(labelcolor='w', top='off', bottom='off', left='off', right='off')
-
-	i						= 0
+	# Individual ZP measurements of all magnitude keys
 
-	# Compute zeropoint
+	temp_zps				= []
+	masks_negative			= []
 
 	for key in keys_mag:
 
@@ -1561,20 +2261,72 @@ def zeropoint(TABLE_REF, TABLE_NEW, FITS='', LOGGER=None, NITER=30000, PATH='',
 		LOGGER.info(np.array(['{:.3f}'.format(j) for j in temp_zp[:,0]]))
 		LOGGER.info(np.array(['{:.3f}'.format(j) for j in temp_zp[:,1]]))
 
+		temp_zps.append(temp_zp)
+		masks_negative.append(mask_negative)
+
+	# Compute zeropoints of all keys at once (stars without a positive ZP are NaN)
+
+	temp_zp_all				= np.full((len(keys_mag), len(merged), 2), np.nan)
+
+	for j in range(len(keys_mag)):
+		temp_zp_all[j, masks_negative[j]]	= temp_zps[j]
+
+	if np.sum([len(x) for x in temp_zps])	> 0:
+
+		temp_zp_anas, niter	= stat_tools.statNclip_joint(temp_zp_all, NITER=NITER, TOLERANCE=NITER_TOLERANCE, BLOCK=NITER_BLOCK, SEED=SEED, WORKERS=WORKERS)
+
+		print('Bootstrap: {niter} resamplings\n'.format(niter=niter))
+		LOGGER.info('Bootstrap: {niter} resamplings'.format(niter=niter))
+
+	i						= 0
+
+	for key, temp_zp, mask_negative in zip(keys_mag, temp_zps, masks_negative):
 
 		if len(temp_zp) 	> 0:
-			temp_zp_ana		= np.array(stat_tools.statNclip(temp_zp, NITER=NITER))
+			temp_zp_ana		= temp_zp_anas[i]
 			result.add_row(np.hstack([key, temp_zp_ana]))
-
 		else:
 			result.add_row(np.hstack([key, np.zeros(4)]))
 
-		# Add to plot
+		i					+= 1
+
+	# Diagnostic plots
+
+	if PLOTS:
+		zeropoint_plot(merged, keys_mag, temp_zps, masks_negative, temp_zp_anas if np.sum([len(x) for x in temp_zps]) > 0 else None, FITS=FITS, PATH=PATH)
+
+	return result
+
+def zeropoint_plot(MERGED, KEYS_MAG, ZPS, MASKS_NEGATIVE, ZP_ANAS, FITS='', PATH=''):
+
+	"""
+	Diagnostic plots of zeropoint: ZP measurements of all magnitude keys and FWHM distribution
+	"""
+
+	plot_imports()
 
-		zp_plot				= fig.add_subplot(len(keys_mag)/3 if len(keys_mag)%3 == 0 else len(keys_mag)/3 + 1, 3, i+1)
+	# ZP diagnostic plot
+
+	fig						= plt.figure(5, figsize=(np.sqrt(2) * 9,9))
+	fig.subplots_adjust(hspace=0.2, wspace=0.3)
+
+	ax						= fig.add_subplot(111)
+	ax.spines['top'].set_color('none')
+	ax.spines['bottom'].set_color('none')
+	ax.spines['left'].set_color('none')
+	ax.spines['right'].set_color('none')
+	ax.tick_params(labelcolor='w', top='off', bottom='off', left='off', right='off')
+
+	i						= 0
+
+	for key, temp_zp, mask_negative in zip(KEYS_MAG, ZPS, MASKS_NEGATIVE):
+
+		zp_plot				= fig.add_subplot(len(KEYS_MAG)/3 if len(KEYS_MAG)%3 == 0 else len(KEYS_MAG)/3 + 1, 3, i+1)
 
 		if len(temp_zp) 	> 0:
 
+			temp_zp_ana		= ZP_ANAS[i]
+
 			zp_50ile		= np.percentile(temp_zp[:,0], 50)
 			zp_25ile		= np.percentile(temp_zp[:,0], 25)
 			zp_75ile		= np.percentile(temp_zp[:,0], 75)
@@ -1590,12 +2342,12 @@ def zeropoint(TABLE_REF, TABLE_NEW, FITS='', LOGGER=None, NITER=30000, PATH='',
 			zp_plot.axhline(zp_25ile - 1.5*(zp_75ile-zp_25ile), lw=2, color=vigit_color_12, ls=':')
 
 			if len(mask_bad) > 0:
-				zp_plot.errorbar(merged['MAG_CAT'][mask_negative][mask_bad],  temp_zp[:, 0][mask_bad],  temp_zp[:, 1][mask_bad],  marker='o', ms=9, color='0.75', elinewidth=2, capsize=0, lw=0)
+				zp_plot.errorbar(MERGED['MAG_CAT'][mask_negative][mask_bad],  temp_zp[:, 0][mask_bad],  temp_zp[:, 1][mask_bad],  marker='o', ms=9, color='0.75', elinewidth=2, capsize=0, lw=0)
 
 			if len(mask_good) > 0:
-				zp_plot.errorbar(merged['MAG_CAT'][mask_negative][mask_good], temp_zp[:, 0][mask_good], temp_zp[:, 1][mask_good], marker='o', ms=9, color='k', elinewidth=2, capsize=0, lw=0)
+				zp_plot.errorbar(MERGED['MAG_CAT'][mask_negative][mask_good], temp_zp[:, 0][mask_good], temp_zp[:, 1][mask_good], marker='o', ms=9, color='k', elinewidth=2, capsize=0, lw=0)
 
-			zp_plot.set_xlim(min(merged['MAG_CAT'][mask_negative]) - 0.5, max(merged['MAG_CAT'][mask_negative]) + 0.5)
+			zp_plot.set_xlim(min(MERGED['MAG_CAT'][mask_negative]) - 0.5, max(MERGED['MAG_CAT'][mask_negative]) + 0.5)
 
 			majorLocator	= plt.MultipleLocator(1)
 			zp_plot.xaxis.set_major_locator(majorLocator)
@@ -1618,21 +2370,21 @@ def zeropoint(TABLE_REF, TABLE_NEW, FITS='', LOGGER=None, NITER=30000, PATH='',
 	plt.figure(6, figsize=(np.sqrt(2) * 9,9))
 	fwhm_plot				= plt.subplot(111)
 
-	if all(merged['FWHM_IMAGE'] == 0):
+	if all(MERGED['FWHM_IMAGE'] == 0):
 
-		fwhm_plot.hist(merged['FLUX_RADIUS']*2/1.1, range=(0,20), density=1, color=vigit_color_1)
-		fwhm_plot.hist(merged['FLUX_RADIUS']*2/1.1, range=(0,20), density=1, color='k', bins=10000, cumulative=True, histtype='step', lw=4)
-		fwhm_plot.axvline(np.percentile(merged['FLUX_RADIUS']*2/1.1, 50), lw=4, color='k')
-		fwhm_plot.axvline(np.percentile(merged['FLUX_RADIUS']*2/1.1, 50-34), lw=2, ls=':', color='k')
-		fwhm_plot.axvline(np.percentile(merged['FLUX_RADIUS']*2/1.1, 50+34), lw=2, ls=':', color='k')
+		fwhm_plot.hist(MERGED['FLUX_RADIUS']*2/1.1, range=(0,20), density=1, color=vigit_color_1)
+		fwhm_plot.hist(MERGED['FLUX_RADIUS']*2/1.1, range=(0,20), density=1, color='k', bins=10000, cumulative=True, histtype='step', lw=4)
+		fwhm_plot.axvline(np.percentile(MERGED['FLUX_RADIUS']*2/1.1, 50), lw=4, color='k')
+		fwhm_plot.axvline(np.percentile(MERGED['FLUX_RADIUS']*2/1.1, 50-34), lw=2, ls=':', color='k')
+		fwhm_plot.axvline(np.percentile(MERGED['FLUX_RADIUS']*2/1.1, 50+34), lw=2, ls=':', color='k')
 
 	else:
 
-		fwhm_plot.hist(merged['FWHM_IMAGE'], range=(0,30), density=1, color=vigit_color_1)
-		fwhm_plot.hist(merged['FWHM_IMAGE'], range=(0,30), density=1, color='k', bins=10000, cumulative=True, histtype='step', lw=4)
-		fwhm_plot.axvline(np.percentile(merged['FWHM_IMAGE'], 50), lw=4, color='k')
-		fwhm_plot.axvline(np.percentile(merged['FWHM_IMAGE'], 50-34), lw=2, ls=':', color='k')
-		fwhm_plot.axvline(np.percentile(merged['FWHM_IMAGE'], 50+34), lw=2, ls=':', color='k')
+		fwhm_plot.hist(MERGED['FWHM_IMAGE'], range=(0,30), density=1, color=vigit_color_1)
+		fwhm_plot.hist(MERGED['FWHM_IMAGE'], range=(0,30), density=1, color='k', bins=10000, cumulative=True, histtype='step', lw=4)
+		fwhm_plot.axvline(np.percentile(MERGED['FWHM_IMAGE'], 50), lw=4, color='k')
+		fwhm_plot.axvline(np.percentile(MERGED['FWHM_IMAGE'], 50-34), lw=2, ls=':', color='k')
+		fwhm_plot.axvline(np.percentile(MERGED['FWHM_IMAGE'], 50+34), lw=2, ls=':', color='k')
 
 	fwhm_plot.set_xlim(0,30)
 	fwhm_plot.set_ylim(0,1.1)
@@ -1641,4 +2393,4 @@ def zeropoint(TABLE_REF, TABLE_NEW, FITS='', LOGGER=None, NITER=30000, PATH='',
 
 	plt.savefig(PATH+FITS.replace('.fits', '_fwhm.pdf'), dpi=600)
 
-	return result
\ No newline at end of file
+	return None
\ No newline at end of file
@@ -10,11 +10,9 @@ from 	astropy import units as u
 import	cat_tools
 import	fits_tools
 import	logging
-from 	matplotlib import pylab as plt
 import	numpy as np
 import	os
 import	phot_routines
-from	plotsettings import *
 import	sys
 
 # Get input arguments
@@ -100,6 +98,10 @@ parser.add_argument('--deblend-mincont',type	= float,
 										help	= 'Minimum contrast parameter for deblending (default: 0.00001)',
 										default	= 0.00001)
 
+parser.add_argument('--tile-size',		type	= int,
+										help	= 'Forced photometry on the memory-mapped image in tiles of <size> x <size> pixels (default: None, whole image)',
+										default	= None)
+
 parser.add_argument('--noflags',		action	= 'store_true',
 										help	= 'Do not use the sextractor keyword \'FLAGS\' to filter objects (default: False)',
 										default	= False)
@@ -122,6 +124,18 @@ parser.add_argument('--maxstars', 		type	= int,
 										help	= 'Maximum number of stars used for building the local sequence (default: 200)',
 										default	= 200)
 
+parser.add_argument('--loc-bright',		type	= float,
+										help	= 'Bright limit of the local sequence in instrumental magnitude (with --loc-faint; replaces the cuts on the terminal) (default: None)',
+										default	= None)
+
+parser.add_argument('--loc-faint',		type	= float,
+										help	= 'Faint limit of the local sequence in instrumental magnitude (with --loc-bright) (default: None)',
+										default	= None)
+
+parser.add_argument('--loc-cuts',		type	= str,
+										help	= 'Data file with the magnitude range of the local sequence of every telescope and filter in automatic mode (default: local_sequence_cuts.dat)',
+										default	= phot_routines.LOCAL_SEQUENCE_CUTS)
+
 # Other options
 
 parser.add_argument('--auto',			action	= 'store_true',
@@ -136,6 +150,10 @@ parser.add_argument('--keeptemp',		action	= 'store_true',
 										help	= 'Keep temporary files',
 										default	= False)
 
+parser.add_argument('--no-plots',		action	= 'store_true',
+										help	= 'Numeric-only mode: no diagnostic plots (matplotlib and LaTeX are not used); tables and logs are unchanged (default: False)',
+										default	= False)
+
 parser.add_argument('--loglevel',		type	= str,
 										help	= 'Logger level (default: INFO, possible values: DEBUG, INFO, WARNING, ERROR, CRITICAL)',
 										default	= 'INFO')
@@ -152,6 +170,18 @@ parser.add_argument('--tol',			type	= float,
 										help	= 'Tolerance of the cross-matching in arcsec (default: 1)',
 										default	= 1)
 
+parser.add_argument('--zp-tolerance',	type	= float,
+										help	= 'Adaptive bootstrap of the zeropoints: stop when the percentiles change by less than <tolerance> mag in 3 successive blocks of 100 resamplings (at least 400, at most 1000 resamplings) (default: None, 1000 resamplings)',
+										default	= None)
+
+parser.add_argument('--seed',			type	= int,
+										help	= 'Seed of the random numbers of the zeropoint bootstrap (reproducible results for any --mc-workers) (default: None, random)',
+										default	= None)
+
+parser.add_argument('--mc-workers',		type	= int,
+										help	= 'Number of processes of the zeropoint bootstrap (default: 1)',
+										default	= 1)
+
 
 ########
 
@@ -160,6 +190,14 @@ args								= parser.parse_args()
 args.mag_stdfaint					= float(args.mag_stdfaint)
 args.mag_stdbright					= float(args.mag_stdbright)
 
+# Diagnostic plots (the numeric-only mode does not import matplotlib, see phot_routines.PLOTS)
+
+phot_routines.PLOTS					= not args.no_plots
+
+if phot_routines.PLOTS:
+	phot_routines.plot_imports()
+	plt								= phot_routines.plt
+
 # Set up text output
 
 if args.bw 							== True:
@@ -519,7 +557,10 @@ if args.mag_stdbright == 0 and args.mag_stdfaint == 0:
 																		LOGGER			= logger,
 																		LOWER			= 5,
 																		PATH			= args.outdir,
-																		UPPER			= 90)
+																		UPPER			= 90,
+																		MAG_BRIGHT		= args.loc_bright,
+																		MAG_FAINT		= args.loc_faint,
+																		CUTS			= args.loc_cuts)
 #																		BW				= args.bw)
 
 	matched_standard				= local_sequence['CAT']
@@ -624,7 +665,8 @@ else:
 																		LOGGER	= logger,
 																		LOWER	= 0,
 																		PATH	= args.outdir,
-																		UPPER	= 100)
+																		UPPER	= 100,
+																		CUTS	= args.loc_cuts)
 #																		BW		= args.bw)
 
 	matched_standard				= local_sequence['CAT']
@@ -692,7 +734,10 @@ summary_zeropoint					= phot_routines.zeropoint(matched_standard, phot_stars,
 																		FITS			= args.fits,
 																		LOGGER			= logger,
 																		PATH			= args.outdir,
-																		TOLERANCE		= args.tol)
+																		TOLERANCE		= args.tol,
+																		NITER_TOLERANCE	= args.zp_tolerance,
+																		SEED			= args.seed,
+																		WORKERS			= args.mc_workers)
 summary_zeropoint['r(FWHM)']		= np.nan
 
 msg									= 'Step 4: Aperture photometry'
@@ -764,24 +809,36 @@ if len(phot_science)				== 0:
 	print(bcolors.FAIL + bcolors.BOLD + msg + bcolors.ENDC)
 	logger.info(msg)
 
-	# Open FITS file
+	# Open FITS file (memory-mapped)
 
-	hdu								= fits.open(args.fits)
+	hdu								= fits.open(args.fits, memmap=True)
 	hdu_data						= hdu[0].data
 	hdu_header						= hdu[0].header
 
 	# Do forced photometry for all apertures
 	# Instrumental magnitudes
 
-	forced_phot						= phot_routines.aperture_photometry(hdu_data,
-																		[object_properties['X_EXP'][0], object_properties['Y_EXP'][0]],
-																		apertures,
-																		1.2 * apertures,
-																		2.0 * apertures,
-																		1,
-																		GAIN		= 10,
-																		ZEROPOINT	= np.array(summary_zeropoint['ZP'][2:]),
-																		FA			= 1)
+	if args.tile_size				!= None:
+		forced_phot					= phot_routines.tiled_photometry(hdu_data,
+																			[object_properties['X_EXP'][0], object_properties['Y_EXP'][0]],
+																			apertures,
+																			1.2 * apertures,
+																			2.0 * apertures,
+																			1,
+																			GAIN		= 10,
+																			ZEROPOINT	= np.array(summary_zeropoint['ZP'][2:]),
+																			FA			= 1,
+																			TILESIZE	= args.tile_size)
+	else:
+		forced_phot					= phot_routines.aperture_photometry(hdu_data,
+																			[object_properties['X_EXP'][0], object_properties['Y_EXP'][0]],
+																			apertures,
+																			1.2 * apertures,
+																			2.0 * apertures,
+																			1,
+																			GAIN		= 10,
+																			ZEROPOINT	= np.array(summary_zeropoint['ZP'][2:]),
+																			FA			= 1)
 
 	# Calibrated magnitudes
 
@@ -925,7 +982,9 @@ else:
 
 # Show plots
 
-if not(args.auto) and not(float(args.mag_stdbright) != 0.) and not(float(args.mag_stdfaint) != 0.):
-	plt.show()
+if phot_routines.PLOTS:
+
+	if not(args.auto) and not(float(args.mag_stdbright) != 0.) and not(float(args.mag_stdfaint) != 0.) and (args.loc_bright == None or args.loc_faint == None):
+		plt.show()
 
-plt.close()
+	plt.close()
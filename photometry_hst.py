@@ -8,7 +8,6 @@ from 	astropy import table, time, wcs
 from	astropy.io import ascii, fits
 import	fits_tools
 import	logging
-from 	matplotlib import pylab as plt
 import	numpy as np
 import	os
 import	phot_routines
@@ -54,6 +53,46 @@ parser.add_argument('--ap-outer-annulus',type=float,
 										help='Diameter of the outer annulus of the background. Default: 3 x ap-diam',
 										default=2.5)
 
+parser.add_argument('--backend',		type=str,
+										help='Aperture photometry backend (photutils: exact pixel overlap; stencil: cached exact pixel overlap; profile: cumulative radial profile). Default: photutils',
+										default='photutils')
+
+parser.add_argument('--tile-size',		type=int,
+										help='Process the memory-mapped image in tiles of <size> x <size> pixels (for large mosaics). Default: None (whole image)',
+										default=None)
+
+parser.add_argument('--cog-points',		type=int,
+										help='Number of diameters of the curve of growth (measured in one pass; with --backend profile from one cumulative radial profile). Default: 20',
+										default=20)
+
+parser.add_argument('--back-size',		type=int,
+										help='Mesh-based background estimation with meshes of <size> x <size> pixels (much faster than the source mask of the whole image). Default: None (source mask)',
+										default=None)
+
+parser.add_argument('--back-filtersize',type=int,
+										help='Median filter of the background meshes: <size> x <size> meshes (with --back-size). Default: 3',
+										default=3)
+
+parser.add_argument('--cache-dir',		type=str,
+										help='Directory of the on-disk cache of the background statistics (reruns on the same image skip the background estimation). Default: None (no cache)',
+										default=None)
+
+parser.add_argument('--noise',			type=str,
+										help='Background noise model (background: RMS of the image (background estimation); err/wht: per-pixel noise from the ERR or WHT (inverse variance, IVM weight type only) extension, skips the background estimation; auto: ERR or IVM-type WHT if present, otherwise background). Default: background',
+										default='background')
+
+parser.add_argument('--float32',		action='store_true',
+										help='Single-precision background and aperture sums (float64-accumulated; halves the memory traffic for large mosaics). Default: False',
+										default=False)
+
+parser.add_argument('--seed',			type=int,
+										help='Seed of the random numbers of the curve-of-growth Monte Carlo (reproducible results for any --mc-workers). Default: None (random)',
+										default=None)
+
+parser.add_argument('--mc-workers',		type=int,
+										help='Number of processes of the curve-of-growth Monte Carlo. Default: 1',
+										default=1)
+
 # Other options
 
 parser.add_argument('--auto',			action='store_true',
@@ -72,6 +111,10 @@ parser.add_argument('--keeptemp',		action	= 'store_true',
 										help	= 'Keep temporary files',
 										default	= False)
 
+parser.add_argument('--no-plots',		action	= 'store_true',
+										help	= 'Numeric-only mode: no diagnostic plots (matplotlib is not used); tables and logs are unchanged',
+										default	= False)
+
 parser.add_argument('--loglevel',		type	= str,
 										help	= 'Logger level (default: INFO, possible values: DEBUG, INFO, WARNING, ERROR, CRITICAL)',
 										default	= 'INFO')
@@ -90,325 +133,400 @@ parser.add_argument('--tol',			type=float,
 
 ########
 
-# Input parameters
+def photometry_hst(args):
 
-args								= parser.parse_args()
+	"""
+	Aperture photometry of one object on one HST image (args: parsed command-line arguments, see parser)
+	Output: zeropoint table, science table
+	"""
 
-# Set up logger
+	# Per-target files are written to the output directory
 
-logger 								= logging.getLogger()
-logger.setLevel(args.loglevel)
+	if args.outdir[-1] 					!= '/':
+		args.outdir						+= '/'
 
-formatter 							= logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-fh 									= logging.FileHandler(args.fits.replace(args.fits.split('.')[-1], 'log'), mode='w')
-fh.setLevel(args.loglevel)
-fh.setFormatter(formatter)
-logger.addHandler(fh)
+	if not os.path.exists(args.outdir):
+		os.makedirs(args.outdir)
 
-# Initialise text output
+	prefix								= args.outdir + os.path.basename(args.fits).split('.fits')[0]
+	checkimage							= args.outdir + 'check_' + os.path.basename(args.fits)
 
-if args.bw 							== "True":
-	class bcolors:
-	    HEADER 						= ''
-	    OKBLUE 						= ''
-	    OKGREEN 					= ''
-	    WARNING 					= ''
-	    FAIL 						= ''
-	    ENDC 						= ''
-	    BOLD 						= ''
-	    UNDERLINE 					= ''
-else:
-	from misc import bcolors
+	# Diagnostic plots (the numeric-only mode does not import matplotlib, see phot_routines.PLOTS)
 
-# Create output directory
+	phot_routines.PLOTS					= not args.no_plots
 
-msg									= 'Step 1: Administration'
-print(bcolors.HEADER + bcolors.BOLD +'\n{}\n'.format(msg) + bcolors.ENDC)
-logger.info(msg)
+	# Set up logger
 
-if args.outdir[-1] 					!= '/':
-	args.outdir						+= '/'
+	logger 								= logging.getLogger()
+	logger.setLevel(args.loglevel)
 
-if not os.path.exists(args.outdir):
-	os.makedirs(args.outdir)
+	formatter 							= logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+	fh 									= logging.FileHandler(prefix + '.log', mode='w')
+	fh.setLevel(args.loglevel)
+	fh.setFormatter(formatter)
+	logger.addHandler(fh)
 
-logger.info('Output directory: %s' %args.outdir)
+	# Initialise text output
 
-# Print command again
+	if args.bw 							== "True":
+		class bcolors:
+		    HEADER 						= ''
+		    OKBLUE 						= ''
+		    OKGREEN 					= ''
+		    WARNING 					= ''
+		    FAIL 						= ''
+		    ENDC 						= ''
+		    BOLD 						= ''
+		    UNDERLINE 					= ''
+	else:
+		from misc import bcolors
 
-print(bcolors.OKGREEN + '\nCommand' + bcolors.ENDC)
+	# Create output directory
 
-cmd 								= 'photometry_hst.py '
+	msg									= 'Step 1: Administration'
+	print(bcolors.HEADER + bcolors.BOLD +'\n{}\n'.format(msg) + bcolors.ENDC)
+	logger.info(msg)
 
-for key in vars(args):
+	logger.info('Output directory: %s' %args.outdir)
 
-	if key in ['auto', 'bw', 'centroid']:
-		value						= ''
+	# Print command again
 
-		if vars(args)[key] 			== True:
-			cmd += '--{key} {value} '.format(key=key.replace('_', '-'), value=value)
+	print(bcolors.OKGREEN + '\nCommand' + bcolors.ENDC)
 
-	else:
-		if key == 'dec':
-			dec 					= vars(args)[key] if (not ('-' in vars(args)[key]) and not('+' in vars(args)[key])) else '\"{value}\"'.format(value=vars(args)[key])
-			value 					= dec
+	cmd 								= 'photometry_hst.py '
+
+	for key in vars(args):
+
+		if key in ['auto', 'bw', 'centroid', 'float32', 'no_plots']:
+			value						= ''
 
-		elif key == 'ap_diam':
-			value 					= ' '.join(str(x) for x in vars(args)[key])
+			if vars(args)[key] 			== True:
+				cmd += '--{key} {value} '.format(key=key.replace('_', '-'), value=value)
 
 		else:
-			value 					= vars(args)[key]
+			if key == 'dec':
+				dec 					= vars(args)[key] if (not ('-' in vars(args)[key]) and not('+' in vars(args)[key])) else '\"{value}\"'.format(value=vars(args)[key])
+				value 					= dec
 
-		cmd 						+= '--{key} {value} '.format(key=key.replace('_', '-'), value=value)
+			elif key == 'ap_diam':
+				value 					= ' '.join(str(x) for x in vars(args)[key])
 
-print (cmd)
+			else:
+				value 					= vars(args)[key]
 
-logger.info('Command: %s' %cmd)
+			cmd 						+= '--{key} {value} '.format(key=key.replace('_', '-'), value=value)
 
-# Consistency check
+	print (cmd)
 
-print(bcolors.OKGREEN + "\nIs the object in the image footprint?" + bcolors.ENDC)
+	logger.info('Command: %s' %cmd)
 
-try:
-	x_exp, y_exp					= fits_tools.sky2xy (args.fits, RA=args.ra, DEC=args.dec)
-	x_obs, y_obs					= x_exp, y_exp
-	#print('Coordinates = %s, %s' %(x_exp, y_exp))
-	catalog_cleaned_reg				= args.outdir+ os.path.basename(args.fits).split('.fits')[0]+'_xy.cat'
-	ascii.write(np.array([x_obs, y_obs]).T, catalog_cleaned_reg, format='no_header', overwrite=True)
+	# Convert from HMS to DD system
 
-	print('Yes.')
-	logger.info('Is the object in the image footprint: Passed')
+	ra_dd, dec_dd						= fits_tools.convert_hms_dd(args.ra, args.dec)
 
-except:
-	msg								= 'Object (RA, DEC = {ra}, {dec}) is not in the image footprint. Check object coordinates and FITS file.'.format(
-										ra=args.ra, dec=args.dec
-										)
-	print(bcolors.FAIL + msg + bcolors.ENDC)
-	logger.error(msg)
-	sys.exit()
+	# Multi-extension exposures (e.g. ACS/WFC and WFC3/UVIS flc files) are processed on the chip that contains the object
 
-# Convert from HMS to DD system
+	hdu									= fits_tools.FitsImage(args.fits)
+	chips								= hdu.sci_extensions()
+	hdu.close()
 
-ra_dd, dec_dd						= fits_tools.convert_hms_dd(args.ra, args.dec)
+	# Consistency check
 
-# Generate a source catalogue with sextractor
+	print(bcolors.OKGREEN + "\nIs the object in the image footprint?" + bcolors.ENDC)
 
-msg									= 'Step 2: Generate source catalogue'
-print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
-logger.info(msg)
+	try:
+		if len(chips)					> 1:
+			chip, positions				= phot_routines.hst_chip_targets(args.fits, ra_dd, dec_dd)[1][0][:2]
+			x_exp, y_exp				= positions[0]
 
-sources								= phot_routines.sextractor_photometry(
-																		ANALYSIS_THRESH	= args.ana_thresh,
-																		DETECT_THRESH	= args.det_thresh,
-																		FITS 			= args.fits, 
-																		FLAG			= 'centroid',
-																		GAIN			= 'CCDGAIN',
-																		PATH			= args.outdir,
-																		PHOT_APERTURES	= 1.0,
-																		LOGGER=logger
-																		)
+			msg							= 'Multi-extension exposure: object on chip {extname},{extver}'.format(extname=chip[0], extver=chip[1])
+			print(msg)
+			logger.info(msg)
 
-# Processing header
+		else:
+			chip						= None
+			x_exp, y_exp				= fits_tools.sky2xy (args.fits, RA=args.ra, DEC=args.dec)
 
-hdulist								= fits.open(args.fits)
-hdu_header							= hdulist[0].header
+		x_obs, y_obs					= x_exp, y_exp
+		#print('Coordinates = %s, %s' %(x_exp, y_exp))
+		catalog_cleaned_reg				= prefix + '_xy.cat'
+		ascii.write(np.array([x_obs, y_obs]).T, catalog_cleaned_reg, format='no_header', overwrite=True)
+
+		print('Yes.')
+		logger.info('Is the object in the image footprint: Passed')
 
-if len(hdulist) 					> 1:
-	try: 
-		hdulist[1].shape
-		hdu_header					+= hdulist[1].header
-		hdu_image					= hdulist[1].data
 	except:
-		hdu_header					+= hdulist[1].header
-		hdu_image					= hdulist[0].data
-else:
-	hdu_image						= hdulist[0].data
+		msg								= 'Object (RA, DEC = {ra}, {dec}) is not in the image footprint. Check object coordinates and FITS file.'.format(
+											ra=args.ra, dec=args.dec
+											)
+		print(bcolors.FAIL + msg + bcolors.ENDC)
+		logger.error(msg)
+		sys.exit()
+
+	# Generate a source catalogue with sextractor
 
-pix2arcsec							= fits_tools.pix2arcsec(args.fits)
+	msg									= 'Step 2: Generate source catalogue'
+	print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
+	logger.info(msg)
 
-# Pick the science source
+	sources								= phot_routines.sextractor_photometry(
+																			ANALYSIS_THRESH	= args.ana_thresh,
+																			DETECT_THRESH	= args.det_thresh,
+																			FITS 			= args.fits, 
+																			FLAG			= 'centroid',
+																			GAIN			= 'CCDGAIN',
+																			PATH			= args.outdir,
+																			PHOT_APERTURES	= 1.0,
+																			CHECKIMAGE		= checkimage,
+																			LOGGER=logger
+																			)
 
-sources['DISTANCE']					= np.sqrt( (sources['XWIN_IMAGE'] - x_exp)**2 + (sources['YWIN_IMAGE'] - y_exp)**2 )
-sources['DISTANCE']					*= pix2arcsec
-sources['DISTANCE'].unit			= 'arcsec'
-sources['DISTANCE'].format			= '.2f'
+	# Processing header
 
-if len(sources) 					== 0:
+	# The image (chip) is opened once (memory-mapped) and shared by the HST routines
 
-	msg								= 'No objects detected in the image. Change sextractor thresholds'
-	print(bcolors.FAIL + '\n{}\n'.format(msg) + bcolors.ENDC)
-	logger.error(msg)
+	hdu									= fits_tools.FitsImage(args.fits, EXTENSION=chip)
+	hdu_header							= hdu.header
 
-	sys.exit()
+	pix2arcsec							= hdu.pix2arcsec
 
-# If centroiding is chosen
+	# Pick the science source
 
-if args.centroid:
+	sources['DISTANCE']					= np.sqrt( (sources['XWIN_IMAGE'] - x_exp)**2 + (sources['YWIN_IMAGE'] - y_exp)**2 )
+	sources['DISTANCE']					*= pix2arcsec
+	sources['DISTANCE'].unit			= 'arcsec'
+	sources['DISTANCE'].format			= '.2f'
 
-	sources2						= sources[sources['DISTANCE'] <= args.tol]
+	if len(sources) 					== 0:
 
-	if len(sources2) 				== 0:
-		msg							= 'No object detected {tol}\" from the source position. Change sextractor thresholds'.format(tol=args.tol)
+		msg								= 'No objects detected in the image. Change sextractor thresholds'
 		print(bcolors.FAIL + '\n{}\n'.format(msg) + bcolors.ENDC)
 		logger.error(msg)
+
 		sys.exit()
 
-	else:
-		sources2.sort('DISTANCE')
-		x_obs, y_obs				= sources2['XWIN_IMAGE'][0], sources2['YWIN_IMAGE'][0]
-		
-		# Update object catalogue
-		
-		catalog_cleaned_reg			= args.outdir+ args.fits.split('.fits')[0]+'_xy.cat'
-		ascii.write(np.array([x_obs, y_obs]).T, catalog_cleaned_reg, format='no_header', overwrite=True)
+	# If centroiding is chosen
 
-# Do photometry
+	if args.centroid and chip			!= None:
+		msg								= 'Centroiding is not available for multi-extension exposures (the sextractor positions are not assigned to a chip). Using the object position.'
+		print(bcolors.WARNING + msg + bcolors.ENDC)
+		logger.warning(msg)
 
-msg									= 'Step 3: Background estimation (can take some time...)'
-print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
-logger.info(msg)
+		args.centroid					= False
 
-image_rms							= phot_routines.background(hdu_image, SIGMA=5, SNR=5, NPIXEL=5, DILATE_SIZE=11)
+	if args.centroid:
 
-msg									= 'Step 4: Perform aperture photometry'
-print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
-logger.info(msg)
+		sources2						= sources[sources['DISTANCE'] <= args.tol]
 
-apertures							= np.array(args.ap_diam)
-innerannulus						= args.ap_inner_annulus * apertures
-outerannulus						= args.ap_outer_annulus * apertures
+		if len(sources2) 				== 0:
+			msg							= 'No object detected {tol}\" from the source position. Change sextractor thresholds'.format(tol=args.tol)
+			print(bcolors.FAIL + '\n{}\n'.format(msg) + bcolors.ENDC)
+			logger.error(msg)
+			sys.exit()
 
-if args.ap_inner_annulus 			< 1:
-	print(bcolors.WARNING + 'The sky annulus intersects with the source region. Check the \'ap_inner_annulus\' keyword' + bcolors.ENDC)
+		else:
+			sources2.sort('DISTANCE')
+			x_obs, y_obs				= sources2['XWIN_IMAGE'][0], sources2['YWIN_IMAGE'][0]
 
-photometry							= phot_routines.hst_aperture_photometry(args.fits, np.array([x_obs, y_obs]), apertures / 2., innerannulus / 2., outerannulus / 2., pix2arcsec, image_rms)
-ascii.write(photometry, args.outdir + args.fits.replace('fits', 'mag'), overwrite=True)
+			# Update object catalogue
 
-# Curve of growth
+			catalog_cleaned_reg			= prefix + '_xy.cat'
+			ascii.write(np.array([x_obs, y_obs]).T, catalog_cleaned_reg, format='no_header', overwrite=True)
 
-msg									= 'Step 5: Curve of growth analysis'
-print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
-logger.info(msg)
+	# Do photometry
 
-phot_routines.hst_cog(args.fits, np.array([x_obs, y_obs]), args.ap_inner_annulus, args.ap_outer_annulus, pix2arcsec, image_rms, args.outdir)
+	# Per-pixel noise from the ERR/WHT extension (no background estimation needed)
 
-# Make cutouts
+	noise, noise_map					= phot_routines.hst_noise_extension(hdu, args.noise) if args.noise != 'background' else (None, None)
 
-msg									= 'Step 6: Make cutout'
-print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
-logger.info(msg)
+	if noise							!= None:
 
-phot_routines.hst_make_cutout(args.fits, [x_obs, y_obs], [x_exp, y_exp], apertures / 2., innerannulus / 2., outerannulus / 2., pix2arcsec, args.outdir)
+		msg								= 'Step 3: Background noise from the {extension} extension'.format(extension=noise.upper())
+		print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
+		logger.info(msg)
 
-# Prepare output catalogue
+		image_rms						= None
 
-msg									= 'Step 7: Prepare output catalogue'
-print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
-logger.info(msg)
+	else:
 
-# Zeropoint table
+		if args.noise					in ['err', 'wht']:
+			msg							= 'No {extension} extension found. Estimating the background noise from the image.'.format(extension=args.noise.upper())
+			print(bcolors.WARNING + msg + bcolors.ENDC)
+			logger.warning(msg)
 
-zeropoint							= table.Table()
-zeropoint['METHOD']					= ['MAG_APER_'+str(x) for x in range(len(apertures))]
-zeropoint['ZP']						= ['{zp:.3f}'.format(zp=photometry['ZP_APER_' +  str(i)][0]) for i in range(len(apertures))]
-zeropoint['ZP_ERRP']				= -99
-zeropoint['ZP_ERRM']				= -99
-zeropoint['NUMBER']					= -99
-zeropoint['r(FWHM)']				= -99
-zeropoint['d(px)']					= apertures / pix2arcsec
-zeropoint['d(arcsec)']				= apertures
-zeropoint['MAG_3UL_GLOB']			= [-2.5*np.log10(3*photometry['BKG_NOISE_' + str(i)][0]) + photometry['ZP_APER_' +  str(i)][0] for i in range(len(apertures))]
+		msg								= 'Step 3: Background estimation (can take some time...)'
+		print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
+		logger.info(msg)
 
-for key in ['d(px)', 'd(arcsec)']:
-	zeropoint[key].format			= '.3f'
+		image_rms						= phot_routines.background(hdu, SIGMA=5, SNR=5, NPIXEL=5, DILATE_SIZE=11, FLOAT32=args.float32,
+																	BACK_SIZE=args.back_size, BACK_FILTERSIZE=args.back_filtersize, CACHE_DIR=args.cache_dir)
 
-zeropoint['MAG_3UL_GLOB'].format	= '.3f'
+	msg									= 'Step 4: Perform aperture photometry'
+	print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
+	logger.info(msg)
 
-# Science table
+	apertures							= np.array(args.ap_diam)
+	innerannulus						= args.ap_inner_annulus * apertures
+	outerannulus						= args.ap_outer_annulus * apertures
 
-science								= table.Table(names=('PROPERTY', 'VALUE', 'ERROR+', 'ERROR-', 'COMMENT'), dtype=('S100', 'f', 'f', 'f', 'S100'))
-science.add_row(['FILENAME', np.nan, np.nan, np.nan, args.fits])
+	if args.ap_inner_annulus 			< 1:
+		print(bcolors.WARNING + 'The sky annulus intersects with the source region. Check the \'ap_inner_annulus\' keyword' + bcolors.ENDC)
 
-for key in ['DATE-OBS', 'MJD', 'EXPTIME', 'NCOMBINE']:
-	try:
-		if key == 'DATE-OBS':
-			science.add_row([key, np.nan, np.nan, np.nan, time.Time(hdu_header['DATE-OBS'], format='isot', scale='utc').isot])
-		elif key == 'EXPTIME':
-			science.add_row([key, np.nan, np.nan, np.nan, np.round(hdu_header[key], 2)])
-		else:
-			science.add_row([key, np.nan, np.nan, np.nan, hdu_header[key]])
+	if chip								!= None:
+		photometry						= phot_routines.hst_chip_photometry(args.fits, ra_dd, dec_dd, apertures / 2., innerannulus / 2., outerannulus / 2., RMS=image_rms, BACKEND=args.backend, NOISE=noise, FLOAT32=args.float32, WORKERS=1)
+		photometry						= photometry[(photometry['EXTNAME'] == chip[0]) & (photometry['EXTVER'] == chip[1])]
+	else:
+		photometry						= phot_routines.hst_aperture_photometry(hdu, np.array([x_obs, y_obs]), apertures / 2., innerannulus / 2., outerannulus / 2., pix2arcsec, image_rms, BACKEND=args.backend, TILESIZE=args.tile_size, FLOAT32=args.float32, NOISE=noise)
 
-	except:
-		if key == 'NCOMBINE':
-			science.add_row([key, np.nan, np.nan, np.nan, 1])
-		elif key == 'MJD':
-			science.add_row([key, np.nan, np.nan, np.nan, np.round(time.Time(hdu_header['DATE-OBS'], format='isot', scale='utc').mjd, 7)])
-		else:
-			science.add_row([key, np.nan, np.nan, np.nan, '...'])
+	ascii.write(photometry, prefix + '.mag', overwrite=True)
 
-science.add_row(['RA', ra_dd, np.nan, np.nan, 'degree'])
-science.add_row(['DEC', dec_dd, np.nan, np.nan, 'degree'])
+	# Curve of growth
 
-science.add_row(['X_IMAGE_EXP', x_exp, np.nan, np.nan, 'px'])
-science.add_row(['Y_IMAGE_EXP', y_exp, np.nan, np.nan, 'px'])
+	msg									= 'Step 5: Curve of growth analysis'
+	print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
+	logger.info(msg)
 
-if args.centroid and len(sources2) > 0:
+	phot_routines.hst_cog(hdu, np.array([x_obs, y_obs]), args.ap_inner_annulus, args.ap_outer_annulus, pix2arcsec, image_rms, args.outdir, BACKEND=args.backend, TILESIZE=args.tile_size, FLOAT32=args.float32, NPOINTS=args.cog_points, NOISE=noise, SEED=args.seed, WORKERS=args.mc_workers)
 
-	science.add_row(['X_IMAGE_OBS', np.round(x_obs, 3), np.nan, np.nan, 'px'])
-	science.add_row(['Y_IMAGE_OBS', np.round(y_obs, 3), np.nan, np.nan, 'px'])
+	# Make cutouts
 
-	science.add_row(['DISTANCE (px)', 	  np.round(sources2['DISTANCE'][0]/pix2arcsec, 3), 	np.nan, np.nan, 'px'])
-	science.add_row(['DISTANCE (arcsec)', np.round(sources2['DISTANCE'][0], 3), 			np.nan, np.nan, 'arcsec'])
+	msg									= 'Step 6: Make cutout'
+	print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
+	logger.info(msg)
 
-else:
+	phot_routines.hst_make_cutout(hdu, [x_obs, y_obs], [x_exp, y_exp], apertures / 2., innerannulus / 2., outerannulus / 2., pix2arcsec, args.outdir)
 
-	science.add_row(['X_IMAGE_OBS', np.round(x_exp, 3), np.nan, np.nan, 'px'])
-	science.add_row(['Y_IMAGE_OBS', np.round(y_exp, 3), np.nan, np.nan, 'px'])
+	# Prepare output catalogue
 
-	science.add_row(['DISTANCE (px)', 	  0, np.nan, np.nan, 'px'])
-	science.add_row(['DISTANCE (arcsec)', 0, np.nan, np.nan, 'arcsec'])
+	msg									= 'Step 7: Prepare output catalogue'
+	print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
+	logger.info(msg)
 
-for i in range(len(apertures)):
-	science.add_row(['FNU_APER_' + str(i), '{:.3e}'.format(float(photometry['FNU_APER_' + str(i)])), '{:.3e}'.format(float(photometry['FNUERR_APER_' + str(i)])), '{:.3e}'.format(float(photometry['FNUERR_APER_' + str(i)])), 'microJy'])
-	if photometry['FNU_APER_' + str(i)] > 0:
-		science.add_row(['MAG_APER_' + str(i), np.round(photometry['MAG_APER_' + str(i)], 3), np.round(photometry['MAGERRP_APER_' + str(i)], 3), np.round(photometry['MAGERRM_APER_' + str(i)], 3), 'mag'])
-	elif photometry['FNU_APER_' + str(i)] <= 0:
-		science.add_row(['MAG_APER_' + str(i), np.round(-2.5 * np.log10(3*photometry['FNUERR_APER_' + str(i)]) + 23.9, 3), np.nan, np.nan, 'mag'])
-	science.add_row(['MAG_APER_' + str(i) + '_2sigma', np.round(-2.5 * np.log10(2*photometry['FNUERR_APER_' + str(i)]) + 23.9, 3), np.nan, np.nan, 'mag'])
-	science.add_row(['MAG_APER_' + str(i) + '_3sigma', np.round(-2.5 * np.log10(3*photometry['FNUERR_APER_' + str(i)]) + 23.9, 3), np.nan, np.nan, 'mag'])
+	# Zeropoint table
 
-# Save to file
+	zeropoint							= table.Table()
+	zeropoint['METHOD']					= ['MAG_APER_'+str(x) for x in range(len(apertures))]
+	zeropoint['ZP']						= ['{zp:.3f}'.format(zp=photometry['ZP_APER_' +  str(i)][0]) for i in range(len(apertures))]
+	zeropoint['ZP_ERRP']				= -99
+	zeropoint['ZP_ERRM']				= -99
+	zeropoint['NUMBER']					= -99
+	zeropoint['r(FWHM)']				= -99
+	zeropoint['d(px)']					= apertures / pix2arcsec
+	zeropoint['d(arcsec)']				= apertures
+	zeropoint['MAG_3UL_GLOB']			= [-2.5*np.log10(3*photometry['BKG_NOISE_' + str(i)][0]) + photometry['ZP_APER_' +  str(i)][0] for i in range(len(apertures))]
 
-print(bcolors.OKGREEN + "\nZeropoint\n" + bcolors.ENDC)
-print(zeropoint)
+	for key in ['d(px)', 'd(arcsec)']:
+		zeropoint[key].format			= '.3f'
 
-print(bcolors.OKGREEN + "\nScience \n" + bcolors.ENDC)
-science.pprint(max_lines=-1)
-print('\n')
+	zeropoint['MAG_3UL_GLOB'].format	= '.3f'
 
-msg									= 'Step 9: Write results to file'
-print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
-logger.info(msg)
+	# Science table
 
-ascii.write(zeropoint,		args.outdir + args.fits.replace('.fits', '_zp.log'),	overwrite=True)
-ascii.write(science,		args.outdir + args.fits.replace('.fits', '_phot.log'),	overwrite=True)
+	science								= table.Table(names=('PROPERTY', 'VALUE', 'ERROR+', 'ERROR-', 'COMMENT'), dtype=('S100', 'f', 'f', 'f', 'S100'))
+	science.add_row(['FILENAME', np.nan, np.nan, np.nan, args.fits])
 
-# Remove temporary files
+	if chip								!= None:
+		science.add_row(['EXTENSION', np.nan, np.nan, np.nan, '{extname},{extver}'.format(extname=chip[0], extver=chip[1])])
 
-if not args.keeptemp:
-	msg 						= 'Step 10: Remove all temps'
-	print(bcolors.HEADER + bcolors.BOLD + "\n{}\n".format(msg) + bcolors.ENDC)
-	logger.info(msg)
-	os.system('rm check_' + args.fits)
-	os.system('rm ' + args.outdir + args.fits.replace('.fits', '_xy.cat'))
-	os.system('rm ' + args.outdir + args.fits.replace('.fits', '_centroid.log'))
-else:
-	msg 							= 'Step 10: Keep all temps'
-	print(bcolors.HEADER + bcolors.BOLD + "\n{}\n".format(msg) + bcolors.ENDC)
+	for key in ['DATE-OBS', 'MJD', 'EXPTIME', 'NCOMBINE']:
+		try:
+			if key == 'DATE-OBS':
+				science.add_row([key, np.nan, np.nan, np.nan, time.Time(hdu_header['DATE-OBS'], format='isot', scale='utc').isot])
+			elif key == 'EXPTIME':
+				science.add_row([key, np.nan, np.nan, np.nan, np.round(hdu_header[key], 2)])
+			else:
+				science.add_row([key, np.nan, np.nan, np.nan, hdu_header[key]])
+
+		except:
+			if key == 'NCOMBINE':
+				science.add_row([key, np.nan, np.nan, np.nan, 1])
+			elif key == 'MJD':
+				science.add_row([key, np.nan, np.nan, np.nan, np.round(time.Time(hdu_header['DATE-OBS'], format='isot', scale='utc').mjd, 7)])
+			else:
+				science.add_row([key, np.nan, np.nan, np.nan, '...'])
+
+	science.add_row(['RA', ra_dd, np.nan, np.nan, 'degree'])
+	science.add_row(['DEC', dec_dd, np.nan, np.nan, 'degree'])
+
+	science.add_row(['X_IMAGE_EXP', x_exp, np.nan, np.nan, 'px'])
+	science.add_row(['Y_IMAGE_EXP', y_exp, np.nan, np.nan, 'px'])
+
+	if args.centroid and len(sources2) > 0:
+
+		science.add_row(['X_IMAGE_OBS', np.round(x_obs, 3), np.nan, np.nan, 'px'])
+		science.add_row(['Y_IMAGE_OBS', np.round(y_obs, 3), np.nan, np.nan, 'px'])
+
+		science.add_row(['DISTANCE (px)', 	  np.round(sources2['DISTANCE'][0]/pix2arcsec, 3), 	np.nan, np.nan, 'px'])
+		science.add_row(['DISTANCE (arcsec)', np.round(sources2['DISTANCE'][0], 3), 			np.nan, np.nan, 'arcsec'])
+
+	else:
+
+		science.add_row(['X_IMAGE_OBS', np.round(x_exp, 3), np.nan, np.nan, 'px'])
+		science.add_row(['Y_IMAGE_OBS', np.round(y_exp, 3), np.nan, np.nan, 'px'])
+
+		science.add_row(['DISTANCE (px)', 	  0, np.nan, np.nan, 'px'])
+		science.add_row(['DISTANCE (arcsec)', 0, np.nan, np.nan, 'arcsec'])
+
+	for i in range(len(apertures)):
+		science.add_row(['FNU_APER_' + str(i), '{:.3e}'.format(float(photometry['FNU_APER_' + str(i)])), '{:.3e}'.format(float(photometry['FNUERR_APER_' + str(i)])), '{:.3e}'.format(float(photometry['FNUERR_APER_' + str(i)])), 'microJy'])
+		if photometry['FNU_APER_' + str(i)] > 0:
+			science.add_row(['MAG_APER_' + str(i), np.round(photometry['MAG_APER_' + str(i)], 3), np.round(photometry['MAGERRP_APER_' + str(i)], 3), np.round(photometry['MAGERRM_APER_' + str(i)], 3), 'mag'])
+		elif photometry['FNU_APER_' + str(i)] <= 0:
+			science.add_row(['MAG_APER_' + str(i), np.round(-2.5 * np.log10(3*photometry['FNUERR_APER_' + str(i)]) + 23.9, 3), np.nan, np.nan, 'mag'])
+		science.add_row(['MAG_APER_' + str(i) + '_2sigma', np.round(-2.5 * np.log10(2*photometry['FNUERR_APER_' + str(i)]) + 23.9, 3), np.nan, np.nan, 'mag'])
+		science.add_row(['MAG_APER_' + str(i) + '_3sigma', np.round(-2.5 * np.log10(3*photometry['FNUERR_APER_' + str(i)]) + 23.9, 3), np.nan, np.nan, 'mag'])
+
+	# Save to file
+
+	print(bcolors.OKGREEN + "\nZeropoint\n" + bcolors.ENDC)
+	print(zeropoint)
+
+	print(bcolors.OKGREEN + "\nScience \n" + bcolors.ENDC)
+	science.pprint(max_lines=-1)
+	print('\n')
+
+	msg									= 'Step 9: Write results to file'
+	print(bcolors.HEADER + bcolors.BOLD + '\n{}\n'.format(msg) + bcolors.ENDC)
 	logger.info(msg)
 
-# Show plots
+	ascii.write(zeropoint,		prefix + '_zp.log',		overwrite=True)
+	ascii.write(science,		prefix + '_phot.log',	overwrite=True)
+
+	# Remove temporary files
+
+	if not args.keeptemp:
+		msg 						= 'Step 10: Remove all temps'
+		print(bcolors.HEADER + bcolors.BOLD + "\n{}\n".format(msg) + bcolors.ENDC)
+		logger.info(msg)
+		for filename in [checkimage, prefix + '_xy.cat', prefix + '_centroid.log']:
+			if os.path.exists(filename):
+				os.remove(filename)
+	else:
+		msg 							= 'Step 10: Keep all temps'
+		print(bcolors.HEADER + bcolors.BOLD + "\n{}\n".format(msg) + bcolors.ENDC)
+		logger.info(msg)
+
+	# Show plots
+
+	if phot_routines.PLOTS:
+
+		phot_routines.plot_imports()
+
+		if args.auto:
+			phot_routines.plt.show()
+		phot_routines.plt.close('all')
+
+	hdu.close()
+
+	logger.removeHandler(fh)
+	fh.close()
+
+	return zeropoint, science
+
+if __name__ == '__main__':
+
+	# Input parameters
+
+	args							= parser.parse_args()
 
-if args.auto:
-	plt.show()
-plt.close()
+	photometry_hst(args)
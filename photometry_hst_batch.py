@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import	argparse
+from	astropy import table
+from	astropy.io import ascii
+import	collections
+import	logging
+from	misc import bcolors
+import	multiprocessing
+import	os
+import	photometry_hst
+import	sys
+
+# Get input arguments
+# All options that are not listed here are passed to photometry_hst.py (same for all targets), e.g. --backend profile --cache-dir cache/
+
+parser								= argparse.ArgumentParser(description='Batch mode of photometry_hst.py: aperture photometry of many targets on many HST images. Options that are not listed here are passed to photometry_hst.py.')
+
+parser.add_argument('--manifest',		type=str,
+										help='ASCII table with the columns FITS, RA, DEC and optionally AP_DIAM (comma-separated diameters in arcsec) and NAME (name of the output directory of the target). Required keyword.',
+										required=True)
+
+parser.add_argument('--outdir',			type=str,
+										help='Output path. The results of every target are written to <outdir>/<NAME>/. Default: \'results/\'',
+										default='results/')
+
+parser.add_argument('--workers',		type=int,
+										help='Number of worker processes. Default: 1',
+										default=1)
+
+def photometry_hst_target(TASK):
+
+	"""
+	Photometry of one target of the manifest (in a worker process)
+	Output: index, zeropoint table and science table of the target (None if the target failed)
+	"""
+
+	index, args							= TASK
+
+	try:
+		zeropoint, science				= photometry_hst.photometry_hst(args)
+	except SystemExit:
+		zeropoint, science				= None, None
+	except Exception as e:
+		print(bcolors.FAIL + 'Target {name} failed: {error}'.format(name=args.outdir, error=e) + bcolors.ENDC)
+		zeropoint, science				= None, None
+
+	# Close the log file of the target (also if it failed)
+
+	logger								= logging.getLogger()
+
+	for handler in logger.handlers[:]:
+		logger.removeHandler(handler)
+		handler.close()
+
+	return index, zeropoint, science
+
+if __name__ == '__main__':
+
+	args, args_phot						= parser.parse_known_args()
+
+	if args.outdir[-1] 					!= '/':
+		args.outdir						+= '/'
+
+	if not os.path.exists(args.outdir):
+		os.makedirs(args.outdir)
+
+	# Read the manifest (coordinates and diameters as strings)
+
+	manifest							= ascii.read(args.manifest, converters={key: [ascii.convert_numpy(str)] for key in ['FITS', 'RA', 'DEC', 'AP_DIAM', 'NAME']})
+
+	for key in ['FITS', 'RA', 'DEC']:
+		if key not in manifest.colnames:
+			msg							= 'Column {key} not found in {manifest}'.format(key=key, manifest=args.manifest)
+			print(bcolors.FAIL + msg + bcolors.ENDC)
+			sys.exit()
+
+	# Output directories (NAME or the name of the image; the row number is appended if an image occurs several times)
+
+	if 'NAME' in manifest.colnames:
+		names							= [str(x) for x in manifest['NAME']]
+	else:
+		names							= [os.path.basename(x).replace('.fits', '') for x in manifest['FITS']]
+
+	counts								= collections.Counter(names)
+	names								= [names[i] if counts[names[i]] == 1 else '{name}_{index}'.format(name=names[i], index=i) for i in range(len(names))]
+
+	# Arguments of photometry_hst.py for every target (parsed here, so that invalid options stop the batch before it starts)
+
+	tasks								= []
+
+	for i in range(len(manifest)):
+
+		argv							= ['--fits', manifest['FITS'][i], '--ra=' + manifest['RA'][i], '--dec=' + manifest['DEC'][i], '--outdir', args.outdir + names[i] + '/']
+
+		if 'AP_DIAM' in manifest.colnames:
+			argv						+= ['--ap-diam'] + manifest['AP_DIAM'][i].split(',')
+
+		tasks.append((i, photometry_hst.parser.parse_args(argv + args_phot)))
+
+	# Photometry
+	# Every worker imports the photometry routines once. Zeropoints, aperture corrections (see phot_routines.APCORR_CACHE_DIR
+	# and phot_routines.APCORR_TABLE) and backgrounds (--cache-dir) are cached on disk and shared by all workers.
+
+	if args.workers						> 1:
+
+		pool							= multiprocessing.Pool(args.workers)
+
+		try:
+			output						= list(pool.imap_unordered(photometry_hst_target, tasks))
+		finally:
+			pool.close()
+			pool.join()
+
+	else:
+		output							= [photometry_hst_target(task) for task in tasks]
+
+	output.sort(key=lambda x: x[0])
+
+	# Combined zeropoint and science tables
+
+	zeropoints							= []
+	sciences							= []
+
+	for index, zeropoint, science in output:
+
+		if zeropoint is None:
+			print(bcolors.FAIL + 'Target {name} ({fits}) failed'.format(name=names[index], fits=manifest['FITS'][index]) + bcolors.ENDC)
+			continue
+
+		zeropoint.add_column(table.Column([names[index]] * len(zeropoint), name='NAME'), index=0)
+		science.add_column(table.Column([names[index]] * len(science), name='NAME'), index=0)
+
+		zeropoints.append(zeropoint)
+		sciences.append(science)
+
+	if len(zeropoints)					== 0:
+		print(bcolors.FAIL + 'All targets failed' + bcolors.ENDC)
+		sys.exit()
+
+	ascii.write(table.vstack(zeropoints),	args.outdir + 'batch_zp.log',	overwrite=True)
+	ascii.write(table.vstack(sciences),		args.outdir + 'batch_phot.log',	overwrite=True)
+
+	print(bcolors.OKGREEN + '\n{num} of {total} targets done. Summary: {outdir}batch_zp.log, {outdir}batch_phot.log\n'.format(
+		num=len(zeropoints), total=len(manifest), outdir=args.outdir) + bcolors.ENDC)
@@ -1,40 +1,318 @@
+import	multiprocessing
 import 	numpy as np
+from	scipy import special
+import	warnings
 
-def statNclip(A, NITER=1000):
+# Number of random values per chunk in the Monte Carlo routines (bounds the memory)
+
+MC_CHUNK		= 2**22
+
+# Maximum number of Monte Carlo realisations per random number stream (see mc_blocks)
+
+MC_BLOCK		= 4096
+
+def sigma_clipped_stats_axis(A, AXIS=-1, MAXITERS=5, SIGMA=3):
+
+	"""
+	Sigma-clipped mean, median and standard deviation along one axis of a numpy array.
+	Same definition as astropy.stats.sigma_clipped_stats (centre: median, width: std), but for
+	all rows at once. NaNs are treated as masked values.
+	The values of every row are sorted once (a full sort, not a partition, since every iteration needs the median of
+	a different range): the unclipped values are then always a contiguous range, whose median, mean and standard
+	deviation follow from its end points and from prefix sums (float64).
+	"""
+
+	data			= np.moveaxis(np.asarray(A), AXIS, -1)
+	shape			= data.shape[:-1]
+
+	data			= np.sort(data.reshape(-1, data.shape[-1]), axis=1)
+	rows			= np.arange(len(data))
+
+	# NaNs are sorted to the end of the rows
+
+	lower			= np.zeros(len(data), dtype=int)
+	upper			= np.sum(~np.isnan(data), axis=1)
+
+	# Prefix sums relative to the first value of each row (limits the cancellation in the variance)
+
+	offset			= np.where(upper > 0, data[:, 0], 0).astype(float)
+	values			= np.where(np.isnan(data), 0, data - offset[:, None].astype(data.dtype)).astype(float)
+
+	sum1			= np.zeros((len(data), data.shape[1] + 1))
+	sum2			= np.zeros((len(data), data.shape[1] + 1))
+	sum1[:, 1:]		= np.cumsum(values, axis=1)
+	sum2[:, 1:]		= np.cumsum(values**2, axis=1)
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+
+		i			= 0
+
+		while(True):
+
+			num		= upper - lower
+			index	= np.clip(lower + (num - 1) // 2, 0, data.shape[1] - 1), np.clip(lower + num // 2, 0, data.shape[1] - 1)
+			median	= np.where(num > 0, 0.5 * (data[rows, index[0]].astype(float) + data[rows, index[1]]), np.nan)
+
+			mean	= (sum1[rows, upper] - sum1[rows, lower]) / num
+			std		= np.sqrt(np.maximum((sum2[rows, upper] - sum2[rows, lower]) / num - mean**2, 0))
+			mean	= mean + offset
+
+			if i	>= MAXITERS:
+				break
+
+			# Keep median - SIGMA x std <= x <= median + SIGMA x std
+
+			lower_new	= np.maximum(lower, np.sum(data < (median - SIGMA * std)[:, None], axis=1))
+			upper_new	= np.minimum(upper, np.sum(data <= (median + SIGMA * std)[:, None], axis=1))
+			upper_new	= np.maximum(upper_new, lower_new)
+
+			if np.array_equal(lower_new, lower) and np.array_equal(upper_new, upper):
+				break
+
+			lower, upper	= lower_new, upper_new
+			i		= i+1
+
+	mean			= np.where(upper > lower, mean, np.nan)
+	std				= np.where(upper > lower, std, np.nan)
+
+	return mean.reshape(shape), median.reshape(shape), std.reshape(shape)
+
+def rng_streams(SEED=None, NUM=1):
+
+	"""
+	NUM independent random number generators (numpy.random.Generator) spawned from numpy.random.SeedSequence(SEED)
+	SEED: integer, None (fresh entropy) or numpy.random.SeedSequence (further streams are spawned from it)
+	"""
+
+	seed			= SEED if isinstance(SEED, np.random.SeedSequence) else np.random.SeedSequence(SEED)
+
+	return [np.random.default_rng(x) for x in seed.spawn(NUM)]
+
+def mc_blocks(NITER, NUM, SEED=None):
+
+	"""
+	Split NITER Monte Carlo realisations of NUM random values into blocks of at most MC_BLOCK realisations (and MC_CHUNK
+	random values), each with its own random number stream. The blocks do not depend on the number of workers, so the
+	realisations only depend on SEED.
+	Output: list of (number of realisations, numpy.random.Generator)
+	"""
+
+	block			= max(1, min(MC_BLOCK, MC_CHUNK // max(NUM, 1)))
+	sizes			= [min(block, NITER - start) for start in range(0, NITER, block)]
+
+	return list(zip(sizes, rng_streams(SEED, len(sizes))))
+
+def mc_map(FUNC, TASKS, WORKERS=1):
+
+	"""
+	[FUNC(x) for x in TASKS], with a pool of WORKERS processes if WORKERS > 1 (None: all CPUs)
+	Serial in daemonic processes (e.g. the workers of photometry_hst_batch.py), which cannot start a pool.
+	"""
+
+	if len(TASKS) > 1 and (WORKERS == None or WORKERS > 1) and not multiprocessing.current_process().daemon:
+
+		pool				= multiprocessing.Pool(WORKERS if WORKERS == None else min(WORKERS, len(TASKS)))
+
+		try:
+			output			= pool.map(FUNC, TASKS)
+		finally:
+			pool.close()
+			pool.join()
+
+	else:
+		output				= [FUNC(x) for x in TASKS]
+
+	return output
+
+def split_normal(MODE, SIGMA_M, SIGMA_P, SIZE, RNG=None):
+
+	"""
+	Random draws from split (asymmetric) normal distributions: standard deviation SIGMA_M below and SIGMA_P above MODE.
+	MODE, SIGMA_M, SIGMA_P: one value per distribution (N)
+	RNG: numpy.random.Generator (default: global numpy.random state)
+	Output: N x SIZE array
+	"""
+
+	mode			= np.atleast_1d(MODE)[:, None]
+
+	z				= special.ndtri((np.random if RNG is None else RNG).uniform(size=(len(mode), SIZE)))
+
+	return mode + np.where(z < 0, np.atleast_1d(SIGMA_M)[:, None], np.atleast_1d(SIGMA_P)[:, None]) * z
+
+def statNclip(A, NITER=1000, SEED=None, WORKERS=1):
 
 	"""
 	This function performs statistics on a numpy array A.
 	The array can contain NaN
+	The NITER Monte Carlo (and bootstrap) realisations are drawn as (chunk x N_stars) matrices,
+	in blocks with independent random number streams (see mc_blocks), on WORKERS processes.
+	The output only depends on SEED (see rng_streams), not on WORKERS.
 
 	"""
 
 	# MC and bootstrap from observations
 
-	i = 0
+	mask			= statNclip_mask(A)
+
+	random_array	= statNclip_draws(A, mask, NITER, SEED=SEED, WORKERS=WORKERS)
+
+	zp_med			= np.percentile(random_array,50)
+	zp_inf 			= np.percentile(random_array,50-34.1)
+	zp_sup 			= np.percentile(random_array,50+34.1)
+
+	return np.hstack([zp_med, zp_sup - zp_med, zp_med - zp_inf, len(A[mask,0])])
+
+def statNclip_joint(A, NITER=1000, TOLERANCE=None, BLOCK=100, CONSECUTIVE=3, SEED=None, WORKERS=1):
 
-	random_array	= []
+	"""
+	statNclip of several sets of measurements at once (e.g. the zeropoints of all magnitude columns): IQR clipping per set
+	and one batched Monte Carlo/bootstrap with random draws shared by all sets.
+	A: N_sets x N x 2 (value, error), NaN for missing measurements
+	TOLERANCE: adaptive mode: the realisations are drawn in blocks of BLOCK and the bootstrap stops as soon as the 15.9, 50 and
+	84.1 percentiles of all sets have changed by less than TOLERANCE after CONSECUTIVE successive blocks, i.e. after at least (CONSECUTIVE + 1) x BLOCK and at most NITER realisations.
+	A single block below TOLERANCE is not enough: the percentiles of a few hundred realisations fluctuate by about TOLERANCE.
+	SEED, WORKERS: see statNclip
+	Output: N_sets x 4 (statNclip output of every set), number of realisations
+	"""
+
+	values			= np.array(A, dtype=float)
+	valid			= ~np.isnan(values[:, :, 0])
+
+	# IQR clipping per set (see statNclip_mask)
+
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore', RuntimeWarning)
+		p25, p75	= np.nanpercentile(values[:, :, 0], [25, 75], axis=1)
+
+	iqr				= np.abs(p75 - p25)
+
+	with np.errstate(invalid='ignore'):
+		mask		= valid & (values[:, :, 0] > (p25 - 1.5 * iqr)[:, None]) & (values[:, :, 0] < (p75 + 1.5 * iqr)[:, None])
+
+	# Selected measurements first
+
+	values			= np.take_along_axis(values, np.argsort(~mask, axis=1, kind='stable')[:, :, None], axis=1)
+
+	num				= np.sum(mask, axis=1)
+	bootstrap		= np.sum(valid, axis=1) > 10
+
+	seed			= SEED if isinstance(SEED, np.random.SeedSequence) else np.random.SeedSequence(SEED)
+
+	random_array	= np.zeros((len(values), 0))
+	percentiles		= None
+	converged		= 0
+
+	while random_array.shape[1] < NITER:
+
+		size		= NITER - random_array.shape[1] if TOLERANCE == None else min(BLOCK, NITER - random_array.shape[1])
+
+		random_array	= np.hstack([random_array, statNclip_joint_draws(values, num, bootstrap, size, SEED=seed, WORKERS=WORKERS)])
+
+		if TOLERANCE	== None:
+			break
+
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore', RuntimeWarning)
+			percentiles_new	= np.percentile(random_array, [50-34.1, 50, 50+34.1], axis=1)
+
+		if percentiles is not None:
+			change		= np.abs(percentiles_new - percentiles)
+			converged	= converged + 1 if np.all(change[np.isfinite(change)] < TOLERANCE) else 0
+
+			if converged	>= CONSECUTIVE:
+				break
+
+		percentiles		= percentiles_new
+
+	zp_inf, zp_med, zp_sup	= np.percentile(random_array, [50-34.1, 50, 50+34.1], axis=1)
+
+	return np.array([zp_med, zp_sup - zp_med, zp_med - zp_inf, num]).T, random_array.shape[1]
+
+def statNclip_joint_draws(VALUES, NUM, BOOTSTRAP, NITER, SEED=None, WORKERS=1):
+
+	"""
+	Medians of NITER Monte Carlo realisations of every set of measurements (see statNclip_joint). The first NUM
+	measurements of every set are used. The standard normal and uniform draws are shared by all sets.
+	Output: N_sets x NITER
+	"""
+
+	tasks			= [(VALUES, NUM, BOOTSTRAP, size, rng) for size, rng in mc_blocks(NITER, VALUES.shape[0] * VALUES.shape[1], SEED)]
+
+	return np.hstack([np.zeros((len(VALUES), 0))] + mc_map(statNclip_joint_draws_block, tasks, WORKERS))
+
+def statNclip_joint_draws_block(TASK):
+
+	"""
+	One block of statNclip_joint_draws (in a worker process)
+	"""
+
+	VALUES, NUM, BOOTSTRAP, size, rng	= TASK
+
+	num_sets, num_max	= VALUES.shape[:2]
+
+	columns			= np.arange(num_max)
+
+	mask_unused		= columns[None, None, :] >= NUM[:, None, None]
+
+	lower			= np.maximum((NUM - 1) // 2, 0)[:, None, None]
+	upper			= np.minimum(NUM // 2, max(num_max - 1, 0))[:, None, None]
+
+	z				= rng.standard_normal((size, num_max))
+	u				= rng.random((size, num_max))
+
+	random_MC		= VALUES[:, None, :, 0] + VALUES[:, None, :, 1] * z[None]
+
+	# Bootstrap: resample the Monte Carlo realisations of the NUM measurements of every set
+
+	index			= np.where(BOOTSTRAP[:, None, None], (u[None] * NUM[:, None, None]).astype(int), columns[None, None, :])
+	random_MC		= np.take_along_axis(random_MC, np.minimum(index, num_max - 1), axis=2)
+	random_MC		= np.sort(np.where(mask_unused, np.nan, random_MC), axis=2)
+
+	median			= 0.5 * (np.take_along_axis(random_MC, np.broadcast_to(lower, (num_sets, size, 1)), axis=2) +
+							np.take_along_axis(random_MC, np.broadcast_to(upper, (num_sets, size, 1)), axis=2))[:, :, 0]
+
+	return np.where(NUM[:, None] > 0, median, np.nan)
+
+def statNclip_mask(A):
+
+	"""
+	Measurements of A within 1.5 x IQR of the quartiles (see statNclip)
+	"""
 
 	p25				= np.percentile(A[:,0], 25)
 	p50				= np.percentile(A[:,0], 50)
 	p75				= np.percentile(A[:,0], 75)
 	iqr				= abs(p75 - p25)
 
-	mask			= np.where((A[:,0] > p25 - 1.5 * iqr) & (A[:,0] < p75 + 1.5 * iqr))[0]
+	return np.where((A[:,0] > p25 - 1.5 * iqr) & (A[:,0] < p75 + 1.5 * iqr))[0]
 
-	while(i < NITER):
-		random_MC	= np.random.normal(A[mask,0], A[mask,1])
-		if len(A[:,0]) > 10:
-			random_boot	= np.random.choice(random_MC, len(random_MC))
-			random_array.append(np.median(random_boot))
-		else:
-			random_array.append(np.median(random_MC))
-		i			= i+1
+def statNclip_draws(A, MASK, NITER, SEED=None, WORKERS=1):
 
-	zp_med			= np.percentile(random_array,50)
-	zp_inf 			= np.percentile(random_array,50-34.1)
-	zp_sup 			= np.percentile(random_array,50+34.1)
+	"""
+	Medians of NITER Monte Carlo realisations of the measurements A[MASK] (bootstrapped if A has more than 10 rows),
+	drawn in blocks with independent random number streams (see statNclip)
+	"""
 
-	return np.hstack([zp_med, zp_sup - zp_med, zp_med - zp_inf, len(A[mask,0])])
+	tasks			= [(A[MASK], len(A[:,0]) > 10, size, rng) for size, rng in mc_blocks(NITER, len(MASK), SEED)]
+
+	return np.hstack([np.zeros(0)] + mc_map(statNclip_draws_block, tasks, WORKERS))
+
+def statNclip_draws_block(TASK):
+
+	"""
+	One block of statNclip_draws (in a worker process)
+	"""
+
+	values, bootstrap, size, rng	= TASK
+
+	num				= len(values)
+
+	random_MC		= rng.normal(values[:,0], values[:,1], size=(size, num))
+
+	if bootstrap:
+		random_MC	= np.take_along_axis(random_MC, rng.integers(0, num, size=(size, num)), axis=1)
+
+	return np.median(random_MC, axis=1)
 
 
 # def statNclip(A, NITER=1000):
@@ -0,0 +1,68 @@
+import	os
+import	sys
+
+import	numpy as np
+import	pytest
+from	astropy.io import fits
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import	fits_tools
+
+def drizzled_image(PATH, WHT_TYPE=None):
+
+	"""
+	Drizzled image with SCI and WHT extensions, weight type WHT_TYPE in the header of the WHT extension
+	"""
+
+	sci				= fits.ImageHDU(np.ones((20, 20)), name='SCI')
+	wht				= fits.ImageHDU(np.full((20, 20), 4.), name='WHT')
+
+	if WHT_TYPE		!= None:
+		wht.header['WHTTYPE']	= WHT_TYPE
+
+	filename		= str(PATH / 'test_drz.fits')
+	fits.HDUList([fits.PrimaryHDU(), sci, wht]).writeto(filename)
+
+	return filename
+
+def test_wht_type(tmp_path):
+
+	assert fits_tools.FitsImage(drizzled_image(tmp_path, 'EXP')).wht_type()		== 'EXP'
+
+def test_wht_type_unknown(tmp_path):
+
+	assert fits_tools.FitsImage(drizzled_image(tmp_path)).wht_type()				== None
+
+@pytest.fixture
+def phot_routines():
+
+	for module in ['astroquery', 'sewpy', 'photutils']:
+		pytest.importorskip(module)
+
+	import	phot_routines
+
+	return phot_routines
+
+def test_noise_extension_auto_exp(phot_routines, tmp_path):
+
+	# EXP weights are exposure times, not inverse variances: fall back to the background estimation
+
+	assert phot_routines.hst_noise_extension(drizzled_image(tmp_path, 'EXP'), 'auto')	== (None, None)
+
+def test_noise_extension_wht_exp(phot_routines, tmp_path):
+
+	with pytest.raises(SystemExit):
+		phot_routines.hst_noise_extension(drizzled_image(tmp_path, 'EXP'), 'wht')
+
+def test_noise_extension_auto_ivm(phot_routines, tmp_path):
+
+	noise, noise_map	= phot_routines.hst_noise_extension(drizzled_image(tmp_path, 'IVM'), 'auto')
+
+	assert noise		== 'wht'
+	assert np.all(noise_map == 4.)
+
+def test_noise_model_no_gain(phot_routines):
+
+	with pytest.raises(SystemExit):
+		phot_routines.hst_noise_model(fits.Header({'BUNIT': 'ELECTRONS/S', 'EXPTIME': 100.}), 0.04)